@@ -13,8 +13,8 @@ from tensorflow import Tensor
 from torch.optim.adam import Adam
 from tqdm import tqdm
 
+from baselines.sbert import SentenceEmbeddingStore
 from lib2vec.corpus_iterators import FlairDocumentIterator, FlairFacetIterator
-from sentence_transformers import SentenceTransformer
 
 class FlairConnector:
     def __init__(self, word_embedding_base: str = None, document_embedding: str = None, fine_tune: bool = False,
@@ -41,13 +41,13 @@ class FlairConnector:
             print(document_embedding, pretuned)
             if pretuned:
                 if document_embedding.lower() == 'bert' or document_embedding.lower() == 'bert-de':
-                    self.document_embedding = SentenceTransformer('stsb-bert-large')
+                    self.document_embedding = SentenceEmbeddingStore('stsb-bert-large')
                     # self.document_embedding = SentenceTransformerDocumentEmbeddings('stsb-bert-large')
                 elif document_embedding.lower() == 'roberta':
-                    self.document_embedding = SentenceTransformer('stsb-roberta-large')
+                    self.document_embedding = SentenceEmbeddingStore('stsb-roberta-large')
                     # self.document_embedding = SentenceTransformerDocumentEmbeddings('stsb-roberta-large')
                 elif document_embedding.lower() == 'xlm':
-                    self.document_embedding = SentenceTransformer('stsb-xlm-r-multilingual')
+                    self.document_embedding = SentenceEmbeddingStore('stsb-xlm-r-multilingual')
                     # self.document_embedding = SentenceTransformerDocumentEmbeddings('stsb-xlm-r-multilingual')
             else:
                 if document_embedding.lower() == 'bert':
@@ -128,10 +128,12 @@ class FlairConnector:
                                                        for doc_id, document in doc_bar)
             return {doc_id: doc_vec for (doc_vec, doc_id) in result_tuples}
         else:
-            if isinstance(self.document_embedding, SentenceTransformer):
-                embeddings = self.document_embedding.encode([document for doc_id, document in doc_bar], batch_size=10,
-                                                            show_progress_bar=True)
-                doc_ids = (doc_id for doc_id, document in doc_bar)
+            if isinstance(self.document_embedding, SentenceEmbeddingStore):
+                doc_ids, texts = [], []
+                for doc_id, document in doc_bar:
+                    doc_ids.append(doc_id)
+                    texts.append(document)
+                embeddings = self.document_embedding.encode(texts)
                 return {doc_id: embedding
                         for embedding, doc_id in zip(embeddings, doc_ids)}
             else:
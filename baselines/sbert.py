@@ -1,21 +1,123 @@
+import hashlib
+import logging
+import os
+import time
+from typing import List
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
-# model = SentenceTransformer('stsb-roberta-large')
-model = SentenceTransformer('stsb-xlm-r-multilingual')
-
-# Our sentences we like to encode
-# sentences = ['This framework generates embeddings for each input sentence',
-#              'Sentences are passed as a list of string.',
-#              'The quick brown fox jumps over the lazy dog.']
-sentences = ['Dieses Framework generiert Einbettungen für jeden Eingabesatz',
-             'Sätze werden als Liste von Strings übergeben.',
-             'Der schnelle braune Fuchs springt über den faulen Hund.']
-
-# Sentences are encoded by calling model.encode()
-embeddings = model.encode(sentences)
-
-# Print the embeddings
-for sentence, embedding in zip(sentences, embeddings):
-    print("Sentence:", sentence)
-    print("Embedding:", embedding)
-    print("")
+from lib2vec.corpus_structure import ConfigLoader
+
+config = ConfigLoader.get_config()
+
+
+class SentenceEmbeddingStore:
+    # sentence embeddings of one model as append only float16 shards, every distinct sentence is encoded once
+    shard_prefix = "shard_"
+
+    def __init__(self, model_name: str, store_dir: str = None, batch_size: int = 32):
+        self.model_name = model_name
+        if store_dir is None:
+            store_dir = os.path.join(config["system_storage"].get("sentence_embeddings",
+                                                                  os.path.join(config["system_storage"]["models"],
+                                                                               "sentence_embeddings")),
+                                     model_name.replace('/', '_'))
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+        self.store_dir = store_dir
+        self.batch_size = batch_size
+        self.model = None
+        self.shards = []
+        self.shard_offsets = np.zeros(1, dtype=np.int64)
+        self.index = {}
+        self.load_index()
+
+    @staticmethod
+    def normalize(sentence: str) -> str:
+        return ' '.join(sentence.split())
+
+    @staticmethod
+    def sentence_hash(sentence: str) -> bytes:
+        return hashlib.sha1(SentenceEmbeddingStore.normalize(sentence).encode('utf-8')).digest()
+
+    def load_index(self):
+        # a shard counts once its hash file exists, which is written after its vectors
+        shard_names = sorted(file_name[:-len('.hashes.npy')] for file_name in os.listdir(self.store_dir)
+                             if file_name.startswith(SentenceEmbeddingStore.shard_prefix)
+                             and file_name.endswith('.hashes.npy'))
+        self.shards = []
+        self.index = {}
+        offsets = [0]
+        for shard_name in shard_names:
+            hashes = np.load(os.path.join(self.store_dir, f'{shard_name}.hashes.npy'))
+            self.shards.append(np.load(os.path.join(self.store_dir, f'{shard_name}.npy'), mmap_mode='r'))
+            for row, sentence_hash in enumerate(hashes.tolist()):
+                self.index.setdefault(sentence_hash, offsets[-1] + row)
+            offsets.append(offsets[-1] + len(hashes))
+        self.shard_offsets = np.array(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_model(self):
+        # loaded on the first sentence missing in the store
+        if self.model is None:
+            self.model = SentenceTransformer(self.model_name)
+        return self.model
+
+    def append(self, sentences: List[str], hashes: List[bytes]):
+        embeddings = self.get_model().encode(sentences, batch_size=self.batch_size, show_progress_bar=True)
+        shard_name = f'{SentenceEmbeddingStore.shard_prefix}{time.time_ns()}_{os.getpid()}'
+        for suffix, values in [('', np.asarray(embeddings, dtype=np.float16)),
+                               ('.hashes', np.array(hashes, dtype='S20'))]:
+            tmp_path = os.path.join(self.store_dir, f'{shard_name}{suffix}.tmp.npy')
+            np.save(tmp_path, values)
+            os.replace(tmp_path, os.path.join(self.store_dir, f'{shard_name}{suffix}.npy'))
+        self.load_index()
+
+    def rows(self, sentences: List[str]) -> np.ndarray:
+        # store rows of the sentences, sentences not yet in the store are encoded and appended first
+        hashes = [SentenceEmbeddingStore.sentence_hash(sentence) for sentence in sentences]
+        missing = {}
+        for sentence, sentence_hash in zip(sentences, hashes):
+            if sentence_hash not in self.index and sentence_hash not in missing:
+                missing[sentence_hash] = SentenceEmbeddingStore.normalize(sentence)
+        logging.info(f'{len(sentences) - len(missing)} / {len(sentences)} sentences already in the store')
+        if len(missing) > 0:
+            self.append(list(missing.values()), list(missing.keys()))
+        return np.array([self.index[sentence_hash] for sentence_hash in hashes], dtype=np.int64)
+
+    def gather(self, rows: np.ndarray) -> np.ndarray:
+        dimension = self.shards[0].shape[1] if len(self.shards) > 0 else 0
+        vectors = np.zeros((len(rows), dimension), dtype=np.float32)
+        shard_ids = np.searchsorted(self.shard_offsets, rows, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            selected = np.flatnonzero(shard_ids == shard_id)
+            vectors[selected] = self.shards[shard_id][rows[selected] - self.shard_offsets[shard_id]]
+        return vectors
+
+    def encode(self, sentences: List[str]) -> np.ndarray:
+        return self.gather(self.rows(sentences))
+
+
+if __name__ == '__main__':
+    # store = SentenceEmbeddingStore('stsb-roberta-large')
+    store = SentenceEmbeddingStore('stsb-xlm-r-multilingual')
+
+    # Our sentences we like to encode
+    # sentences = ['This framework generates embeddings for each input sentence',
+    #              'Sentences are passed as a list of string.',
+    #              'The quick brown fox jumps over the lazy dog.']
+    sentences = ['Dieses Framework generiert Einbettungen für jeden Eingabesatz',
+                 'Sätze werden als Liste von Strings übergeben.',
+                 'Der schnelle braune Fuchs springt über den faulen Hund.']
+
+    # Sentences are encoded once, a second run reads them from the store
+    embeddings = store.encode(sentences)
+
+    # Print the embeddings
+    for sentence, embedding in zip(sentences, embeddings):
+        print("Sentence:", sentence)
+        print("Embedding:", embedding)
+        print("")
@@ -13,55 +13,41 @@ from lib2vec.vectorization_utils import Vectorization
 import numpy as np
 
 
+def triple_similarities(vectors, human_assessment_df: pd.DataFrame, doc_id_mapping: Dict[str, str],
+                        facet_mapping: Dict[str, str], use_sum: bool) -> pd.DataFrame:
+    # similarities of all three pairs of every assessed triple, computed per column instead of per row
+    triples = human_assessment_df.loc[~human_assessment_df["Selection"].isin(["skip", "unsure"])].copy()
+    books = [triples[f"Book {i}"].map(doc_id_mapping).astype(str).to_numpy() for i in (1, 2, 3)]
+    if use_sum:
+        facets = np.full(len(triples), facet_mapping["total"], dtype=object)
+    else:
+        facets = triples["Facet"].map(facet_mapping).to_numpy()
+    for column, (book_a, book_b) in zip(["Sim 1", "Sim 2", "Sim 3"],
+                                        [(books[0], books[1]), (books[0], books[2]), (books[1], books[2])]):
+        triples[column] = Vectorization.facet_sim_batch(vectors, book_a, book_b, facets)
+
+    # the pair with the strictly highest similarity, -1 if the maximum is shared
+    sims = triples[["Sim 1", "Sim 2", "Sim 3"]].to_numpy()
+    unique_max = (sims == sims.max(axis=1, keepdims=True)).sum(axis=1) == 1
+    triples["Predicted Answer Nr."] = np.where(unique_max, sims.argmax(axis=1) + 1, -1)
+    triples["Correct"] = (triples["Predicted Answer Nr."] == triples["Selected Answer Nr."].astype(int)).astype(int)
+    return triples
+
+
 def get_percentage_of_correctly_labeled(vectors, human_assessment_df: pd.DataFrame, doc_id_mapping: Dict[str, str],
                                         facet_mapping: Dict[str, str], use_sum: bool):
     # reverted_facets = {value: key for key, value in facet_mapping.items()}
-    correctly_assessed = []
-    facet_wise = defaultdict(list)
     random_baseline = False
-    skip_count = 0
-    agreement_store = defaultdict(list)
-    for i, row in human_assessment_df.iterrows():
-        book1 = doc_id_mapping[row["Book 1"]]
-        book2 = doc_id_mapping[row["Book 2"]]
-        book3 = doc_id_mapping[row["Book 3"]]
-        if use_sum:
-            facet = facet_mapping["total"]
-        else:
-            facet = facet_mapping[row["Facet"]]
-        selection = row["Selection"]
-        if selection == "skip" or selection == "unsure":
-            skip_count += 1
-            continue
-
-        if random_baseline:
-            if int(row["Selected Answer Nr."]) == random.randint(1, 3):
-                correctly_assessed.append(1)
-                facet_wise[row["Facet"]].append(1)
-            else:
-                correctly_assessed.append(0)
-                facet_wise[row["Facet"]].append(0)
-        else:
-            sim_1 = Vectorization.facet_sim(model_vectors=vectors, doc_id_a=book1, doc_id_b=book2, facet_name=facet)
-            sim_2 = Vectorization.facet_sim(model_vectors=vectors, doc_id_a=book1, doc_id_b=book3, facet_name=facet)
-            sim_3 = Vectorization.facet_sim(model_vectors=vectors, doc_id_a=book2, doc_id_b=book3, facet_name=facet)
-
-            if int(row["Selected Answer Nr."]) == 1 and sim_1 > sim_2 and sim_1 > sim_3:
-                correctly_assessed.append(1)
-                facet_wise[row["Facet"]].append(1)
-                agreement_store["True"].append(row["Agreement"])
-            elif int(row["Selected Answer Nr."]) == 2 and sim_2 > sim_1 and sim_2 > sim_3:
-                correctly_assessed.append(1)
-                facet_wise[row["Facet"]].append(1)
-                agreement_store["True"].append(row["Agreement"])
-            elif int(row["Selected Answer Nr."]) == 3 and sim_3 > sim_1 and sim_3 > sim_2:
-                correctly_assessed.append(1)
-                facet_wise[row["Facet"]].append(1)
-                agreement_store["True"].append(row["Agreement"])
-            else:
-                correctly_assessed.append(0)
-                agreement_store["False"].append(row["Agreement"])
-                facet_wise[row["Facet"]].append(0)
+    triples = triple_similarities(vectors, human_assessment_df, doc_id_mapping, facet_mapping, use_sum)
+    if random_baseline:
+        random_answers = np.array([random.randint(1, 3) for _ in range(len(triples))])
+        triples["Correct"] = (triples["Selected Answer Nr."].astype(int) == random_answers).astype(int)
+
+    correctly_assessed = triples["Correct"].tolist()
+    facet_wise = defaultdict(list, {facet: scores.tolist()
+                                    for facet, scores in triples.groupby("Facet", sort=False)["Correct"]})
+    agreement_store = {"True": triples.loc[triples["Correct"] == 1, "Agreement"],
+                       "False": triples.loc[triples["Correct"] == 0, "Agreement"]}
 
     print("False:", np.mean(agreement_store["False"]))
     print("True:", np.mean(agreement_store["True"]))
@@ -73,44 +59,18 @@ def get_percentage_of_correctly_labeled(vectors, human_assessment_df: pd.DataFra
 def correlation_for_correctly_labeled(vectors, human_assessment_df: pd.DataFrame, doc_id_mapping: Dict[str, str],
                                       facet_mapping: Dict[str, str], use_sum: bool):
     # reverted_facets = {value: key for key, value in facet_mapping.items()}
+    triples = triple_similarities(vectors, human_assessment_df, doc_id_mapping, facet_mapping, use_sum)
+    skip_count = len(human_assessment_df.index) - len(triples.index)
+    tie_count = int((triples["Predicted Answer Nr."] == -1).sum())
+    if tie_count > 0:
+        print(f"warning: {tie_count} triples without a single most similar pair")
+
+    ground_truth = {"all_facets": triples["Selected Answer Nr."].astype(int)}
+    predicted = {"all_facets": triples["Predicted Answer Nr."]}
+    for facet, facet_triples in triples.groupby("Facet", sort=False):
+        ground_truth[facet] = facet_triples["Selected Answer Nr."].astype(int)
+        predicted[facet] = facet_triples["Predicted Answer Nr."]
 
-    ground_truth = defaultdict(list)
-    predicted = defaultdict(list)
-    skip_count = 0
-    for i, row in human_assessment_df.iterrows():
-        book1 = doc_id_mapping[row["Book 1"]]
-        book2 = doc_id_mapping[row["Book 2"]]
-        book3 = doc_id_mapping[row["Book 3"]]
-        if use_sum:
-            facet = facet_mapping["total"]
-        else:
-            facet = facet_mapping[row["Facet"]]
-        selection = row["Selection"]
-
-        if selection == "skip" or selection == "unsure":
-            skip_count += 1
-            continue
-
-        sim_1 = Vectorization.facet_sim(model_vectors=vectors, doc_id_a=book1, doc_id_b=book2, facet_name=facet)
-        sim_2 = Vectorization.facet_sim(model_vectors=vectors, doc_id_a=book1, doc_id_b=book3, facet_name=facet)
-        sim_3 = Vectorization.facet_sim(model_vectors=vectors, doc_id_a=book2, doc_id_b=book3, facet_name=facet)
-
-        if sim_1 > sim_2 and sim_1 > sim_3:
-            pred_label = 1
-        elif sim_2 > sim_1 and sim_2 > sim_3:
-            pred_label = 2
-        elif sim_3 > sim_1 and sim_3 > sim_2:
-            pred_label = 3
-        else:
-            print("warning")
-            pred_label = -1
-
-        ground_truth[row["Facet"]].append(int(row["Selected Answer Nr."]))
-        ground_truth["all_facets"].append(int(row["Selected Answer Nr."]))
-        predicted[row["Facet"]].append(pred_label)
-        predicted["all_facets"].append(pred_label)
-
-        # print(row["Facet"], "=", sum(facet_wise[row["Facet"]]))
     print(f"{skip_count} times skipped!")
     result_scores = {}
     for facet, ground_truth_labels in ground_truth.items():
@@ -1,6 +1,10 @@
+import hashlib
 import json
+import os
 from collections import defaultdict
+from typing import List, Set, Dict, Tuple
 
+import numpy as np
 from gensim import corpora
 from gensim.models import TfidfModel
 from sklearn.manifold import TSNE
@@ -8,10 +12,13 @@ import matplotlib.pyplot as plt
 from umap import UMAP
 
 from lib2vec.corpus_iterators import CorpusDocumentIterator
-from lib2vec.corpus_structure import Corpus
+from lib2vec.corpus_structure import Corpus, ConfigLoader, DataHandler
 from lib2vec.vectorization_utils import Vectorization
 
 
+config = ConfigLoader.get_config()
+
+
 def doc_id_replace(corpus: Corpus, doc_id: str):
     try:
         if doc_id[-1].isalpha():
@@ -70,98 +77,129 @@ def link_color(label: str, neighbor: str):
     return "#777777"
 
 
-def force_directed_graph(model, corpus: Corpus):
-    top_n_docs = 3
-    top_n_tfidf_words = 5000
-    top_n_words = 50
-    words_shown = 7
+def cached_projection(vectors, labels: List[str], method: str = "tsne", vec_path: str = None) -> np.ndarray:
+    # 2d projections are deterministic for a vector file and label set, so they are computed only once
+    cache_path = None
+    if vec_path is not None:
+        labels_hash = hashlib.sha1('\n'.join(labels).encode('utf-8')).hexdigest()[:16]
+        cache_dir = os.path.join(config["system_storage"]["models"], "projections")
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        cache_path = os.path.join(cache_dir, f'{DataHandler.file_hash(vec_path)}_{labels_hash}_{method}.npy')
+        if os.path.isfile(cache_path):
+            return np.load(cache_path)
+
+    if method == "tsne":
+        dim_reduced_model = TSNE(perplexity=40, n_components=2, init='pca', n_iter=500, random_state=42)
+    elif method == "umap":
+        dim_reduced_model = UMAP(n_components=2, init='spectral', random_state=42)
+    else:
+        raise UserWarning(f"Unknown projection {method}!")
+    new_values = dim_reduced_model.fit_transform(np.array(vectors))
 
-    labels = []
-    word_labels = set()
-    word_neighbors = {}
-    document_neighbors = defaultdict(list)
+    if cache_path is not None:
+        np.save(cache_path, new_values)
+    return new_values
 
+
+def normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def tf_idf_relevant_words(corpus: Corpus, top_n_tfidf_words: int) -> Set[str]:
     tokenized_document_corpus = CorpusDocumentIterator(corpus, lemma=False, lower=False)
 
     dictionary = corpora.Dictionary()
     bow_corpus = [dictionary.doc2bow(doc, allow_update=True) for doc in tokenized_document_corpus]
     tf_idf_model = TfidfModel(bow_corpus)
 
-    doc_id_mapping = {doc_id: i for i, doc_id in enumerate(tokenized_document_corpus.doc_ids)}
-
-    relevant_words_of_doc = set()
-    # tf_idf_score = {}
-    relevant_words_with_sims = set()
-    for doc_id, doc in zip(tokenized_document_corpus.doc_ids, tf_idf_model[bow_corpus]):
-        tuples = [(dictionary[word_id], sim) for word_id, sim in doc]
-        tuples.sort(key=lambda x: x[1])
-        relevant_words_with_sims.update(set([(doc_id, word, sim) for word, sim in tuples]))
-        tuples = tuples[:top_n_tfidf_words]
-
-        # tf_idf_score[doc_id] = {word: sim for word, sim in tuples}
-        relevant_words = set([word for word, sim in tuples])
-
-        relevant_words_of_doc.update(relevant_words)
-        # relevant_words_of_doc[doc_id] = relevant_words
-
-    tf_idf_lookup = defaultdict(dict)
-
-    for (doc_id, word, sim) in relevant_words_with_sims:
-        tf_idf_lookup[doc_id][word] = sim
-
-    # print(tf_idf_lookup)
+    relevant_word_ids = set()
+    for doc in tf_idf_model[bow_corpus]:
+        if len(doc) == 0:
+            continue
+        word_ids = np.array([word_id for word_id, _ in doc])
+        weights = np.array([weight for _, weight in doc])
+        if len(doc) > top_n_tfidf_words:
+            word_ids = word_ids[np.argpartition(weights, top_n_tfidf_words - 1)[:top_n_tfidf_words]]
+        relevant_word_ids.update(word_ids.tolist())
+    return set(dictionary[word_id] for word_id in relevant_word_ids)
+
+
+def document_neighbors_of_facets(model, corpus: Corpus, doc_tags: List[str], top_n_docs: int,
+                                 series: bool = False, block_size: int = 1024) -> Dict[str, List[Tuple[str, float]]]:
+    # doc -> doc knn edges within each facet, one blocked matrix product per facet instead of one query per tag
+    facet_candidates = defaultdict(list)
+    for doc_tag in model.docvecs.doctags:
+        doc_tag = str(doc_tag)
+        if Vectorization.doctag_filter(doc_tag, series) and corpus.vector_doc_id_base_in_corpus(doc_tag):
+            facet_candidates[doc_tag.split('_')[-1]].append(doc_tag)
+
+    facet_queries = defaultdict(list)
+    for doc_tag in doc_tags:
+        facet_queries[doc_tag.split('_')[-1]].append(doc_tag)
+
+    document_neighbors = {}
+    for facet, queries in facet_queries.items():
+        candidates = facet_candidates[facet]
+        if len(candidates) == 0:
+            continue
+        candidate_index = {candidate: i for i, candidate in enumerate(candidates)}
+        candidate_matrix = normalized([model.docvecs[candidate] for candidate in candidates])
+        query_matrix = normalized([model.docvecs[query] for query in queries])
+        k = min(top_n_docs, len(candidates))
+        for start in range(0, len(queries), block_size):
+            sims = query_matrix[start:start + block_size] @ candidate_matrix.T
+            for row, query in enumerate(queries[start:start + block_size]):
+                if query in candidate_index:
+                    sims[row, candidate_index[query]] = -np.inf
+            top_columns = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            for row, query in enumerate(queries[start:start + block_size]):
+                columns = top_columns[row][np.argsort(-sims[row, top_columns[row]])]
+                document_neighbors[query] = [(candidates[column], float(sims[row, column])) for column in columns
+                                             if np.isfinite(sims[row, column])]
+    return document_neighbors
+
+
+def force_directed_graph(model, corpus: Corpus, series: bool = False,
+                         output_path: str = '../d3/neighborhood.json'):
+    top_n_docs = 3
+    top_n_tfidf_words = 5000
+    top_n_words = 50
+    words_shown = 7
 
-    for doc_id in model.docvecs.doctags:
-        if str(doc_id)[-1].isalpha() and not str(doc_id).endswith("raw"):
-            sim_docs = Vectorization.most_similar_documents(model, corpus, positives=[doc_id], topn=top_n_docs, print_results=False)
-            sim_words = Vectorization.most_similar_words(model, positives=[doc_id], topn=top_n_words,
-                                                         print_results=False)
+    relevant_words_of_doc = tf_idf_relevant_words(corpus, top_n_tfidf_words)
 
-            labels.append((doc_id, "doc"))
-            # sim_words = [(sim_word[0], sim_word[1]) for sim_word in sim_words if
-            #              sim_word[0] in relevant_words_of_doc['_'.join(doc_id.split('_')[:-1])]]
-            sim_words = [(sim_word[0], sim_word[1]) for sim_word in sim_words if
-                         sim_word[0] in relevant_words_of_doc]
+    doc_tags = [str(doc_id) for doc_id in model.docvecs.doctags
+                if str(doc_id)[-1].isalpha() and not str(doc_id).endswith("raw")]
 
-            word_neighbors[doc_id] = sim_words
-            sim_words = [sim_word[0] for sim_word in sim_words][:words_shown]
-            word_labels.update(sim_words)
-            document_neighbors[doc_id].extend(sim_docs[1:])
-
-    reverted_word_neighbors = defaultdict(set)
-    for doc_id, neighbors in word_neighbors.items():
-        for (word_neighbor, sim) in neighbors:
-            reverted_word_neighbors[word_neighbor].add(doc_id)
-    reverted_word_neighbors = {word: len(documents)
-                               for word, documents in reverted_word_neighbors.items()
-                               if len(documents) >= 1}
-    word_labels = [(word, "word") for word in word_labels if word in reverted_word_neighbors.keys()]
-    word_neighbors = {doc_id: [word_sim for word_sim in word_sims if word_sim[0] in reverted_word_neighbors.keys()]
-                      for doc_id, word_sims in word_neighbors.items()}
+    # the neighbour lists exclude the query tag itself
+    document_neighbors = document_neighbors_of_facets(model, corpus, doc_tags, top_n_docs - 1, series=series)
+    all_word_neighbors = Vectorization.most_similar_words_batch(model, positives=doc_tags, topn=top_n_words)
 
-    labels.extend(word_labels)
-    # labels = [label.lower() for label in labels]
-    # print(labels)
-    nodes = []
-    label2id = {}
+    labels = []
+    word_labels = set()
+    word_neighbors = {}
+    for doc_id in doc_tags:
+        labels.append((doc_id, "doc"))
+        sim_words = [(word, sim) for word, sim in all_word_neighbors[doc_id] if word in relevant_words_of_doc]
+        word_neighbors[doc_id] = sim_words
+        word_labels.update([word for word, _ in sim_words][:words_shown])
 
-    # word_doc_degree_dict = defaultdict(lambda: 1)
-    # for label, neighbors in document_neighbors.items():
-    #     for neighbor in neighbors:
-    #         print(label, neighbor)
-    #         word_doc_degree_dict[neighbor[0]] += 1
-    # print(word_doc_degree_dict)
+    words_with_neighbors = set(word for word_sims in word_neighbors.values() for word, _ in word_sims)
+    labels.extend([(word, "word") for word in word_labels if word in words_with_neighbors])
 
     word_degree_dict = defaultdict(lambda: 1)
     doc_degree_dict = defaultdict(lambda: 1)
     for label, neighbors in word_neighbors.items():
+        doc_degree_dict[label] += len(neighbors)
         for neighbor in neighbors:
-            # print(label, neighbor)
-            doc_degree_dict[label] += 1
             word_degree_dict[neighbor[0]] += 1
-    print(word_degree_dict)
-    # print(doc_degree_dict)
 
+    nodes = []
+    label2id = {}
     for i, (label, typ) in enumerate(labels):
         size = 100
         degree = 2.0
@@ -171,7 +209,6 @@ def force_directed_graph(model, corpus: Corpus):
         if typ == "word":
             size = 50
             degree = 1.0
-            print(label, typ, label in word_degree_dict)
             if label in word_degree_dict:
                 closeness += word_degree_dict[label]
                 eigenvector += word_degree_dict[label] ** 3
@@ -180,13 +217,10 @@ def force_directed_graph(model, corpus: Corpus):
                 closeness += doc_degree_dict[label]
                 eigenvector += doc_degree_dict[label]
 
-        closeness = float(closeness)
-        eigenvector = float(eigenvector)
-
         nodes.append({"small": 1.0,
-                      "documents": closeness,
+                      "documents": float(closeness),
                       "standard": degree,
-                      "words": eigenvector,
+                      "words": float(eigenvector),
                       "colour": colors(label)[0],
                       "fontcolour": colors(label)[0],
                       "id": doc_id_replace(corpus, label),
@@ -194,47 +228,32 @@ def force_directed_graph(model, corpus: Corpus):
                       "value": size})
         label2id[label] = i
 
+    # integer node ids and weights quantised to percent keep the file small for large corpora
     links = []
-    # print(labels, list(word_neighbors.keys())[-10:])
     for (label, typ) in labels:
-        if label in document_neighbors:
-            for doc_neighbor in document_neighbors[label]:
-                # print(doc_neighbor)
+        for doc_neighbor in document_neighbors.get(label, []):
+            if doc_neighbor[0] in label2id:
                 links.append({"source": label2id[label],
                               "target": label2id[doc_neighbor[0]],
-                              "value": int(doc_neighbor[1]*100),
-                              "colour": link_color(label, neighbor=doc_neighbor[0])
-                              })
-
-        if label in word_neighbors:
-            for word_neighbor in word_neighbors[label]:
-                if word_neighbor[0] in label2id:
-                    # print(tf_idf_lookup['_'.join(label.split('_')[:-1])][word_neighbor[0]])
-                    links.append({"source": label2id[label],
-                                  "target": label2id[word_neighbor[0]],
-                                  "value": int(word_neighbor[1]*100/2),
-                                  "colour": "#cccccc"})
-
-    # word_counter = defaultdict(lambda: 0)
-    # for link in links:
-    #     word_counter[link["target"]] += 1
-    #
-    # remove_words = set([word for word in word_labels if word_counter[label2id[word]] < 2])
-    # remove_words_id = set([label2id[word] for word in remove_words])
-    # links = [link for link in links if link["target"] not in remove_words_id]
-    # nodes = [node for node in nodes if node["name"] not in remove_words]
-    # all_link_nodes = set([link["target"] for link in links])
-    # all_link_nodes.update([link["source"] for link in links])
-    # nodes = [node for i, node in enumerate(nodes) if i in all_link_nodes]
+                              "value": int(doc_neighbor[1] * 100),
+                              "colour": link_color(label, neighbor=doc_neighbor[0])})
+
+        for word_neighbor in word_neighbors.get(label, []):
+            if word_neighbor[0] in label2id:
+                links.append({"source": label2id[label],
+                              "target": label2id[word_neighbor[0]],
+                              "value": int(word_neighbor[1] * 100 / 2),
+                              "colour": "#cccccc"})
+
     d3_graph = {"nodes": nodes, "links": links}
 
-    with open('../d3/neighborhood.json', 'w', encoding="utf-8") as outfile:
-        json.dump(d3_graph, outfile, indent=1)
+    with open(output_path, 'w', encoding="utf-8") as outfile:
+        json.dump(d3_graph, outfile, ensure_ascii=False, separators=(',', ':'))
 
     return d3_graph
 
 
-def tsne_plot(model, corpus: Corpus):
+def tsne_plot(model, corpus: Corpus, vec_path: str = None):
     labels = []
     tokens = []
     plt.rcParams.update({'font.size': 20})
@@ -243,9 +262,7 @@ def tsne_plot(model, corpus: Corpus):
             tokens.append(model.docvecs[doc_id])
             labels.append(doc_id_replace(corpus, doc_id))
 
-    dim_reduced_model = TSNE(perplexity=40, n_components=2, init='pca', n_iter=500, random_state=42)
-    # dim_reduced_model = UMAP(n_components=2, init='spectral', random_state=42)
-    new_values = dim_reduced_model.fit_transform(tokens)
+    new_values = cached_projection(tokens, labels, method="tsne", vec_path=vec_path)
 
     x = []
     y = []
@@ -291,7 +308,7 @@ def tsne_plot(model, corpus: Corpus):
     plt.show()
 
 
-def neighbor_plot(model, corpus: Corpus):
+def neighbor_plot(model, corpus: Corpus, vec_path: str = None):
     document_labels = []
     document_vectors = []
     plt.rcParams.update({'font.size': 6})
@@ -336,9 +353,7 @@ def neighbor_plot(model, corpus: Corpus):
     vectors.extend(document_vectors)
     vectors.extend(word_vectors)
 
-    # dim_reduced_model = TSNE(perplexity=40, n_components=2, init='pca', n_iter=2500, random_state=42)
-    dim_reduced_model = UMAP(n_components=2, init='spectral', random_state=42)
-    new_values = dim_reduced_model.fit_transform(vectors)
+    new_values = cached_projection(vectors, labels, method="umap", vec_path=vec_path)
 
     reduced_dict = {label: new_value for new_value, label in zip(new_values, labels)}
     # print(reduced_dict)
@@ -439,7 +454,7 @@ if __name__ == '__main__':
                          load_entities=False
                          )
 
-    tsne_plot(vecs, c)
-    # neighbor_plot(vecs, c)
+    tsne_plot(vecs, c, vec_path=vec_path)
+    # neighbor_plot(vecs, c, vec_path=vec_path)
     force_directed_graph(vecs, c)
 
@@ -9,7 +9,7 @@ from experiments.book_comparison import calculate_vectors
 from lib2vec.corpus_structure import Corpus, Document
 from lib2vec.doc2vec_structures import DocumentKeyedVectors
 from extensions.text_summarisation import Summarizer
-from extensions.topic_modelling import TopicModeller
+from extensions.topic_modelling import TopicModeller, TopicMatrix
 import pandas as pd
 import time
 from scipy import stats
@@ -20,7 +20,7 @@ from extensions.wordnet_utils import NetWords
 
 class FacetEfficientEvaluation:
     def __init__(self, vectors: Union[Doc2Vec, DocumentKeyedVectors], corpus: Corpus,
-                 data_set_name: str, facet_names: List[str] = None, topic_vectors=None):
+                 data_set_name: str, facet_names: List[str] = None, topic_vectors: TopicMatrix = None):
         self.vectors = vectors
         self.corpus = corpus
         # self.same_facet_words = same_facet_words
@@ -120,11 +120,7 @@ class FacetEfficientEvaluation:
                                                         series=is_series_corpus)
 
         sim_docs = {doctag.replace(f'_{facet_name}', ''): sim for (doctag, sim) in sim_docs}
-        topic_sim_docs = Vectorization.most_similar_documents(self.topic_vectors, self.corpus, positives=doc_id,
-                                                              topn=len(self.corpus.documents.items()),
-                                                              print_results=False,
-                                                              series=is_series_corpus)
-        topic_sim_docs = {doctag: sim for (doctag, sim) in topic_sim_docs}
+        topic_sim_docs = self.topic_vectors.similarities(doc_id)
 
         neural_sims = []
         topic_sims = []
@@ -149,9 +145,9 @@ class FacetEfficientEvaluation:
                                                         series=is_series_corpus)
 
         # print(doc_id, len(sim_docs))
-        sim_words = Vectorization.most_similar_words(self.vectors, positives=[doc_id],
-                                                     topn=word_top_n,
-                                                     feature_to_use=facet_name, print_results=False)
+        sim_words = Vectorization.most_similar_words_batch(self.vectors, positives=[doc_id],
+                                                           topn=word_top_n,
+                                                           feature_to_use=facet_name)[doc_id]
         sim_words_relaxed = set([word for word, sim in sim_words])
         # print(sim_words, len(sim_words))
         facet_words = self.get_facet_words(document, facet_name, topic_dict, summary_dict, adv_mode=adv_mode)
@@ -167,13 +163,13 @@ class FacetEfficientEvaluation:
         r = 1
         simple_facet_words = sim_words_strict
 
-        for sim_doc_id, sim_doc in sim_docs:
-            if str(sim_doc_id).startswith(doc_id):
-                continue
+        sim_doc_ids = [sim_doc_id for sim_doc_id, sim_doc in sim_docs if not str(sim_doc_id).startswith(doc_id)]
+        sim_docs_words = Vectorization.most_similar_words_batch(self.vectors, positives=sim_doc_ids,
+                                                                topn=word_top_n,
+                                                                feature_to_use=None)
+        for sim_doc_id in sim_doc_ids:
             # print('>>', sim_doc_id, word_top_n)
-            sim_doc_words = Vectorization.most_similar_words(self.vectors, positives=[sim_doc_id],
-                                                             topn=word_top_n,
-                                                             feature_to_use=None, print_results=False)
+            sim_doc_words = sim_docs_words[sim_doc_id]
             # print(len(sim_doc_words))
             # print(sim_words_relaxed)
             # print(sim_doc_words)
@@ -275,7 +271,7 @@ def calculate_facet_scores(data_sets: List[str], vector_names: List[str], facets
             summary_dict = Summarizer.get_summary(corpus)
         start_time = time.time()
         if use_topic_vecs:
-            topic_vecs = TopicModeller.get_topic_distribution(corpus, data_set)
+            topic_vecs = TopicModeller.get_topic_distribution(corpus)
         else:
             topic_vecs = None
         for vector_name in tqdm(vector_names, desc="Iterate through embedding types", total=len(vector_names)):
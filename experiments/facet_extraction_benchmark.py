@@ -0,0 +1,101 @@
+import os
+import time
+from typing import List
+
+import pandas as pd
+from tqdm import tqdm
+
+from lib2vec.corpus_iterators import calculate_facets_of_corpus, resolve_doc_entities, window_tokens
+from lib2vec.corpus_structure import Corpus, Document
+
+
+def token_loop_windowing(facet_ids, document: Document, window_size: int, lemma: bool, lower: bool) -> List[str]:
+    # the former per token windowing, the reference the index gather has to reproduce
+    facet_words = []
+    for (sentence_id, token_id) in facet_ids:
+        sentence = document.sentences[sentence_id]
+        lower_bound = max(token_id - window_size, 0)
+        upper_bound = min(token_id + window_size, len(sentence.tokens) - 1)
+        for i in range(lower_bound, upper_bound + 1):
+            facet_words.append(sentence.tokens[i].representation(lemma=lemma, lower=lower))
+    return facet_words
+
+
+def windowing_benchmark(corpus: Corpus, window_sizes: List[int] = None, lemma: bool = False, lower: bool = False):
+    # time, loc and sty windows of every document with the token loop and with the index gather
+    if window_sizes is None:
+        window_sizes = [0, 5, 10]
+    tuples = []
+    for doc_id, document in tqdm(corpus.documents.items(), total=len(corpus.documents), desc="Benchmark windows"):
+        document.load_sentences_from_disk()
+        if document.doc_entities is None:
+            document.set_entities()
+        times, locations = resolve_doc_entities(document.get_document_entities_representation(lemma, lower,
+                                                                                              as_id=True))
+        facets = {"time": set(times), "loc": set(locations),
+                  "sty": document.get_flat_and_filtered_document_tokens(lemma=lemma, lower=lower,
+                                                                       focus_stopwords=True, ids=True)}
+        for window_size in window_sizes:
+            start = time.time()
+            loop_words = {facet_name: token_loop_windowing(facet_ids, document, window_size, lemma, lower)
+                          for facet_name, facet_ids in facets.items()}
+            loop_time = time.time() - start
+
+            start = time.time()
+            doc_arrays = {}
+            gather_words = {facet_name: window_tokens(facet_ids, document, window_size, lemma, lower, doc_arrays)
+                            for facet_name, facet_ids in facets.items()}
+            gather_time = time.time() - start
+
+            if loop_words != gather_words:
+                raise UserWarning(f"Windows of {doc_id} differ for window size {window_size}!")
+            tuples.append((doc_id, document.length, window_size, loop_time, gather_time,
+                           loop_time / max(gather_time, 1e-9)))
+        document.sentences = None
+        document.doc_entities = None
+
+    return pd.DataFrame(tuples, columns=["Document", "Length", "Window", "Loop s", "Gather s", "Speedup"])
+
+
+def fan_out_benchmark(corpus: Corpus, workers_list: List[int] = None, window_size: int = 5):
+    # per document facet time of calculate_facets_of_corpus for different worker counts, facets have to be equal
+    if workers_list is None:
+        workers_list = [1, 4]
+    facet_args = {"disable_aspects": ["cont"], "lemma": False, "lower": False, "topic_dict": None,
+                  "summary_dict": None, "basic_mode": True, "window": window_size, "use_dictionary_lookup": None}
+    tuples = []
+    reference = None
+    for workers in workers_list:
+        start = time.time()
+        facets = calculate_facets_of_corpus(corpus, chunk_len=None, workers=workers, **facet_args)
+        duration = time.time() - start
+        if reference is None:
+            reference = facets
+        elif facets != reference:
+            raise UserWarning(f"Facets with {workers} workers differ from {workers_list[0]} workers!")
+        tuples.append((workers, len(corpus.documents), duration, duration / max(len(corpus.documents), 1)))
+
+    return pd.DataFrame(tuples, columns=["Workers", "Documents", "Seconds", "Seconds per Document"])
+
+
+def facet_benchmark(data_set: str, longest: int = 20, window_sizes: List[int] = None, workers_list: List[int] = None):
+    corpus = Corpus.fast_load(path=os.path.join('../corpora', data_set), load_entities=False)
+    # long novels dominate the facet time, so only the longest documents are measured
+    doc_ids = sorted(corpus.documents.keys(), key=lambda doc_id: corpus.documents[doc_id].length, reverse=True)
+    corpus = Corpus(source={doc_id: corpus.documents[doc_id] for doc_id in doc_ids[:longest]},
+                    name=corpus.name, language=corpus.language)
+
+    windows_df = windowing_benchmark(corpus, window_sizes=window_sizes)
+    fan_out_df = fan_out_benchmark(corpus, workers_list=workers_list)
+
+    if not os.path.isdir("results/facet_benchmark"):
+        os.makedirs("results/facet_benchmark")
+    windows_df.to_csv(f"results/facet_benchmark/{data_set}_windows.csv", index=False)
+    fan_out_df.to_csv(f"results/facet_benchmark/{data_set}_fan_out.csv", index=False)
+    print(windows_df.groupby("Window")[["Loop s", "Gather s", "Speedup"]].mean())
+    print(fan_out_df)
+    return windows_df, fan_out_df
+
+
+if __name__ == '__main__':
+    facet_benchmark("german_series")
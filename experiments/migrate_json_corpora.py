@@ -0,0 +1,40 @@
+import logging
+import os
+import tracemalloc
+
+from tqdm import tqdm
+
+from lib2vec.aux_utils import ConfigLoader
+from lib2vec.corpus_structure import Corpus
+
+
+def migrate_corpora(corpora_dir: str, remove_old: bool = False):
+    json_paths = [os.path.join(corpora_dir, file_name) for file_name in os.listdir(corpora_dir)
+                  if file_name.endswith('.json') and not file_name.endswith('_index.json')]
+    migrated = []
+    for json_path in tqdm(json_paths, desc="Migrate corpora"):
+        if os.path.isfile(f'{Corpus.stream_path(json_path)}.jsonl'):
+            continue
+        migrated.append(Corpus.migrate_json_corpus(json_path, remove_old=remove_old))
+        logging.info(f'migrated {json_path}')
+    return migrated
+
+
+def check_stream_memory(path: str):
+    # peak memory of a streamed pass should stay near the size of the largest document, not the corpus
+    tracemalloc.start()
+    largest_document = 0
+    for document in Corpus.iter_corpus_stream(path):
+        current, _ = tracemalloc.get_traced_memory()
+        largest_document = max(largest_document, current)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{path}: file size {os.path.getsize(path) / 1024 ** 2:.1f} MB, '
+          f'largest document {largest_document / 1024 ** 2:.1f} MB, peak {peak / 1024 ** 2:.1f} MB')
+    return peak
+
+
+if __name__ == '__main__':
+    config = ConfigLoader.get_config()
+    for stream_path in migrate_corpora(config["system_storage"]["corpora"]):
+        check_stream_memory(stream_path)
@@ -1,10 +1,16 @@
+import hashlib
+import json
+import os
+import time
 from collections import defaultdict
+from typing import Dict, List, Tuple, Union
 
+from joblib import Parallel, delayed
 from scipy.stats import stats
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import make_pipeline
 
-from lib2vec.corpus_structure import DataHandler
+from lib2vec.corpus_structure import DataHandler, ConfigLoader
 from lib2vec.vectorization_utils import Vectorization
 import sklearn as sk
 from sklearn.metrics import f1_score
@@ -14,6 +20,8 @@ import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from statsmodels.stats.contingency_tables import mcnemar
 
+config = ConfigLoader.get_config()
+
 
 def cross_val_scores_weighted(model, X, y, weights, cv=5, metrics=[sk.metrics.accuracy_score]):
     kf = sk.model_selection.KFold(n_splits=cv)
@@ -63,128 +71,221 @@ def mcnemar_sig_text(table):
         print(f'Classifiers have different proportions of errors (reject H0), {result.pvalue}')
 
 
-def success_prediction_task(data_set_name: str, success_dict, vector_names):
-    result_tuples = []
-    correctness_table = defaultdict(list)
-    for vectorization_algorithm in vector_names:
-        majority_class = None
-        if vectorization_algorithm == "majority_class":
-            majority_class = vectorization_algorithm
-            vectorization_algorithm = "doc2vec"
-
-        vec_path = Vectorization.build_vec_file_name("all",
-                                                     "no_limit",
-                                                     data_set_name,
-                                                     "no_filter",
-                                                     vectorization_algorithm,
-                                                     "real",
-                                                     allow_combination=True)
-        vectors, summation_method = Vectorization.my_load_doc2vec_format(vec_path)
+def feature_cache_dir() -> str:
+    cache_dir = os.path.join(config["system_storage"]["models"], "feature_matrices")
+    if not os.path.isdir(os.path.join(cache_dir, "predictions")):
+        os.makedirs(os.path.join(cache_dir, "predictions"))
+    return cache_dir
+
+
+def vector_source_files(vec_path: str) -> List[str]:
+    # the files my_load_doc2vec_format reads for vec_path, a combination also depends on its base vectors
+    if "_o_" in vec_path:
+        focus_facette = vec_path.split("_o_")[1].replace('.model', '')
+        vec_path = vec_path.replace(f'_o_{focus_facette}', '')
+    base_path = vec_path.replace("_sum", "")
+    for combination in ["con", "pca", "tsne", "umap", "avg", "auto"]:
+        if base_path.endswith(f'_{combination}'):
+            base_path = base_path[:-len(combination) - 1]
+            break
+    return [path for path in dict.fromkeys([vec_path, base_path]) if os.path.isfile(path)]
+
+
+def vector_file_stamp(vec_path: str) -> Union[str, None]:
+    # a retrained embedding invalidates its features and predictions, without any vector file nothing is cached
+    source_files = vector_source_files(vec_path)
+    if len(source_files) == 0:
+        return None
+    return DataHandler.source_stamp(source_files)
+
+
+def success_features(vectors, summation_method, success_dict) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    x = []
+    y = []
+    doc_ids = []
+    for doctag in vectors.docvecs.doctags:
+        try:
+            if summation_method and f"_{summation_method}" in str(doctag):
+                x.append(vectors.docvecs[doctag])
+                y.append(0 if success_dict[doctag.replace(f"_{summation_method}", "")] == "failure" else 1)
+                doc_ids.append(doctag.replace(f"_{summation_method}", ""))
 
-        x = []
-        y = []
-        doc_ids = []
-        k_fold_cross_val = None
-        for doctag in vectors.docvecs.doctags:
-            try:
-                if summation_method and f"_{summation_method}" in str(doctag):
-                    x.append(vectors.docvecs[doctag])
-                    # success = success_dict[doctag.replace(f"_{summation_method}", "")]
-                    # if success == "failure":
-                    #     success = 0
-                    # else:
-                    #     success = 1
-                    # y.append(success)
-                    y.append(0 if success_dict[doctag.replace(f"_{summation_method}", "")] == "failure" else 1)
-                    doc_ids.append(doctag.replace(f"_{summation_method}", ""))
-
-                elif not summation_method and str(doctag)[-1].isdigit():
-                    doc_splitted = doctag.split("_")
-                    if len(doc_splitted) > 1 and doc_splitted[-1][-1].isdigit() and doc_splitted[-2][-1].isdigit():
-                        pass
-                    else:
-                        x.append(vectors.docvecs[doctag])
-                        y.append(0 if success_dict[doctag] == "failure" else 1)
-                        doc_ids.append(doctag)
-                else:
+            elif not summation_method and str(doctag)[-1].isdigit():
+                doc_splitted = doctag.split("_")
+                if len(doc_splitted) > 1 and doc_splitted[-1][-1].isdigit() and doc_splitted[-2][-1].isdigit():
                     pass
-            except KeyError:
+                else:
+                    x.append(vectors.docvecs[doctag])
+                    y.append(0 if success_dict[doctag] == "failure" else 1)
+                    doc_ids.append(doctag)
+            else:
                 pass
-
-        counter = defaultdict(lambda: 0)
-        print(len(y))
-        for truth_val in y:
-            counter[truth_val] += 1
-        # print(len(doc_ids), len(y))
-        # print(doc_ids)
-
-        # print(y)
-        classifiers = [
-            # RandomForestClassifier(n_estimators=100, max_depth=2, random_state=0),
-            sk.svm.LinearSVC(max_iter=10000, class_weight="balanced", dual=False, random_state=42, C=1.5),
-            sk.svm.SVC(max_iter=10000, class_weight="balanced", kernel="rbf", random_state=42, C=0.5),
-            sk.svm.NuSVC(max_iter=10000, class_weight="balanced", kernel="rbf", gamma="scale", random_state=42, nu=0.5),
-            # MLPClassifier(solver='adam', alpha=1e-5, hidden_layer_sizes=(10, 4), random_state=42, max_iter=10000),
-            # LogisticRegression(random_state=0, solver='lbfgs', multi_class='ovr', max_iter=1000),
-        ]
-
-        # classifiers = [make_pipeline(StandardScaler(), classifier) for classifier in classifiers]
+        except KeyError:
+            pass
+    return np.array(x, dtype=np.float32), np.array(y, dtype=np.int64), doc_ids
+
+
+def cached_success_features(data_set_name: str, vectorization_algorithm: str, success_dict) \
+        -> Tuple[np.ndarray, np.ndarray, List[str], Union[str, None]]:
+    # the (documents x dim) matrix of an embedding is assembled once and memory mapped afterwards
+    vec_path = Vectorization.build_vec_file_name("all",
+                                                 "no_limit",
+                                                 data_set_name,
+                                                 "no_filter",
+                                                 vectorization_algorithm,
+                                                 "real",
+                                                 allow_combination=True)
+    stamp = vector_file_stamp(vec_path)
+    if stamp is None:
+        vectors, summation_method = Vectorization.my_load_doc2vec_format(vec_path)
+        x, y, doc_ids = success_features(vectors, summation_method, success_dict)
+        return x, y, doc_ids, None
+    feature_key = hashlib.sha1(f'{data_set_name}|{vectorization_algorithm}|{stamp}'.encode('utf-8')).hexdigest()[:16]
+    matrix_path = os.path.join(feature_cache_dir(), f'{data_set_name}_{vectorization_algorithm}_{feature_key}.npy')
+    meta_path = f'{matrix_path}.json'
+    if not os.path.isfile(meta_path):
+        vectors, summation_method = Vectorization.my_load_doc2vec_format(vec_path)
+        x, y, doc_ids = success_features(vectors, summation_method, success_dict)
+        tmp_path = f'{matrix_path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, x)
+        os.replace(tmp_path, matrix_path)
+        with open(meta_path, 'w', encoding='utf-8') as json_file:
+            json.dump({"y": y.tolist(), "doc_ids": doc_ids}, json_file)
+    with open(meta_path, encoding='utf-8') as json_file:
+        meta = json.load(json_file)
+    return np.load(matrix_path, mmap_mode='r'), np.array(meta["y"], dtype=np.int64), meta["doc_ids"], feature_key
+
+
+def evaluation_splits(nr_documents: int, k_fold_cross_val: int = None, nr_iterations: int = 100) \
+        -> Tuple[str, List[Tuple[np.ndarray, np.ndarray]]]:
+    indices = np.arange(nr_documents)
+    if k_fold_cross_val:
+        kfold = sk.model_selection.KFold(n_splits=k_fold_cross_val, random_state=42, shuffle=True)
+        return f'kfold{k_fold_cross_val}', list(kfold.split(indices))
+    # the same index permutations as train_test_split on the feature lists
+    return 'split30', [tuple(train_test_split(indices, test_size=0.30, random_state=i)) for i in range(nr_iterations)]
+
+
+def prediction_path(feature_key: str, classifier, split_name: str, fold: int) -> str:
+    classifier_key = hashlib.sha1(repr(classifier).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(feature_cache_dir(), "predictions",
+                        f'{feature_key}_{classifier.__class__.__name__}_{classifier_key}_{split_name}_{fold}.npy')
+
+
+def fit_predict_fold(x: np.ndarray, y: np.ndarray, classifier, train_index: np.ndarray, test_index: np.ndarray,
+                     path: Union[str, None]) -> Tuple[np.ndarray, float]:
+    # runs in the joblib workers, x is the shared memory mapped feature matrix
+    start = time.time()
+    pipeline_classifier = make_pipeline(StandardScaler(), sk.base.clone(classifier))
+    pipeline_classifier.fit(x[train_index], y[train_index])
+    y_pred = pipeline_classifier.predict(x[test_index])
+    if path is not None:
+        tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, y_pred)
+        os.replace(tmp_path, path)
+    return y_pred, time.time() - start
+
+
+def run_success_experiment(data_set_name: str, success_dict, vector_names: List[str], classifiers: List,
+                           k_fold_cross_val: int = None, nr_iterations: int = 100, workers: int = 4) \
+        -> Tuple[Dict[Tuple[str, str], List[Tuple[np.ndarray, np.ndarray]]], pd.DataFrame]:
+    # predictions of every embedding x classifier x fold, folds missing in the cache are fitted in parallel
+    timings = defaultdict(lambda: defaultdict(float))
+    experiments = []
+    tasks = []
+    for vectorization_algorithm in vector_names:
+        start = time.time()
+        majority_class = vectorization_algorithm == "majority_class"
+        x, y, _, feature_key = cached_success_features(data_set_name,
+                                                       "doc2vec" if majority_class else vectorization_algorithm,
+                                                       success_dict)
+        split_name, splits = evaluation_splits(len(y), k_fold_cross_val, nr_iterations)
+        timings[vectorization_algorithm]["features_seconds"] += time.time() - start
         for classifier in classifiers:
-            pipeline_classifier = make_pipeline(StandardScaler(), classifier)
-            if k_fold_cross_val:
-                weights = [counter[pred] for pred in y]
-                # results = cross_val_scores_weighted(classifier, x, y, weights, cv=k_fold_cross_val,
-                #                                     metrics=[f1_score, precision_score,
-                #                                              recall_score, f1_score])
-
-                scoring = {
-                    'accuracy': make_scorer(accuracy_score),
-                    'precision': make_scorer(precision_score),
-                    'recall': make_scorer(recall_score),
-                    'f1_score': make_scorer(f1_score)
-                }
-                kfold = sk.model_selection.KFold(n_splits=k_fold_cross_val, random_state=42, shuffle=True)
-                results = sk.model_selection.cross_validate(estimator=pipeline_classifier,
-                                                            X=x,
-                                                            y=y,
-                                                            cv=kfold,
-                                                            scoring=scoring)
-
-                result_tuples.append((classifier.__class__.__name__,
-                                      vectorization_algorithm,
-                                      np.mean(results["test_f1_score"]),
-                                      np.mean(results["test_precision"]),
-                                      np.mean(results["test_recall"]),
-                                      np.mean(results["test_accuracy"])))
-            else:
-                nr_iterations = 100
-                f1s = []
-                for i in range(nr_iterations):
-                    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.30, random_state=i)
-                    pipeline_classifier.fit(x_train, y_train)
-                    y_pred = pipeline_classifier.predict(x_test)
-
-                    if majority_class:
-                        y_pred = [1 for y in y_pred]
-                        vectorization_algorithm = majority_class
-
-                    # weights = [counter[pred] for pred in y_test]
-                    correctness_table[f"{vectorization_algorithm}-{classifier.__class__.__name__}"]\
-                        .extend([pred == truth for pred, truth in zip(y_pred, y_test)])
-                    f1s.append(f1_score(y_test, y_pred, average="weighted", pos_label=None))
-                    # print(weights)
-                    # print(vectorization_algorithm, round(classifier.score(x_test, y_test), 4))
-
-                if len(f1s) == 0:
-                    f1s.append(0)
-                result_tuples.append((classifier.__class__.__name__,
-                                      vectorization_algorithm,
-                                      np.mean(f1s),
-                                      # precision_score(y_test, y_pred, average="weighted"),
-                                      # recall_score(y_test, y_pred,  average="weighted"),
-                                      # accuracy_score(y_test, y_pred)
-                                      )
-                                     )
+            # features of unstamped vectors are not cached, so neither are their predictions
+            paths = [prediction_path(feature_key, classifier, split_name, fold) if feature_key else None
+                     for fold in range(len(splits))]
+            experiments.append((vectorization_algorithm, classifier, y, splits, paths))
+            if majority_class:
+                continue
+            for fold, ((train_index, test_index), path) in enumerate(zip(splits, paths)):
+                if path is not None and os.path.isfile(path):
+                    timings[vectorization_algorithm]["cached_folds"] += 1
+                else:
+                    tasks.append((vectorization_algorithm, x, y, classifier, train_index, test_index, path,
+                                  (len(experiments) - 1, fold)))
+
+    start = time.time()
+    fold_results = Parallel(n_jobs=workers)(delayed(fit_predict_fold)(x, y, classifier, train_index, test_index, path)
+                                            for _, x, y, classifier, train_index, test_index, path, _ in tasks)
+    parallel_seconds = time.time() - start
+    fitted_predictions = {}
+    for task, (y_pred, seconds) in zip(tasks, fold_results):
+        timings[task[0]]["fitted_folds"] += 1
+        timings[task[0]]["fit_seconds"] += seconds
+        fitted_predictions[task[-1]] = y_pred
+
+    predictions = {}
+    for experiment_id, (vectorization_algorithm, classifier, y, splits, paths) in enumerate(experiments):
+        if vectorization_algorithm == "majority_class":
+            y_preds = [np.ones(len(test_index), dtype=np.int64) for _, test_index in splits]
+        else:
+            y_preds = [fitted_predictions[(experiment_id, fold)] if (experiment_id, fold) in fitted_predictions
+                       else np.load(path) for fold, path in enumerate(paths)]
+        predictions[(vectorization_algorithm, classifier.__class__.__name__)] = [
+            (y[test_index], y_pred) for (_, test_index), y_pred in zip(splits, y_preds)]
+
+    # per embedding fit_seconds add up the workers, the total row shows the wall clock time of the parallel fits
+    timing_df = pd.DataFrame.from_dict({algorithm: dict(values) for algorithm, values in timings.items()},
+                                       orient='index')
+    timing_df = timing_df.reindex(columns=["features_seconds", "cached_folds", "fitted_folds", "fit_seconds"])
+    timing_df = timing_df.fillna(0)
+    timing_df.loc["total"] = timing_df.sum()
+    timing_df.loc["total", "fit_seconds"] = parallel_seconds
+    return predictions, timing_df
+
+
+def success_prediction_task(data_set_name: str, success_dict, vector_names, k_fold_cross_val: int = None,
+                            workers: int = 4):
+    result_tuples = []
+    correctness_table = defaultdict(list)
+    classifiers = [
+        # RandomForestClassifier(n_estimators=100, max_depth=2, random_state=0),
+        sk.svm.LinearSVC(max_iter=10000, class_weight="balanced", dual=False, random_state=42, C=1.5),
+        sk.svm.SVC(max_iter=10000, class_weight="balanced", kernel="rbf", random_state=42, C=0.5),
+        sk.svm.NuSVC(max_iter=10000, class_weight="balanced", kernel="rbf", gamma="scale", random_state=42, nu=0.5),
+        # MLPClassifier(solver='adam', alpha=1e-5, hidden_layer_sizes=(10, 4), random_state=42, max_iter=10000),
+        # LogisticRegression(random_state=0, solver='lbfgs', multi_class='ovr', max_iter=1000),
+    ]
+    predictions, timing_df = run_success_experiment(data_set_name, success_dict, vector_names, classifiers,
+                                                    k_fold_cross_val=k_fold_cross_val, workers=workers)
+
+    # metrics only read the cached predictions, a new metric needs no refitting
+    start = time.time()
+    for (vectorization_algorithm, classifier_name), fold_predictions in predictions.items():
+        if k_fold_cross_val:
+            result_tuples.append((classifier_name,
+                                  vectorization_algorithm,
+                                  np.mean([f1_score(y_test, y_pred) for y_test, y_pred in fold_predictions]),
+                                  np.mean([precision_score(y_test, y_pred) for y_test, y_pred in fold_predictions]),
+                                  np.mean([recall_score(y_test, y_pred) for y_test, y_pred in fold_predictions]),
+                                  np.mean([accuracy_score(y_test, y_pred) for y_test, y_pred in fold_predictions])))
+        else:
+            f1s = []
+            for y_test, y_pred in fold_predictions:
+                correctness_table[f"{vectorization_algorithm}-{classifier_name}"] \
+                    .extend([pred == truth for pred, truth in zip(y_pred, y_test)])
+                f1s.append(f1_score(y_test, y_pred, average="weighted", pos_label=None))
+            if len(f1s) == 0:
+                f1s.append(0)
+            result_tuples.append((classifier_name,
+                                  vectorization_algorithm,
+                                  np.mean(f1s),
+                                  )
+                                 )
+    timing_df["metric_seconds"] = 0.0
+    timing_df.loc["total", "metric_seconds"] = time.time() - start
+    print(timing_df)
 
     print(correctness_table.keys())
     classifiers = [
@@ -216,13 +317,15 @@ def success_prediction_task(data_set_name: str, success_dict, vector_names):
         print(cl)
         mcnemar_sig_text(table)
 
-    df = pd.DataFrame(result_tuples, columns=["Classifier", "Algorithm", "Weighted F1",
-                                              # "Precision", "Recall",
-                                              # "Accuracy"
-                                              ])
+    if k_fold_cross_val:
+        columns = ["Classifier", "Algorithm", "Weighted F1", "Precision", "Recall", "Accuracy"]
+    else:
+        columns = ["Classifier", "Algorithm", "Weighted F1"]
+    df = pd.DataFrame(result_tuples, columns=columns)
     print(df)
     df = df.pivot(index='Algorithm', columns='Classifier', values='Weighted F1')
     df.to_csv("../results/book_success_prediction/eval_scores.csv", index=True)
+    timing_df.to_csv("../results/book_success_prediction/eval_timings.csv", index=True)
     print(df)
     print(df.to_latex())
 
@@ -0,0 +1,57 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import numpy as np
+
+from lib2vec.similarity_service import SimilarityClient
+
+
+def load_test(client: SimilarityClient, store: str = None, facet: str = None, endpoint: str = "documents",
+              requests: int = 1000, batch_size: int = 1, concurrency: int = 8, topn: int = 10,
+              seed: int = 42) -> Dict[str, float]:
+    # p50 / p99 latency of single requests and the overall queries per second of a running similarity server
+    doc_ids = client.doc_ids(store=store, facet=facet)
+    if len(doc_ids) == 0:
+        raise UserWarning(f"No document ids for store {store} and facet {facet}!")
+    rnd = random.Random(seed)
+    batches = [rnd.sample(doc_ids, min(batch_size, len(doc_ids))) for _ in range(requests)]
+    if endpoint == "facets":
+        batches = [[(doc_id, rnd.choice(doc_ids)) for doc_id in batch] for batch in batches]
+
+    def send(batch):
+        start = time.perf_counter()
+        if endpoint == "documents":
+            client.document_neighbors(batch, facet=facet, topn=topn, store=store)
+        elif endpoint == "words":
+            client.word_neighbors(batch, facet=facet, topn=topn, store=store)
+        elif endpoint == "facets":
+            client.facet_similarities(batch, facet=facet, store=store)
+        else:
+            raise UserWarning(f"Not supported endpoint '{endpoint}'!")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(send, batches)))
+    duration = time.perf_counter() - start
+
+    return {"requests": requests,
+            "batch_size": batch_size,
+            "concurrency": concurrency,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "requests_per_second": requests / duration,
+            "queries_per_second": requests * batch_size / duration}
+
+
+if __name__ == '__main__':
+    similarity_client = SimilarityClient()
+    for store_name, store_info in similarity_client.stores().items():
+        for facet_name in [facet for facet in store_info["facets"] if facet][:1] or [None]:
+            for endpoint_name in ["documents", "facets", "words"]:
+                for batch in [1, 32]:
+                    print(store_name, facet_name, endpoint_name,
+                          load_test(similarity_client, store=store_name, facet=facet_name, endpoint=endpoint_name,
+                                    requests=500, batch_size=batch))
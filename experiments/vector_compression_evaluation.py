@@ -0,0 +1,45 @@
+import os
+from typing import List
+
+import pandas as pd
+from tqdm import tqdm
+
+from lib2vec.vectorization_utils import Vectorization
+
+
+def compression_report(data_sets: List[str], vector_names: List[str], compressions: List[str] = None,
+                       topn: int = 10, reranks: List[int] = None):
+    # recall@topn against exact search, memory reduction and query latency of the compressed document vectors
+    if compressions is None:
+        compressions = ["int8", "pq"]
+    if reranks is None:
+        reranks = [None, 100]
+    tuples = []
+    for data_set in data_sets:
+        for vector_name in tqdm(vector_names, desc="Iterate through embedding types", total=len(vector_names)):
+            vec_path = Vectorization.build_vec_file_name("all",
+                                                         "no_limit",
+                                                         data_set,
+                                                         "no_filter",
+                                                         vector_name,
+                                                         "real",
+                                                         allow_combination=True)
+            for compression in compressions:
+                vectors, _ = Vectorization.my_load_doc2vec_format(vec_path, compression=compression)
+                for rerank in reranks:
+                    report = vectors.compressed_docvecs.evaluate(topn=topn, rerank=rerank)
+                    tuples.append((data_set, vector_name, compression, rerank, report["recall"],
+                                   report["memory_reduction"], report["exact_query_ms"],
+                                   report["compressed_query_ms"]))
+
+    df = pd.DataFrame(tuples, columns=["Dataset", "Algorithm", "Compression", "Rerank", f"Recall@{topn}",
+                                       "Memory Reduction", "Exact Query ms", "Compressed Query ms"])
+    if not os.path.isdir("results/compression"):
+        os.makedirs("results/compression")
+    df.to_csv("results/compression/compression_report.csv", index=False)
+    print(df)
+    return df
+
+
+if __name__ == '__main__':
+    compression_report(data_sets=["classic_gutenberg"], vector_names=["book2vec", "book2vec_concat"])
@@ -1,16 +1,23 @@
 import math
 import os
-from typing import Dict
+from typing import Dict, List, Union
 
+from joblib import Parallel, delayed
 from nltk.corpus import stopwords
 from nltk.cluster.util import cosine_distance
 import numpy as np
 import networkx as nx
 import json
-from lib2vec.corpus_structure import Document, Corpus, Language
+from tqdm import tqdm
+
+from lib2vec.corpus_structure import Document, Corpus, Language, DataHandler
 
 
 class Summarizer:
+    # increase when the summarisation changes, stored summaries of older versions are not used anymore
+    summary_version = 1
+    store_dir = "summary_store"
+
     @staticmethod
     def read_article(file_name):
         file = open(file_name, "r", encoding="utf-8")
@@ -153,7 +160,8 @@ class Summarizer:
         return [ranked_sentence[i][1] for i in range(top_n)]
 
     @staticmethod
-    def generate_summary_of_corpus_doc(document: Document, top_n=5, as_sent_ids: bool = True):
+    def generate_summary_of_corpus_doc(document: Document, top_n=5, as_sent_ids: bool = True,
+                                       min_sentence_length: int = 10):
         document.load_sentences_from_disk()
         stop_words = set(stopwords.words('english'))
         if document.language == Language.DE:
@@ -166,7 +174,7 @@ class Summarizer:
         # Step 1 - Read text anc split it
         orig_sentences = [[token.representation() for token in sentence.tokens] for sentence in document.sentences]
         sentences = [[token.representation() for token in sentence.tokens] for sentence in document.sentences
-                     if len(sentence.tokens) > 10]
+                     if len(sentence.tokens) > min_sentence_length]
         # print(len(stop_words), len(sentences))
         # sentences = read_article('msft.txt')
         res = Summarizer.summarize_sentences_rec(sentences, stop_words, top_n=top_n)
@@ -195,24 +203,127 @@ class Summarizer:
         return res, sent_ids
 
     @staticmethod
-    def get_summary(corpus: Corpus):
+    def summary_store_path(store_dir: str, document_hash: str, top_n: int, min_sentence_length: int) -> str:
+        return os.path.join(store_dir, f'{document_hash}_top{top_n}_min{min_sentence_length}'
+                                       f'_v{Summarizer.summary_version}.json')
+
+    @staticmethod
+    def summary_store_paths(documents: Dict[str, Document], store_dir: str, top_n: int,
+                            min_sentence_length: int) -> Dict[str, str]:
+        file_hashes = DataHandler.file_hashes([document.file_path for document in documents.values()])
+        return {doc_id: Summarizer.summary_store_path(store_dir, file_hashes[document.file_path], top_n,
+                                                      min_sentence_length)
+                for doc_id, document in documents.items()}
+
+    @staticmethod
+    def read_stored_summary(summary_path: str) -> Union[List[int], None]:
+        if not os.path.isfile(summary_path):
+            return None
+        with open(summary_path, encoding='utf-8') as json_file:
+            return json.load(json_file)
+
+    @staticmethod
+    def write_stored_summary(summary_path: str, sent_ids: List[int]):
+        # written under a temporary name, an interrupted run never leaves a partial entry
+        tmp_path = f'{summary_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump(sent_ids, fp)
+        os.replace(tmp_path, summary_path)
+
+    @staticmethod
+    def summarize_to_store(document: Document, summary_path: str, top_n: int, min_sentence_length: int) -> List[int]:
+        _, sent_ids = Summarizer.generate_summary_of_corpus_doc(document, top_n,
+                                                                min_sentence_length=min_sentence_length)
+        Summarizer.write_stored_summary(summary_path, sent_ids)
+        return sent_ids
+
+    @staticmethod
+    def root_index_path(store_dir: str, top_n: int, min_sentence_length: int) -> str:
+        return os.path.join(store_dir, f'root_top{top_n}_min{min_sentence_length}_v{Summarizer.summary_version}.json')
+
+    @staticmethod
+    def read_root_index(index_path: str) -> Union[Dict[str, List[int]], None]:
+        # summaries of the last call, valid as long as the listed root corpus files are unchanged
+        if not os.path.isfile(index_path):
+            return None
+        with open(index_path, encoding='utf-8') as json_file:
+            root_index = json.load(json_file)
+        if not all(os.path.isfile(source_file) for source_file in root_index["source_files"]) \
+                or DataHandler.source_stamp(root_index["source_files"]) != root_index["source_stamp"]:
+            return None
+        return root_index["summaries"]
+
+    @staticmethod
+    def write_root_index(index_path: str, source_files: List[str], summary_dict: Dict[str, List[int]]):
+        tmp_path = f'{index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump({"source_files": source_files, "source_stamp": DataHandler.source_stamp(source_files),
+                       "summaries": summary_dict}, fp)
+        os.replace(tmp_path, index_path)
+
+    @staticmethod
+    def get_summary(corpus: Corpus, top_n: int = 20, min_sentence_length: int = 10, workers: int = 4):
         if corpus.root_corpus_path is None:
             raise UserWarning("No root corpus set!")
         corpus_root_path = corpus.root_corpus_path
+        store_dir = os.path.join(corpus_root_path, Summarizer.store_dir)
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+        # a repeated call only compares the stamps of the root corpus files, nothing is loaded or hashed
+        index_path = Summarizer.root_index_path(store_dir, top_n, min_sentence_length)
+        summary_dict = Summarizer.read_root_index(index_path)
+        if summary_dict is not None:
+            return summary_dict
+
+        root_corpus = Corpus.fast_load(path=corpus_root_path, load_entities=False)
+        summary_paths = Summarizer.summary_store_paths(root_corpus.documents, store_dir, top_n, min_sentence_length)
+
+        # missing entries are taken from the former sent_ids.json, which was computed with the default parameters
         summary_dict_path = os.path.join(corpus_root_path, "sent_ids.json")
-        if not os.path.isfile(summary_dict_path):
-            summary_dict = {}
-            print("train summary")
-            root_corpus = Corpus.fast_load(path=corpus_root_path, load_entities=False)
-            for doc_id, doc in root_corpus.documents.items():
-                sents, ids = Summarizer.generate_summary_of_corpus_doc(doc, 20)
-                # print(doc_id, ":", ids, [' '.join(sent) for sent in sents])
-                summary_dict[doc_id] = ids
-            with open(summary_dict_path, 'w', encoding='utf-8') as fp:
-                json.dump(summary_dict, fp, indent=1)
-        else:
+        missing_doc_ids = [doc_id for doc_id, summary_path in summary_paths.items()
+                           if not os.path.isfile(summary_path)]
+        if len(missing_doc_ids) > 0 and os.path.isfile(summary_dict_path) and top_n == 20 \
+                and min_sentence_length == 10:
             with open(summary_dict_path) as json_file:
-                summary_dict = json.load(json_file)
+                legacy_summary_dict = json.load(json_file)
+            for doc_id in missing_doc_ids:
+                if doc_id in legacy_summary_dict:
+                    Summarizer.write_stored_summary(summary_paths[doc_id], legacy_summary_dict[doc_id])
+
+        summary_dict = Summarizer.stored_summaries(root_corpus.documents, summary_paths, top_n, min_sentence_length,
+                                                   workers)
+        source_files = [os.path.join(corpus_root_path, file_name)
+                        for file_name in ["meta_info.json", Corpus.manifest_name]
+                        if os.path.isfile(os.path.join(corpus_root_path, file_name))]
+        source_files.extend(document.file_path for document in root_corpus.documents.values())
+        Summarizer.write_root_index(index_path, source_files, summary_dict)
+        return summary_dict
+
+    @staticmethod
+    def get_document_summaries(corpus: Corpus, store_dir: str, top_n: int = 20, min_sentence_length: int = 10,
+                               workers: int = 4) -> Dict[str, List[int]]:
+        # summaries of exactly the documents of corpus, also of documents outside the root corpus of the store
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+        summary_paths = Summarizer.summary_store_paths(corpus.documents, store_dir, top_n, min_sentence_length)
+        return Summarizer.stored_summaries(corpus.documents, summary_paths, top_n, min_sentence_length, workers)
+
+    @staticmethod
+    def stored_summaries(documents: Dict[str, Document], summary_paths: Dict[str, str], top_n: int,
+                         min_sentence_length: int, workers: int) -> Dict[str, List[int]]:
+        summary_dict = {doc_id: Summarizer.read_stored_summary(summary_path)
+                        for doc_id, summary_path in summary_paths.items()}
+        missing_doc_ids = [doc_id for doc_id, sent_ids in summary_dict.items() if sent_ids is None]
+        if len(missing_doc_ids) > 0:
+            print(f"train summary for {len(missing_doc_ids)} / {len(summary_dict)} documents")
+            # longest documents first, so no worker is left with a long book at the end
+            missing_doc_ids.sort(key=lambda doc_id: os.path.getsize(documents[doc_id].file_path), reverse=True)
+            summaries = Parallel(n_jobs=workers)(delayed(Summarizer.summarize_to_store)(documents[doc_id],
+                                                                                        summary_paths[doc_id],
+                                                                                        top_n,
+                                                                                        min_sentence_length)
+                                                 for doc_id in tqdm(missing_doc_ids, desc="Summarize documents"))
+            summary_dict.update(zip(missing_doc_ids, summaries))
         return summary_dict
 
     @staticmethod
@@ -1,18 +1,122 @@
+import hashlib
 import json
 import os
+import shutil
 from collections import defaultdict
+from typing import Dict, List
 
 import numpy as np
 import gensim
 from gensim import corpora
 from gensim.models import CoherenceModel
+from scipy.sparse import csr_matrix, diags
 
 from lib2vec.corpus_iterators import TopicModellingIterator
 from lib2vec.corpus_structure import Corpus
-from lib2vec.vectorization_utils import Vectorization
+
+
+class TopicMatrix:
+    # sparse documents x topics and topics x words distributions of one trained LDA model
+    def __init__(self, doc_ids: List[str], doc_topic: csr_matrix, words: List[str], topic_word: csr_matrix,
+                 model_hash: str):
+        self.doc_ids = doc_ids
+        self.doc_rows = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+        self.doc_topic = doc_topic
+        self.words = words
+        self.topic_word = topic_word
+        self.model_hash = model_hash
+        self.similarity_matrix = None
+
+    @staticmethod
+    def from_lda(lda_model, lda_corpus: List, doc_ids: List[str], model_hash: str, top_words: int = 100,
+                 minimum_probability: float = 1e-8, chunk_size: int = 100) -> "TopicMatrix":
+        # batched inference instead of one gensim call per document, normalised as in get_document_topics
+        gammas = [lda_model.inference(lda_corpus[i:i + chunk_size])[0] for i in range(0, len(lda_corpus), chunk_size)]
+        doc_topic = np.vstack(gammas) if len(gammas) > 0 else np.zeros((0, lda_model.num_topics))
+        doc_topic = doc_topic / doc_topic.sum(axis=1, keepdims=True)
+        doc_topic[doc_topic < minimum_probability] = 0
+
+        # only the top words of each topic are kept, columns refer to the words used by any topic
+        topics = lda_model.get_topics()
+        top_word_ids = np.argsort(-topics, axis=1, kind='stable')[:, :top_words]
+        word_ids, columns = np.unique(top_word_ids, return_inverse=True)
+        columns = columns.reshape(top_word_ids.shape)
+        topic_word = csr_matrix((np.take_along_axis(topics, top_word_ids, axis=1).ravel(),
+                                 (np.repeat(np.arange(len(topics)), top_word_ids.shape[1]), columns.ravel())),
+                                shape=(len(topics), len(word_ids)))
+        words = [lda_model.id2word[int(word_id)] for word_id in word_ids]
+        return TopicMatrix([str(doc_id) for doc_id in doc_ids], csr_matrix(doc_topic), words, topic_word, model_hash)
+
+    def save(self, path: str):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as npz_file:
+            np.savez(npz_file, doc_ids=np.array(self.doc_ids), words=np.array(self.words),
+                     model_hash=np.array(self.model_hash),
+                     doc_topic_data=self.doc_topic.data, doc_topic_indices=self.doc_topic.indices,
+                     doc_topic_indptr=self.doc_topic.indptr, doc_topic_shape=np.array(self.doc_topic.shape),
+                     topic_word_data=self.topic_word.data, topic_word_indices=self.topic_word.indices,
+                     topic_word_indptr=self.topic_word.indptr, topic_word_shape=np.array(self.topic_word.shape))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> "TopicMatrix":
+        with np.load(path) as data:
+            doc_topic = csr_matrix((data["doc_topic_data"], data["doc_topic_indices"], data["doc_topic_indptr"]),
+                                   shape=tuple(data["doc_topic_shape"]))
+            topic_word = csr_matrix((data["topic_word_data"], data["topic_word_indices"],
+                                     data["topic_word_indptr"]), shape=tuple(data["topic_word_shape"]))
+            return TopicMatrix(data["doc_ids"].tolist(), doc_topic, data["words"].tolist(), topic_word,
+                               str(data["model_hash"]))
+
+    def topic_words(self, topic: int, top_words: int = 100) -> List[str]:
+        start, end = self.topic_word.indptr[topic], self.topic_word.indptr[topic + 1]
+        order = np.argsort(-self.topic_word.data[start:end], kind='stable')[:top_words]
+        return [self.words[column] for column in self.topic_word.indices[start:end][order]]
+
+    def topic_dict(self, top_topics: int = 5, min_topic_probability: float = 0.05, top_words: int = 100) \
+            -> Dict[str, List[str]]:
+        # the words of the most probable topics of each document, the content facet
+        topic_words = [self.topic_words(topic, top_words) for topic in range(self.topic_word.shape[0])]
+        topic_dict = {}
+        for doc_id, row in self.doc_rows.items():
+            start, end = self.doc_topic.indptr[row], self.doc_topic.indptr[row + 1]
+            order = np.argsort(-self.doc_topic.data[start:end], kind='stable')[:top_topics]
+            topic_dict[doc_id] = [word
+                                  for topic, probability in zip(self.doc_topic.indices[start:end][order],
+                                                                self.doc_topic.data[start:end][order])
+                                  if probability > min_topic_probability
+                                  for word in topic_words[topic]]
+        return topic_dict
+
+    def topic_vectors(self) -> Dict[str, np.ndarray]:
+        dense = self.doc_topic.toarray()
+        return {doc_id: dense[row] for doc_id, row in self.doc_rows.items()}
+
+    def similarities(self, doc_id: str) -> Dict[str, float]:
+        # cosine similarities of all documents, one sparse product for the whole corpus computed once
+        if self.similarity_matrix is None:
+            norms = np.sqrt(np.asarray(self.doc_topic.multiply(self.doc_topic).sum(axis=1)).ravel())
+            norms[norms == 0] = 1
+            normalized = diags(1 / norms) @ self.doc_topic
+            self.similarity_matrix = (normalized @ normalized.T).toarray()
+        sims = self.similarity_matrix[self.doc_rows[str(doc_id)]]
+        return {other_doc_id: float(sims[row]) for other_doc_id, row in self.doc_rows.items()}
 
 
 class TopicModeller:
+    matrix_cache_version = 1
+    lda_lemma = True
+    lda_lower = False
+    lda_parameters = {"num_topics": 15,
+                      "random_state": 100,
+                      "update_every": 1,
+                      "iterations": 50,
+                      "chunksize": 100,
+                      "passes": 50,
+                      "alpha": 'auto',
+                      "minimum_probability": 0.0,
+                      "per_word_topics": True}
+
     @staticmethod
     def compute_coherence_values(dictionary, corpus, texts, limit, start, step, id2word, mallet_path: str = None):
         """
@@ -163,7 +267,7 @@ class TopicModeller:
         return content_aspect_dict, content_aspect_list
 
     @staticmethod
-    def train_lda_mem_eff(corpus: Corpus):
+    def train_lda_mem_eff(corpus: Corpus, topic_words: bool = True):
         # def make_bigrams(texts):
         #     return [bigram_mod[doc] for doc in texts]
         #
@@ -174,8 +278,8 @@ class TopicModeller:
         # c.filter("V")
 
         id2doc_id = {i: doc_id for i, doc_id in enumerate(corpus.documents.keys())}
-        lemma = True
-        lower = False
+        lemma = TopicModeller.lda_lemma
+        lower = TopicModeller.lda_lower
         # print('vocab_start')
         # vocab = set(TokenIterator(corpus, lemma=lemma, lower=lower))
         # print(len(list(vocab)))
@@ -217,17 +321,8 @@ class TopicModeller:
         #                                                             id2word_dict)
         # print(coherence, num_topics)
 
-        lda_model = gensim.models.ldamodel.LdaModel(corpus=corpus,
-                                                    id2word=id2word_dict,
-                                                    num_topics=15,
-                                                    random_state=100,
-                                                    update_every=1,
-                                                    iterations=50,
-                                                    chunksize=100,
-                                                    passes=50,
-                                                    alpha='auto',
-                                                    minimum_probability=0.0,
-                                                    per_word_topics=True)
+        lda_model = gensim.models.ldamodel.LdaModel(corpus=corpus, id2word=id2word_dict,
+                                                    **TopicModeller.lda_parameters)
         # print('calc')
         # os.environ.update({'MALLET_HOME': r'C:/mallet_new/mallet-2.0.8'})
         # mallet_path = "bin\\mallet"
@@ -244,6 +339,8 @@ class TopicModeller:
         # coherence_lda = coherence_model_lda.get_coherence()
         # print('\nCoherence Score: ', coherence_lda)
 
+        if not topic_words:
+            return None, None, lda_model, list(corpus), corpus.doc_ids
         content_aspect_dict = TopicModeller.get_topic_words_for_docs(lda_model, corpus, id2doc_id)
         content_aspect_list = [texts for doc_id, texts in content_aspect_dict.items()]
         # print(content_aspect_list)
@@ -251,50 +348,79 @@ class TopicModeller:
         return content_aspect_dict, content_aspect_list, lda_model, list(corpus), corpus.doc_ids
 
     @staticmethod
-    def topic_modelling(corpus: Corpus):
-        topic_dict_path = os.path.join(corpus.corpus_path, "topic_ids.json")
-        if not os.path.isfile(topic_dict_path):
-            print("train topic model")
-            topic_dict, _, _, _, _ = TopicModeller.train_lda_mem_eff(corpus)
+    def model_hash(corpus: Corpus) -> str:
+        # identifies the LDA model by its training documents and parameters
+        key = json.dumps({"doc_ids": sorted(str(doc_id) for doc_id in corpus.documents.keys()),
+                          "parameters": TopicModeller.lda_parameters,
+                          "version": TopicModeller.matrix_cache_version}, sort_keys=True)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
 
-            with open(topic_dict_path, 'w', encoding='utf-8') as fp:
-                json.dump(topic_dict, fp, indent=1)
-        else:
-            with open(topic_dict_path) as json_file:
-                topic_dict = json.load(json_file)
+    @staticmethod
+    def topic_matrix_path(corpus: Corpus) -> str:
+        return os.path.join(corpus.corpus_path, "topic_matrices", f'{TopicModeller.model_hash(corpus)}.npz')
 
-        return topic_dict
+    @staticmethod
+    def lda_model_path(corpus: Corpus) -> str:
+        # gensim writes the model in several files, so each model gets its own directory
+        return os.path.join(corpus.corpus_path, "topic_matrices", TopicModeller.model_hash(corpus), "lda.model")
+
+    @staticmethod
+    def save_lda_model(lda_model, lda_path: str):
+        model_dir = os.path.dirname(lda_path)
+        tmp_dir = f'{model_dir}.{os.getpid()}.tmp'
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        lda_model.save(os.path.join(tmp_dir, os.path.basename(lda_path)))
+        if os.path.isdir(model_dir):
+            shutil.rmtree(model_dir)
+        os.replace(tmp_dir, model_dir)
+
+    @staticmethod
+    def topic_matrix(corpus: Corpus, overwrite: bool = False) -> TopicMatrix:
+        # written once when the LDA model trains, all topic based features read from it
+        matrix_path = TopicModeller.topic_matrix_path(corpus)
+        lda_path = TopicModeller.lda_model_path(corpus)
+        # the model is kept next to the matrix, topics of new documents are inferred with it
+        if not overwrite and os.path.isfile(matrix_path) and os.path.isfile(lda_path):
+            return TopicMatrix.load(matrix_path)
+        print("train topic model")
+        _, _, lda_model, lda_corpus, doc_ids = TopicModeller.train_lda_mem_eff(corpus, topic_words=False)
+        topic_matrix = TopicMatrix.from_lda(lda_model, lda_corpus, doc_ids, TopicModeller.model_hash(corpus))
+        if not os.path.isdir(os.path.dirname(matrix_path)):
+            os.makedirs(os.path.dirname(matrix_path))
+        TopicModeller.save_lda_model(lda_model, lda_path)
+        topic_matrix.save(matrix_path)
+        return topic_matrix
+
+    @staticmethod
+    def infer_topic_matrix(corpus: Corpus, lda_path: str) -> TopicMatrix:
+        # topics of exactly the documents of corpus under a stored LDA model, words unknown to it are ignored
+        if lda_path is None or not os.path.isfile(lda_path):
+            raise UserWarning(f"No trained LDA model stored at {lda_path}!")
+        lda_model = gensim.models.ldamodel.LdaModel.load(lda_path)
+        lda_corpus = TopicModellingIterator(corpus, lda_model.id2word,
+                                            lemma=TopicModeller.lda_lemma, lower=TopicModeller.lda_lower)
+        bows = list(lda_corpus)
+        return TopicMatrix.from_lda(lda_model, bows, lda_corpus.doc_ids,
+                                    os.path.basename(os.path.dirname(lda_path)))
+
+    @staticmethod
+    def topic_modelling(corpus: Corpus) -> Dict[str, List[str]]:
+        # a topic_ids.json of earlier runs is only used as long as no topic matrix exists
+        topic_dict_path = os.path.join(corpus.corpus_path, "topic_ids.json")
+        if os.path.isfile(topic_dict_path) and not os.path.isfile(TopicModeller.topic_matrix_path(corpus)):
+            with open(topic_dict_path) as json_file:
+                return json.load(json_file)
+        return TopicModeller.topic_matrix(corpus).topic_dict()
 
     @staticmethod
-    def get_topic_distribution(corpus: Corpus, dataset: str, overwrite: bool = False):
-        if overwrite or not os.path.isfile(f'D:/models/topic_vectors/{dataset}.kv'):
-            _, _, topic_model, lda_corpus, doc_ids = TopicModeller.train_lda_mem_eff(corpus)
-            topic_vectors = {}
-            # print(len(lda_corpus))
-            # print(doc_ids)
-            for i, doc_id in enumerate(doc_ids):
-                doc = lda_corpus[i]
-                topic_vectors[doc_id] = np.array([score for (topic, score) in topic_model[doc][0]])
-
-            # print(topic_vectors)
-            Vectorization.my_save_doc2vec_format(fname=f'D:/models/topic_vectors/{dataset}.kv',
-                                                 doctag_vec=topic_vectors)
-
-        topic_vecs, _ = Vectorization.my_load_doc2vec_format(f'D:/models/topic_vectors/{dataset}.kv')
-
-        # print(topic_vecs.docvecs.doctags)
-        # for doctag in topic_vecs.docvecs.doctags:
-        #     print(doctag, topic_vecs.docvecs.most_similar(doctag, topn=None))
-        # print(topic_model[lda_corpus[0]])
-        # for document in topic_model:
-        #     doc_id = ...
-        #     gensim_doc_id = ...
-        #     topic_vectors[doc_id] = topic_model[lda_corpus[gensim_doc_id]]
-        return topic_vecs
+    def get_topic_distribution(corpus: Corpus, overwrite: bool = False) -> TopicMatrix:
+        return TopicModeller.topic_matrix(corpus, overwrite=overwrite)
 
 
 if __name__ == "__main__":
     data_set_name = "classic_gutenberg"
     c = Corpus.load_corpus_from_dir_format(os.path.join(f"corpora/{data_set_name}"))
     # d = TopicModeller.train_lda(c)
-    TopicModeller.get_topic_distribution(c, data_set_name, overwrite=True)
+    TopicModeller.get_topic_distribution(c, overwrite=True)
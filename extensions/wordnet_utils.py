@@ -1,10 +1,18 @@
 import json
+import logging
 import os
-from collections import defaultdict
-from typing import List, Set
+from collections import defaultdict, deque
+from typing import List, Set, Dict, Tuple, Iterable
 
 from nltk.corpus import wordnet as wn
 
+from lib2vec.aux_utils import ConfigLoader
+from lib2vec.corpus_structure import clean_token
+
+
+def single_word_set(words: Set[str]) -> Set[str]:
+    return set([w for w in words if len(w.split()) == 1])
+
 
 class WordNetUtils:
     location_words = None
@@ -34,7 +42,7 @@ class WordNetUtils:
         return set([form.name() for lem in input_word for form in lem.derivationally_related_forms()])
 
     @classmethod
-    def get_location_words(cls) -> Set[str]:
+    def get_location_words(cls, single_words: bool = True) -> Set[str]:
         if not cls.location_words:
             location_categories = [
                 'location.n.01',
@@ -54,12 +62,13 @@ class WordNetUtils:
 
             ]
             cls.location_words = cls.get_wordnet_words(location_categories)
-            cls.location_words = set([w for w in cls.location_words if len(w.split()) == 1])
 
+        if single_words:
+            return single_word_set(cls.location_words)
         return cls.location_words
 
     @classmethod
-    def get_time_words(cls):
+    def get_time_words(cls, single_words: bool = True) -> Set[str]:
         if not cls.time_words:
             time_categories = [
                 'event.n.01',
@@ -76,19 +85,21 @@ class WordNetUtils:
                 'timing.n.01'
             ]
             cls.time_words = cls.get_wordnet_words(time_categories)
-            cls.time_words = set([w for w in cls.time_words if len(w.split()) == 1])
+        if single_words:
+            return single_word_set(cls.time_words)
         return cls.time_words
 
     @classmethod
-    def get_atmosphere_words(cls) -> Set[str]:
+    def get_atmosphere_words(cls, single_words: bool = True) -> Set[str]:
         if not cls.atmosphere_words:
             atmosphere_categories = [
                 'feeling.n.01',
                 'emotion.n.01'
             ]
             cls.atmosphere_words = cls.get_wordnet_words(atmosphere_categories)
-            cls.atmosphere_words = set([w for w in cls.atmosphere_words if len(w.split()) == 1])
 
+        if single_words:
+            return single_word_set(cls.atmosphere_words)
         return cls.atmosphere_words
 
 
@@ -109,7 +120,7 @@ class GermaNetUtils:
         return germanet_category_dict
 
     @classmethod
-    def get_location_words(cls) -> Set[str]:
+    def get_location_words(cls, single_words: bool = True) -> Set[str]:
         if not cls.location_words:
             germanet_nouns = cls.load_germanet_file("nomen.json")
             # print((germanet_nouns.keys()))
@@ -121,11 +132,12 @@ class GermaNetUtils:
             ]
             cls.location_words = set([word.lower() for location in location_categories
                                       for word in germanet_nouns[location]])
-            cls.location_words = set([w for w in cls.location_words if len(w.split()) == 1])
+        if single_words:
+            return single_word_set(cls.location_words)
         return cls.location_words
 
     @classmethod
-    def get_time_words(cls) -> Set[str]:
+    def get_time_words(cls, single_words: bool = True) -> Set[str]:
         if not cls.time_words:
 
             germanet_nouns = cls.load_germanet_file("nomen.json")
@@ -136,11 +148,12 @@ class GermaNetUtils:
                 "Geschehen"
             ]
             cls.time_words = set([word.lower() for time in time_categories for word in germanet_nouns[time]])
-            cls.time_words = set([w for w in cls.time_words if len(w.split()) == 1])
+        if single_words:
+            return single_word_set(cls.time_words)
         return cls.time_words
 
     @classmethod
-    def get_atmosphere_words(cls) -> Set[str]:
+    def get_atmosphere_words(cls, single_words: bool = True) -> Set[str]:
         if not cls.atmosphere_words:
             germanet_adj = cls.load_germanet_file("adj.json")
             # print((germanet_adj.keys()))
@@ -165,53 +178,168 @@ class GermaNetUtils:
                                      for word in germanet_adj[atmosphere]])
 
             cls.atmosphere_words = atmosphere_words
-            cls.atmosphere_words = set([w for w in cls.atmosphere_words if len(w.split()) == 1])
 
+        if single_words:
+            return single_word_set(cls.atmosphere_words)
         return cls.atmosphere_words
 
 
+class PhraseMatcher:
+    """Aho-Corasick automaton over word sequences, finds all multi word expressions in one pass over a text."""
+
+    def __init__(self, phrases: Iterable[Tuple[str, ...]]):
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # lengths of the phrases ending in a state, including those reachable over fail links
+        self.outputs: List[List[int]] = [[]]
+        for phrase in phrases:
+            self.add(phrase)
+        self.build_fail_links()
+
+    def __len__(self):
+        return sum(len(output) for output in self.outputs)
+
+    def add(self, phrase: Tuple[str, ...]):
+        if len(phrase) == 0:
+            return
+        state = 0
+        for word in phrase:
+            next_state = self.transitions[state].get(word)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][word] = next_state
+                self.transitions.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+            state = next_state
+        if len(phrase) not in self.outputs[state]:
+            self.outputs[state].append(len(phrase))
+
+    def build_fail_links(self):
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and word not in self.transitions[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.transitions[fail_state].get(word, 0)
+                self.outputs[next_state].extend(length for length in self.outputs[self.fail[next_state]]
+                                                if length not in self.outputs[next_state])
+
+    def find(self, words: List[str], reset_positions: Iterable[int] = ()) -> List[Tuple[int, int]]:
+        # (start, end) spans of all matches, the automaton is reset at reset_positions (e.g. sentence starts)
+        reset_positions = set(reset_positions)
+        spans = []
+        state = 0
+        for position, word in enumerate(words):
+            if position in reset_positions:
+                state = 0
+            while state and word not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(word, 0)
+            for length in self.outputs[state]:
+                spans.append((position - length + 1, position + 1))
+        return spans
+
+
 class NetWords:
+    # increase when the categories or the word extraction change, older lexicon files are rebuilt then
+    lexicon_version = 1
+    facets = ["location", "time", "atmosphere"]
+    lexicons = {}
+    words = {}
+    phrase_matchers = {}
+
+    @staticmethod
+    def is_german(lan: str) -> bool:
+        return lan.lower() == "de" or lan.lower() == "ger" or lan.lower() == "deutsch" or lan.lower() == "german"
+
+    @classmethod
+    def lexicon_path(cls, lan: str) -> str:
+        config = ConfigLoader.get_config()
+        lexicon_dir = config["system_storage"].get("lexicons",
+                                                   os.path.join(config["system_storage"]["models"], "lexicons"))
+        if not os.path.isdir(lexicon_dir):
+            os.makedirs(lexicon_dir)
+        net_name = "germanet" if cls.is_german(lan) else "wordnet"
+        return os.path.join(lexicon_dir, f'{net_name}_lexicon_v{cls.lexicon_version}.json')
+
+    @classmethod
+    def build_lexicon(cls, lan: str) -> Dict[str, List[str]]:
+        net_utils = GermaNetUtils if cls.is_german(lan) else WordNetUtils
+        lexicon = {"version": cls.lexicon_version,
+                   "location": sorted(net_utils.get_location_words(single_words=False)),
+                   "time": sorted(net_utils.get_time_words(single_words=False)),
+                   "atmosphere": sorted(net_utils.get_atmosphere_words(single_words=False))}
+        lexicon_path = cls.lexicon_path(lan)
+        # joblib workers may build the same lexicon at once, each writes its own temporary file
+        tmp_path = f'{lexicon_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding="utf-8") as json_file:
+            json.dump(lexicon, json_file, ensure_ascii=False)
+        os.replace(tmp_path, lexicon_path)
+        logging.info(f'built lexicon {lexicon_path}')
+        return lexicon
+
+    @classmethod
+    def get_lexicon(cls, lan: str) -> Dict[str, List[str]]:
+        net_name = "germanet" if cls.is_german(lan) else "wordnet"
+        if net_name not in cls.lexicons:
+            lexicon_path = cls.lexicon_path(lan)
+            lexicon = None
+            if os.path.isfile(lexicon_path):
+                with open(lexicon_path, encoding="utf-8") as json_file:
+                    lexicon = json.load(json_file)
+            if lexicon is None or lexicon.get("version") != cls.lexicon_version:
+                lexicon = cls.build_lexicon(lan)
+            cls.lexicons[net_name] = lexicon
+        return cls.lexicons[net_name]
+
+    @classmethod
+    def get_facet_words(cls, lan: str, facet: str) -> Set[str]:
+        key = (cls.is_german(lan), facet)
+        if key not in cls.words:
+            cls.words[key] = single_word_set(cls.get_lexicon(lan)[facet])
+        return cls.words[key]
+
+    @classmethod
+    def get_facet_phrases(cls, lan: str, facet: str) -> PhraseMatcher:
+        key = (cls.is_german(lan), facet)
+        if key not in cls.phrase_matchers:
+            # phrase words are cleaned like the document tokens they are matched against
+            cls.phrase_matchers[key] = PhraseMatcher(tuple(clean_token(word.lower()) for word in expression.split())
+                                                     for expression in cls.get_lexicon(lan)[facet]
+                                                     if len(expression.split()) > 1)
+        return cls.phrase_matchers[key]
+
     @classmethod
     def get_location_words(cls, lan: str) -> Set[str]:
-        if lan.lower() == "de" or lan.lower() == "ger" or lan.lower() == "deutsch" or lan.lower() == "german":
-            return GermaNetUtils.get_location_words()
-        else:
-            return WordNetUtils.get_location_words()
+        return cls.get_facet_words(lan, "location")
 
     @classmethod
     def get_time_words(cls, lan: str) -> Set[str]:
-        if lan.lower() == "de" or lan.lower() == "ger" or lan.lower() == "deutsch" or lan.lower() == "german":
-            return GermaNetUtils.get_time_words()
-        else:
-            return WordNetUtils.get_time_words()
+        return cls.get_facet_words(lan, "time")
 
     @classmethod
     def get_atmosphere_words(cls, lan: str) -> Set[str]:
-        if lan.lower() == "de" or lan.lower() == "ger" or lan.lower() == "deutsch" or lan.lower() == "german":
-            return GermaNetUtils.get_atmosphere_words()
-        else:
-            return WordNetUtils.get_atmosphere_words()
+        return cls.get_facet_words(lan, "atmosphere")
+
+    @classmethod
+    def get_location_phrases(cls, lan: str) -> PhraseMatcher:
+        return cls.get_facet_phrases(lan, "location")
+
+    @classmethod
+    def get_time_phrases(cls, lan: str) -> PhraseMatcher:
+        return cls.get_facet_phrases(lan, "time")
+
+    @classmethod
+    def get_atmosphere_phrases(cls, lan: str) -> PhraseMatcher:
+        return cls.get_facet_phrases(lan, "atmosphere")
 
 
 if __name__ == '__main__':
-    # for w in wn.synsets('swim'):
-    #     hypernyms = w.hypernym_paths()
-    #     print(hypernyms)
-    #     for hypernym in hypernyms[0]:
-    #         print(hypernym, hypernym.hyponyms())
-    # print()
-    # print()
-    # print()
-    #
-    # print('Loc', len(WordNetUtils.get_location_words()))
-    # print('Time', len(WordNetUtils.get_time_words()),  WordNetUtils.get_time_words())
-    # print('Atm', len(WordNetUtils.get_atmosphere_words()))
-    #
-    # print(WordNetUtils.get_variant_words('utility'))
-    print(len(GermaNetUtils.get_location_words()))
-    print(len(GermaNetUtils.get_time_words()))
-    print(len(GermaNetUtils.get_atmosphere_words()))
-
-    print(len(WordNetUtils.get_location_words()))
-    print(len(WordNetUtils.get_time_words()))
-    print(len(WordNetUtils.get_atmosphere_words()))
+    # build the lexicon files once, afterwards no process has to traverse WordNet or GermaNet
+    for language in ["en", "de"]:
+        built_lexicon = NetWords.build_lexicon(language)
+        print(language, {facet: len(built_lexicon[facet]) for facet in NetWords.facets})
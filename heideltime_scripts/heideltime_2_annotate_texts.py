@@ -1,19 +1,39 @@
 import json
-import math
 import os
-import HeidelTime
+from typing import List, Dict, Callable
+
 from bs4 import BeautifulSoup
+from joblib import Parallel, delayed
 from tqdm import tqdm
 
 from lib2vec.corpus_structure import Language, ConfigLoader
 
+# one wrapper per worker process, the HeidelTime start up is paid once per process and language
+_taggers = {}
+
+
+def heideltime_tagger(lan: str):
+    # imported here, so the driver also runs with other tagger factories
+    import HeidelTime
+    return HeidelTime.HeidelTimeWrapper(lan, doc='narratives')
+
+
+def get_tagger(lan: str, tagger_factory: Callable = heideltime_tagger):
+    key = (lan, tagger_factory)
+    if key not in _taggers:
+        _taggers[key] = tagger_factory(lan)
+    return _taggers[key]
+
 
 def get_time_tokens(input_string: str, language: Language):
     lan = "english"
     if language == Language.DE:
         lan = "german"
-    hw = HeidelTime.HeidelTimeWrapper(lan, doc='narratives')
-    soup = BeautifulSoup(str(hw.parse(input_string)), "html.parser")
+    return parse_time_tokens(get_tagger(lan), input_string)
+
+
+def parse_time_tokens(tagger, input_string: str) -> List[str]:
+    soup = BeautifulSoup(str(tagger.parse(input_string)), "html.parser")
     return [i.text for i in soup.find_all('timex3')]
 
 
@@ -31,55 +51,90 @@ def chunks(lst, n):
         yield lst[i:i + n]
 
 
-# def tag_file(input_file_name: str):
-#     lan = "english"
-#     if Language.get_from_str(input_file_name.replace('.txt', '').split('_')[-1]) == Language.DE:
-#         lan = "german"
-#     hw = HeidelTime.HeidelTimeWrapper(lan, doc='narratives')
-#     tagged_tokens = set()
-#     with open(input_file_name, 'r', encoding="utf-8") as file:
-#         print(input_file_name)
-#         lines = file.readlines()
-#         chunked_lines = chunks(lines, 100)
-#         for chunk in chunked_lines:
-#             string_to_parse = '\n'.join(chunk)
-#             # print(string_to_parse)
-#             soup = BeautifulSoup(str(hw.parse(string_to_parse)), "html.parser")
-#             tagged_tokens.update([i.text for i in soup.find_all('timex3')])
-#             # print(tagged_tokens)
-#     return list(tagged_tokens)
-
-def beboop(chunk):
-    string_to_parse = ''.join(chunk)
-    # print(indicator, "/", maximal, input_file_name, i + 1, "/", math.ceil(len(lines) / chunk_size),
-    #       len(string_to_parse))
-    # # print()
-    # print(string_to_parse)
-    soup = BeautifulSoup(str(hw.parse(string_to_parse)), "html.parser")
-    return [i.text for i in soup.find_all('timex3')]
+# successive lines joined up to max_chars characters, longer lines stay alone
+def character_chunks(lines: List[str], max_chars: int = 5000):
+    chunk = []
+    chunk_chars = 0
+    for line in lines:
+        if chunk and chunk_chars + len(line) > max_chars:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_chars = 0
+        chunk.append(line)
+        chunk_chars += len(line)
+    if chunk:
+        yield ''.join(chunk)
 
 
-def tag_file(input_file_name: str, hw: HeidelTime.HeidelTimeWrapper, indicator: int, maximal: int):
+def tag_file(input_file_name: str, hw, max_chars: int = 5000):
     tagged_tokens = set()
     with open(input_file_name, 'r', encoding="utf-8") as file:
-        # print(input_file_name)
         lines = file.readlines()
-        chunk_size = 50
-        chunked_lines = chunks(lines, chunk_size)
-        for i, chunk in enumerate(chunked_lines):
-            string_to_parse = ''.join(chunk)
-            print(indicator, "/", maximal, input_file_name, i+1, "/", math.ceil(len(lines) / chunk_size), len(string_to_parse))
-            # print()
-            # print(string_to_parse)
-            soup = BeautifulSoup(str(hw.parse(string_to_parse)), "html.parser")
-            tagged_tokens.update([i.text for i in soup.find_all('timex3')])
-            # print(tagged_tokens)
-
-        # sets = Parallel(n_jobs=8)(delayed(beboop)(chunk)
-        #                           for i, chunk in enumerate(chunked_lines))
+    for string_to_parse in character_chunks(lines, max_chars):
+        tagged_tokens.update(parse_time_tokens(hw, string_to_parse))
     return list(tagged_tokens)
 
 
+def store_path(store_dir: str, doc_id: str) -> str:
+    return os.path.join(store_dir, f'{doc_id}.json')
+
+
+def tag_document(input_file_path: str, doc_id: str, lan: str, store_dir: str, max_chars: int = 5000,
+                 tagger_factory: Callable = heideltime_tagger) -> str:
+    time_tokens = tag_file(input_file_path, get_tagger(lan, tagger_factory), max_chars)
+    # every document gets its own file, written under a temporary name so an interrupted run leaves no partial entry
+    tmp_path = f'{store_path(store_dir, doc_id)}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding="utf-8") as json_file:
+        json.dump(time_tokens, json_file, ensure_ascii=False)
+    os.replace(tmp_path, store_path(store_dir, doc_id))
+    return doc_id
+
+
+def compact_time_dict(new_dir: str, store_dir: str) -> Dict[str, List[str]]:
+    time_dict_path = os.path.join(new_dir, 'time_dict.json')
+    time_dict = {}
+    if os.path.isfile(time_dict_path):
+        with open(time_dict_path, encoding="utf-8") as json_file:
+            time_dict.update(json.load(json_file))
+    for file_name in sorted(os.listdir(store_dir)):
+        if file_name.endswith('.json'):
+            with open(os.path.join(store_dir, file_name), encoding="utf-8") as json_file:
+                time_dict[file_name[:-len('.json')]] = json.load(json_file)
+    with open(time_dict_path, 'w', encoding="utf-8") as json_file:
+        json.dump(time_dict, json_file, indent=1, ensure_ascii=False)
+    return time_dict
+
+
+def annotate_dir(input_dir: str, lan: str, workers: int = 4, max_chars: int = 5000,
+                 tagger_factory: Callable = heideltime_tagger) -> Dict[str, List[str]]:
+    path_names = [text_file for text_file in os.listdir(input_dir) if text_file.endswith('.txt')]
+    new_dir = os.path.join(input_dir, "out")
+    store_dir = os.path.join(new_dir, "time_store")
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+
+    already_processed = set(file_name[:-len('.json')] for file_name in os.listdir(store_dir)
+                            if file_name.endswith('.json'))
+    time_dict_path = os.path.join(new_dir, 'time_dict.json')
+    if os.path.isfile(time_dict_path):
+        with open(time_dict_path, encoding="utf-8") as json_file:
+            already_processed.update(json.load(json_file).keys())
+
+    tasks = []
+    for path_name in path_names:
+        doc_id = '_'.join(path_name.split('_')[:-1])
+        if doc_id not in already_processed:
+            tasks.append((os.path.join(input_dir, path_name), doc_id))
+    print(f'{len(path_names) - len(tasks)} / {len(path_names)} files already processed')
+
+    # large files first, so the pool does not wait for a single long book at the end
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+    Parallel(n_jobs=workers)(delayed(tag_document)(input_file_path, doc_id, lan, store_dir, max_chars, tagger_factory)
+                             for input_file_path, doc_id in tqdm(tasks, total=len(tasks), desc="Files completed"))
+
+    return compact_time_dict(new_dir, store_dir)
+
+
 if __name__ == "__main__":
     config = ConfigLoader.get_config()
 
@@ -89,38 +144,4 @@ if __name__ == "__main__":
 
     # input_dir = os.path.join(corpora/plain_text/german_series_plain)
     input_dir = os.path.join(config["system_storage"]["corpora"], 'plain_text', f'{corpus_to_annotate}_plain')
-    path_names = [text_file for text_file in os.listdir(input_dir) if text_file.endswith('.txt')]
-    new_dir = os.path.join(input_dir, "out")
-    if not os.path.isdir(new_dir):
-        os.mkdir(new_dir)
-    time_dict = {}
-
-    hw = HeidelTime.HeidelTimeWrapper(lan, doc='narratives')
-    c = 0
-    time_dict_path = os.path.join(new_dir, 'time_dict.json')
-    if not os.path.isfile(time_dict_path):
-        already_processed = set()
-    else:
-        with open(os.path.join(new_dir, 'time_dict.json'), encoding="utf-8") as json_file:
-            old_data = json.load(json_file)
-            already_processed = old_data.keys()
-        time_dict.update(old_data)
-    for path_name in tqdm(path_names, total=len(path_names), desc="Files completed", disable=True):
-        doc_id = '_'.join(path_name.split('_')[:-1])
-        print(doc_id)
-        if str(path_name).endswith('.txt'):
-            if doc_id in already_processed:
-                c += 1
-                continue
-            else:
-                # print(doc_id, already_processed)
-                input_file_path = os.path.join(input_dir, path_name)
-                time_dict[doc_id] = tag_file(input_file_path, hw, c, len(path_names))
-                with open(os.path.join(new_dir, 'time_dict.json'), 'w', encoding="utf-8") as json_file:
-                    json.dump(time_dict, json_file, indent=1, ensure_ascii=False)
-                c += 1
-
-    # print(time_dict)
-
-    with open(os.path.join(new_dir, 'time_dict.json'), 'w', encoding="utf-8") as json_file:
-        json.dump(time_dict, json_file, indent=1, ensure_ascii=False)
+    annotate_dir(input_dir, lan, workers=4)
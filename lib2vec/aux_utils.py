@@ -24,6 +24,15 @@ class ConfigLoader:
             with open(path, encoding="utf-8") as json_file:
                 return json.load(json_file)
 
+        # outside of the repository directories, e.g. in the tests, the configs next to the package are used
+        configs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "configs")
+        for file_name in ["config.json", "default.config.json"]:
+            path = os.path.join(configs_dir, file_name)
+            if os.path.exists(path):
+                logging.info(f'importing config from {path} ...')
+                with open(path, encoding="utf-8") as json_file:
+                    return json.load(json_file)
+
         raise Exception("config file missing!")
 
 
@@ -1,12 +1,16 @@
 import json
+import os
 from collections import defaultdict
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Tuple
 
 import gensim
+import numpy as np
+from joblib import Parallel, delayed
+from tqdm import tqdm
 
 from gensim.corpora import Dictionary
 from gensim.models.doc2vec import TaggedDocument
-from lib2vec.corpus_structure import Corpus, Document
+from lib2vec.corpus_structure import Corpus, Document, clean_token
 from extensions.text_summarisation import Summarizer
 from extensions.wordnet_utils import NetWords
 
@@ -103,6 +107,20 @@ def write_doc_based_aspect_frequency_analyzis(document_aspect_dict: Dict[str, Di
     return document_aspect_dict
 
 
+def window_tokens(facet_ids, doc: Document, window_size: int, lemma: bool, lower: bool,
+                  doc_arrays: Dict[str, np.ndarray]) -> List[str]:
+    if len(facet_ids) == 0:
+        return []
+    if "representations" not in doc_arrays:
+        forms = [token.lemma if lemma else token.text for sentence in doc.sentences for token in sentence.tokens]
+        # same as Token.representation, but cleaned once per distinct form
+        cleaned = {form: clean_token(form.lower() if lower else form) for form in set(forms)}
+        doc_arrays["representations"] = np.array([cleaned[form] for form in forms], dtype=object)
+        doc_arrays["sentence_offsets"] = doc.get_sentence_offsets()
+    positions = doc.get_window_positions(facet_ids, window_size, doc_arrays["sentence_offsets"])
+    return doc_arrays["representations"][positions].tolist()
+
+
 def calculate_facets_of_document(document: Document,
                                  doc_id: str,
                                  disable_aspects: List[str],
@@ -113,22 +131,10 @@ def calculate_facets_of_document(document: Document,
                                  window: int = 0,
                                  use_dictionary_lookup: str = None):
     def windowing(facet_ids, doc: Document, window_size: int):
-        facet_words = []
-        for (sentence_id, token_id) in facet_ids:
-            # print(sentence_id, token_id, facet_ids)
-            sentence = doc.sentences[sentence_id]
-            lower_bound = token_id - window_size
-            upper_bound = token_id + window_size
-            if lower_bound < 0:
-                lower_bound = 0
-            if upper_bound >= len(sentence.tokens):
-                upper_bound = len(sentence.tokens) - 1
-            # print(lower_bound, upper_bound)
-            for i in range(lower_bound, upper_bound + 1):
-                # print(window, i, sentence.tokens[i].representation(lemma=lemma, lower=lower))
-                facet_words.append(sentence.tokens[i].representation(lemma=lemma, lower=lower))
-        # print(window_size, facet_words)
-        return facet_words
+        return window_tokens(facet_ids, doc, window_size, lemma, lower, doc_arrays)
+
+    # token representations and sentence offsets are computed once and shared by all windowed facets
+    doc_arrays = {}
 
     # print('w', window)
     document.load_sentences_from_disk()
@@ -157,7 +163,9 @@ def calculate_facets_of_document(document: Document,
             times.update(document.get_wordnet_matches(time_words,
                                                       as_id=True,
                                                       lemma=lemma,
-                                                      lower=lower))
+                                                      lower=lower,
+                                                      phrase_matcher=NetWords.get_time_phrases(
+                                                          lan=document.language)))
 
         doc_aspects['time'] = windowing(facet_ids=times, doc=document, window_size=window)
         times.clear()
@@ -170,7 +178,9 @@ def calculate_facets_of_document(document: Document,
             locations.update(document.get_wordnet_matches(NetWords.get_location_words(lan=document.language),
                                                           as_id=True,
                                                           lemma=lemma,
-                                                          lower=lower))
+                                                          lower=lower,
+                                                          phrase_matcher=NetWords.get_location_phrases(
+                                                              lan=document.language)))
         doc_aspects['loc'] = windowing(facet_ids=locations, doc=document, window_size=window)
         locations.clear()
     if "raw" not in disable_aspects:
@@ -189,7 +199,9 @@ def calculate_facets_of_document(document: Document,
             atmosphere_words.update(document.get_wordnet_matches(NetWords.get_atmosphere_words(lan=document.language),
                                                                  as_id=True,
                                                                  lemma=lemma,
-                                                                 lower=lower))
+                                                                 lower=lower,
+                                                                 phrase_matcher=NetWords.get_atmosphere_phrases(
+                                                                     lan=document.language)))
 
         doc_aspects['atm'] = windowing(facet_ids=atmosphere_words,
                                        doc=document,
@@ -230,12 +242,101 @@ def calculate_facets_of_document(document: Document,
                                                               }
     document.sentences = None
     document.doc_entities = None
+    document.absolute_positions = None
     # print(doc_aspects.keys())
     # for key in doc_aspects:
     #     print(key, doc_aspects[key][:10])
     return doc_aspects
 
 
+def facets_of_document_or_chunks(document: Document, doc_id: str, chunk_len: Union[None, int],
+                                 facet_args: Dict) -> List[Tuple[str, Dict[str, List[str]]]]:
+    if chunk_len:
+        return [(document_chunk.doc_id, calculate_facets_of_document(document_chunk, doc_id=doc_id, **facet_args))
+                for document_chunk in document.into_chunks(chunk_size=chunk_len)]
+    return [(doc_id, calculate_facets_of_document(document, doc_id=doc_id, **facet_args))]
+
+
+def entries_by_document(facet_dict: Union[None, Dict], doc_ids: List[str]) -> Dict[str, Union[None, Dict]]:
+    # topic and summary entries of each document and its chunks, so a task does not carry the whole corpus dicts
+    if facet_dict is None:
+        return {doc_id: None for doc_id in doc_ids}
+    doc_id_set = set(doc_ids)
+    grouped = {doc_id: {} for doc_id in doc_ids}
+    for key, value in facet_dict.items():
+        base_id = key if key in doc_id_set else '_'.join(key.split('_')[:-1])
+        if base_id in doc_id_set:
+            grouped[base_id][key] = value
+    return grouped
+
+
+def calculate_facets_of_corpus(corpus: Corpus, chunk_len: Union[None, int], workers: int = 1, **facet_args) \
+        -> List[Tuple[str, Dict[str, List[str]]]]:
+    # facets in corpus order, with workers > 1 one task per document which loads its sentences from disk itself
+    if workers == 1:
+        return [entry for doc_id, document in corpus.documents.items()
+                for entry in facets_of_document_or_chunks(document, doc_id, chunk_len, facet_args)]
+    doc_ids = list(corpus.documents.keys())
+    topic_entries = entries_by_document(facet_args["topic_dict"], doc_ids)
+    summary_entries = entries_by_document(facet_args["summary_dict"], doc_ids)
+    facets = Parallel(n_jobs=workers)(delayed(facets_of_document_or_chunks)(
+        document, doc_id, chunk_len, dict(facet_args, topic_dict=topic_entries[doc_id],
+                                          summary_dict=summary_entries[doc_id]))
+        for doc_id, document in tqdm(corpus.documents.items(), total=len(doc_ids), desc="Calculate facets"))
+    return [entry for document_facets in facets for entry in document_facets]
+
+
+class ChunkRegistry:
+    aggregation_strategies = ["mean", "max", "weighted"]
+
+    def __init__(self):
+        # chunk tag -> (base id, offset, length)
+        self.chunks: Dict[str, tuple] = {}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def register(self, chunk_tag: str, base_id: str, offset: int, length: int):
+        self.chunks[chunk_tag] = (base_id, offset, length)
+
+    def aggregate(self, docs_dict: Dict[str, np.ndarray], strategy: str = "mean") -> Dict[str, np.ndarray]:
+        if strategy not in ChunkRegistry.aggregation_strategies:
+            raise UserWarning(f"Not supported chunk aggregation strategy '{strategy}'!")
+        chunk_tags = sorted((chunk_tag for chunk_tag in self.chunks if chunk_tag in docs_dict),
+                            key=lambda chunk_tag: (self.chunks[chunk_tag][0], self.chunks[chunk_tag][1]))
+        if len(chunk_tags) == 0:
+            return {}
+
+        base_ids = [self.chunks[chunk_tag][0] for chunk_tag in chunk_tags]
+        starts = np.array([i for i, base_id in enumerate(base_ids) if i == 0 or base_id != base_ids[i - 1]])
+        vectors = np.array([docs_dict[chunk_tag] for chunk_tag in chunk_tags], dtype=np.float64)
+
+        if strategy == "max":
+            aggregated = np.maximum.reduceat(vectors, starts, axis=0)
+        elif strategy == "weighted":
+            lengths = np.array([max(self.chunks[chunk_tag][2], 1) for chunk_tag in chunk_tags], dtype=np.float64)
+            aggregated = np.add.reduceat(vectors * lengths[:, None], starts, axis=0) / \
+                np.add.reduceat(lengths, starts)[:, None]
+        else:
+            counts = np.diff(np.append(starts, len(chunk_tags)))
+            aggregated = np.add.reduceat(vectors, starts, axis=0) / counts[:, None]
+
+        return {base_ids[start]: vector for start, vector in zip(starts, aggregated)}
+
+    def save(self, save_path: str):
+        with open(f'{save_path}_chunks.json', 'w', encoding='utf-8') as fp:
+            json.dump(self.chunks, fp)
+
+    @staticmethod
+    def load(save_path: str) -> "ChunkRegistry":
+        registry = ChunkRegistry()
+        chunk_path = f'{save_path}_chunks.json'
+        if os.path.isfile(chunk_path):
+            with open(chunk_path, 'r', encoding='utf-8') as fp:
+                registry.chunks = {chunk_tag: tuple(entry) for chunk_tag, entry in json.load(fp).items()}
+        return registry
+
+
 class TokenIterator(object):
     def __init__(self, corpus: Corpus,
                  lemma: bool = False, lower: bool = False):
@@ -316,6 +417,7 @@ class CorpusTaggedSentenceIterator(object):
         self.lemma = lemma
         self.lower = lower
         self.sentence_nr = sentence_nr
+        self.chunk_registry = ChunkRegistry()
 
     def __len__(self):
         return len(self.corpus.documents)
@@ -327,6 +429,7 @@ class CorpusTaggedSentenceIterator(object):
 
         for doc_id, document in self.corpus.documents.items():
             for sent_id, sentence in enumerate(document.get_sentences_from_disk()[:self.sentence_nr]):
+                self.chunk_registry.register(f'{doc_id}_{sent_id}', doc_id, sent_id, len(sentence))
                 yield TaggedDocument(sentence.representation(self.lemma, self.lower), [f'{doc_id}_{sent_id}'])
 
 
@@ -370,6 +473,7 @@ class CorpusTaggedDocumentIterator(object):
         self.lemma = lemma
         self.lower = lower
         self.chunk_len = chunk_len
+        self.chunk_registry = ChunkRegistry()
 
     def __len__(self):
         return len(self.corpus.documents)
@@ -381,6 +485,7 @@ class CorpusTaggedDocumentIterator(object):
                 for i in range(0, len(tokens), self.chunk_len):
                     chunked_tokens = tokens[i:i + self.chunk_len]
                     # print(doc_id, i, len(chunked_tokens), chunked_tokens[:10])
+                    self.chunk_registry.register(f'{doc_id}_{i}', doc_id, i, len(chunked_tokens))
                     yield TaggedDocument(chunked_tokens, [f'{doc_id}_{i}'])
         else:
             for doc_id, document in self.corpus.documents.items():
@@ -429,6 +534,7 @@ class FlairDocumentIterator(object):
         self.lemma = lemma
         self.lower = lower
         self.chunk_len = chunk_len
+        self.chunk_registry = ChunkRegistry()
 
     def __len__(self):
         return len(self.corpus.documents)
@@ -440,6 +546,7 @@ class FlairDocumentIterator(object):
                 for i in range(0, len(tokens), self.chunk_len):
                     chunked_tokens = tokens[i:i + self.chunk_len]
                     # print(doc_id, i, len(chunked_tokens), chunked_tokens[:10])
+                    self.chunk_registry.register(f'{doc_id}_{i}', doc_id, i, len(chunked_tokens))
                     yield f'{doc_id}_{i}', ' '.join(chunked_tokens)
         else:
             for doc_id, document in self.corpus.documents.items():
@@ -452,6 +559,7 @@ class FlairSentenceDocumentIterator(object):
         self.lemma = lemma
         self.lower = lower
         self.sentence_nr = sentence_nr
+        self.chunk_registry = ChunkRegistry()
 
     def __len__(self):
         if self.sentence_nr:
@@ -464,6 +572,7 @@ class FlairSentenceDocumentIterator(object):
     def __iter__(self):
         for doc_id, document in self.corpus.documents.items():
             for i, sentence in enumerate(document.get_sentences_from_disk()[:self.sentence_nr]):
+                self.chunk_registry.register(f'{doc_id}_{i}', doc_id, i, len(sentence))
                 yield f'{doc_id}_{i}', ' '.join(sentence.representation(lemma=self.lemma, lower=self.lower))
 
 
@@ -490,7 +599,7 @@ class CorpusTaggedFacetIterator(object):
     def __init__(self, corpus: Corpus, lemma: bool = False, lower: bool = False, disable_aspects: List[str] = None,
                  topic_dict: Dict = None, summary_dict: Dict = None, chunk_len: int = None,
                  facets_of_chunks: bool = True, window: int = 0, use_dictionary_lookup: str = None,
-                 basic_mode: bool = True):
+                 basic_mode: bool = True, workers: int = 1):
         self.corpus = corpus
         self.lemma = lemma
         self.lower = lower
@@ -505,6 +614,8 @@ class CorpusTaggedFacetIterator(object):
         self.use_dictionary_lookup = use_dictionary_lookup
         self.document_aspects = {}
         self.basic_mode = basic_mode
+        self.workers = workers
+        self.chunk_registry = ChunkRegistry()
 
         self.precalculate_facets()
 
@@ -523,54 +634,21 @@ class CorpusTaggedFacetIterator(object):
             pass
 
     def precalculate_facets(self):
-        if self.chunk_len:
-            if self.facets_of_chunks:
-                for doc_id, document in self.corpus.documents.items():
-                    document_chunks = document.into_chunks(chunk_size=self.chunk_len)
-                    for i, document_chunk in enumerate(document_chunks):
-                        self.document_aspects[document_chunk.doc_id] = calculate_facets_of_document(
-                            document_chunk,
-                            doc_id=doc_id,
-                            disable_aspects=self.disable_aspects,
-                            lemma=self.lemma,
-                            lower=self.lower,
-                            topic_dict=self.topic_dict,
-                            summary_dict=self.summary_dict,
-                            basic_mode=self.basic_mode,
-                            window=self.window,
-                            use_dictionary_lookup=self.use_dictionary_lookup)
-                        self.build_doc_aspects(document_chunk.doc_id, self.document_aspects[document_chunk.doc_id])
-            else:
-                for doc_id, document in self.corpus.documents.items():
-                    self.document_aspects[doc_id] = calculate_facets_of_document(
-                        document,
-                        doc_id=doc_id,
-                        disable_aspects=self.disable_aspects,
-                        lemma=self.lemma,
-                        lower=self.lower,
-                        topic_dict=self.topic_dict,
-                        summary_dict=self.summary_dict,
-                        basic_mode=self.basic_mode,
-                        window=self.window,
-                        use_dictionary_lookup=self.use_dictionary_lookup)
-                    self.build_doc_aspects(doc_id, self.document_aspects[doc_id])
-
-        else:
-            for doc_id, document in self.corpus.documents.items():
-                self.document_aspects[doc_id] = calculate_facets_of_document(
-                    document,
-                    doc_id=doc_id,
-                    disable_aspects=self.disable_aspects,
-                    lemma=self.lemma,
-                    lower=self.lower,
-                    topic_dict=self.topic_dict,
-                    summary_dict=self.summary_dict,
-                    basic_mode=self.basic_mode,
-                    window=self.window,
-                    use_dictionary_lookup=self.use_dictionary_lookup)
-                # self.doc_aspects[doc_id] = {aspect_name: len(document_aspects)
-                #                             for aspect_name, document_aspects in doc_aspects.items()}
-                self.build_doc_aspects(doc_id, self.document_aspects[doc_id])
+        # facets of chunks are calculated per chunk, otherwise on the whole document and chunked on iteration
+        document_facets = calculate_facets_of_corpus(self.corpus,
+                                                     chunk_len=self.chunk_len if self.facets_of_chunks else None,
+                                                     workers=self.workers,
+                                                     disable_aspects=self.disable_aspects,
+                                                     lemma=self.lemma,
+                                                     lower=self.lower,
+                                                     topic_dict=self.topic_dict,
+                                                     summary_dict=self.summary_dict,
+                                                     basic_mode=self.basic_mode,
+                                                     window=self.window,
+                                                     use_dictionary_lookup=self.use_dictionary_lookup)
+        for doc_id, doc_aspects in document_facets:
+            self.document_aspects[doc_id] = doc_aspects
+            self.build_doc_aspects(doc_id, doc_aspects)
 
     def __iter__(self):
         if self.chunk_len:
@@ -578,9 +656,12 @@ class CorpusTaggedFacetIterator(object):
                 for chunked_doc_id in self.document_aspects.keys():
                     for aspect_name, document_aspects in self.document_aspects[chunked_doc_id].items():
                         # print(doc_id, i, len(chunked_aspect), chunked_aspect[:10])
-                        chunked_aspect_doc_id = f"{'_'.join(chunked_doc_id.split('_')[:-1])}_{aspect_name}_" \
-                                                f"{chunked_doc_id.split('_')[-1]}"
+                        chunk_base_id = f"{'_'.join(chunked_doc_id.split('_')[:-1])}_{aspect_name}"
+                        chunk_nr = int(chunked_doc_id.split('_')[-1])
+                        chunked_aspect_doc_id = f"{chunk_base_id}_{chunk_nr}"
                         # chunked_aspect_doc_id = f'{doc_id}_{aspect_name}_{i}'
+                        self.chunk_registry.register(chunked_aspect_doc_id, chunk_base_id, chunk_nr,
+                                                     len(document_aspects))
                         yield TaggedDocument(document_aspects, [chunked_aspect_doc_id])
 
             else:
@@ -589,6 +670,8 @@ class CorpusTaggedFacetIterator(object):
                         for i in range(0, len(document_aspects), self.chunk_len):
                             chunked_aspect = document_aspects[i:i + self.chunk_len]
                             # print(doc_id, i, len(chunked_aspect), chunked_aspect[:10])
+                            self.chunk_registry.register(f'{doc_id}_{aspect_name}_{i}', f'{doc_id}_{aspect_name}',
+                                                         i, len(chunked_aspect))
                             yield TaggedDocument(chunked_aspect, [f'{doc_id}_{aspect_name}_{i}'])
         else:
             for doc_id, document in self.corpus.documents.items():
@@ -665,7 +748,7 @@ class FlairFacetIterator(object):
     def __init__(self, corpus: Corpus, lemma: bool = False, lower: bool = False, disable_aspects: List[str] = None,
                  topic_dict: Dict = None, summary_dict: Dict = None, chunk_len: int = None,
                  facets_of_chunks: bool = True, window: int = 0, use_dictionary_lookup: str = None,
-                 basic_mode: bool = True):
+                 basic_mode: bool = True, workers: int = 1):
         self.corpus = corpus
         self.lemma = lemma
         self.lower = lower
@@ -680,6 +763,8 @@ class FlairFacetIterator(object):
         self.use_dictionary_lookup = use_dictionary_lookup
         self.document_aspects = {}
         self.basic_mode = basic_mode
+        self.workers = workers
+        self.chunk_registry = ChunkRegistry()
         self.precalculate_facets()
 
     def __len__(self):
@@ -695,60 +780,21 @@ class FlairFacetIterator(object):
         return self.doc_aspects[doc_id]
 
     def precalculate_facets(self):
-        if self.chunk_len:
-            if self.facets_of_chunks:
-                for doc_id, document in self.corpus.documents.items():
-                    document_chunks = document.into_chunks(chunk_size=self.chunk_len)
-                    for i, document_chunk in enumerate(document_chunks):
-                        self.document_aspects[document_chunk.doc_id] = calculate_facets_of_document(
-                            document_chunk,
-                            doc_id=doc_id,
-                            disable_aspects=self.disable_aspects,
-                            lemma=self.lemma,
-                            lower=self.lower,
-                            topic_dict=self.topic_dict,
-                            summary_dict=self.summary_dict,
-                            basic_mode=self.basic_mode,
-                            window=self.window,
-                            use_dictionary_lookup=self.use_dictionary_lookup)
-                        # chunked_doc_aspects = {aspect_name: len(document_aspects)
-                        #                        for aspect_name, document_aspects in doc_aspects.items()}
-                        # self.doc_aspects[document_chunk.doc_id] = chunked_doc_aspects
-                        self.build_doc_aspects(document_chunk.doc_id,
-                                               self.document_aspects[document_chunk.doc_id])
-
-            else:
-                for doc_id, document in self.corpus.documents.items():
-                    self.document_aspects[doc_id] = calculate_facets_of_document(
-                        document,
-                        doc_id=doc_id,
-                        disable_aspects=self.disable_aspects,
-                        lemma=self.lemma,
-                        lower=self.lower,
-                        topic_dict=self.topic_dict,
-                        summary_dict=self.summary_dict,
-                        basic_mode=self.basic_mode,
-                        window=self.window,
-                        use_dictionary_lookup=self.use_dictionary_lookup)
-                    # self.doc_aspects[doc_id] = {aspect_name: len(document_aspects)
-                    #                             for aspect_name, document_aspects in doc_aspects.items()}
-                    self.build_doc_aspects(doc_id, self.document_aspects[doc_id])
-        else:
-            for doc_id, document in self.corpus.documents.items():
-                self.document_aspects[doc_id] = calculate_facets_of_document(
-                    document,
-                    doc_id=doc_id,
-                    disable_aspects=self.disable_aspects,
-                    lemma=self.lemma,
-                    lower=self.lower,
-                    topic_dict=self.topic_dict,
-                    summary_dict=self.summary_dict,
-                    basic_mode=self.basic_mode,
-                    window=self.window,
-                    use_dictionary_lookup=self.use_dictionary_lookup)
-                # self.doc_aspects[doc_id] = {aspect_name: len(document_aspects)
-                #                             for aspect_name, document_aspects in doc_aspects.items()}
-                self.build_doc_aspects(doc_id, self.document_aspects[doc_id])
+        # facets of chunks are calculated per chunk, otherwise on the whole document and chunked on iteration
+        document_facets = calculate_facets_of_corpus(self.corpus,
+                                                     chunk_len=self.chunk_len if self.facets_of_chunks else None,
+                                                     workers=self.workers,
+                                                     disable_aspects=self.disable_aspects,
+                                                     lemma=self.lemma,
+                                                     lower=self.lower,
+                                                     topic_dict=self.topic_dict,
+                                                     summary_dict=self.summary_dict,
+                                                     basic_mode=self.basic_mode,
+                                                     window=self.window,
+                                                     use_dictionary_lookup=self.use_dictionary_lookup)
+        for doc_id, doc_aspects in document_facets:
+            self.document_aspects[doc_id] = doc_aspects
+            self.build_doc_aspects(doc_id, doc_aspects)
 
     def __iter__(self):
         if self.chunk_len:
@@ -757,8 +803,11 @@ class FlairFacetIterator(object):
                     for aspect_name, document_aspects in self.document_aspects[chunked_doc_id].items():
                         # print(doc_id, i, len(chunked_aspect), chunked_aspect[:10])
                         # chunked_aspect_doc_id = f'{doc_id}_{aspect_name}_{i}'
-                        chunked_aspect_doc_id = f"{'_'.join(chunked_doc_id.split('_')[:-1])}_{aspect_name}_" \
-                                                f"{chunked_doc_id.split('_')[-1]}"
+                        chunk_base_id = f"{'_'.join(chunked_doc_id.split('_')[:-1])}_{aspect_name}"
+                        chunk_nr = int(chunked_doc_id.split('_')[-1])
+                        chunked_aspect_doc_id = f"{chunk_base_id}_{chunk_nr}"
+                        self.chunk_registry.register(chunked_aspect_doc_id, chunk_base_id, chunk_nr,
+                                                     len(document_aspects))
                         yield chunked_aspect_doc_id, f"{' '.join(self.document_aspects[chunked_doc_id])} ."
 
             else:
@@ -768,6 +817,8 @@ class FlairFacetIterator(object):
                             chunked_aspect = document_aspects[i:i + self.chunk_len]
                             # print(doc_id, i, len(chunked_aspect), chunked_aspect[:10])
                             doc_aspect_id = f'{doc_id}_{aspect_name}_{i}'
+                            self.chunk_registry.register(doc_aspect_id, f'{doc_id}_{aspect_name}', i,
+                                                         len(chunked_aspect))
                             yield doc_aspect_id, f"{' '.join(chunked_aspect)} ."
         else:
             for doc_id, document in self.corpus.documents.items():
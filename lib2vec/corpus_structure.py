@@ -1,3 +1,4 @@
+import hashlib
 import json
 import math
 import os
@@ -5,16 +6,18 @@ import re
 from collections import defaultdict
 from enum import Enum
 import random
+import time
 from typing import Union, List, Dict, Tuple, Set, Generator, Any
 import pandas as pd
 import yaml
-from bs4 import BeautifulSoup
+from lxml import etree
 from tqdm import tqdm
 import spacy
 from os import listdir
 from os.path import isfile, join
 import logging
 import numpy as np
+from joblib import Parallel, delayed
 
 from lib2vec.aux_utils import ConfigLoader, Utils
 from lib2vec.gutenberg_meta import load_gutenberg_meta
@@ -23,6 +26,9 @@ config = ConfigLoader.get_config()
 
 
 class DataHandler:
+    # file hashes of this process, see file_hashes
+    known_file_hashes = {}
+
     @staticmethod
     def build_config_str(number_of_subparts: int, size: int, dataset: str, filter_mode: str,
                          vectorization_algorithm: str, fake_series: str):
@@ -58,9 +64,49 @@ class DataHandler:
 
     @staticmethod
     def parse_func_dta(raw_text: str):
-        raw_text = BeautifulSoup(raw_text, 'xml').select("TEI text body")[0].getText()
+        body = etree.fromstring(raw_text.encode('utf-8')).find('.//{*}text//{*}body')
+        raw_text = ''.join(body.itertext())
         return raw_text.replace("ſ", "s").replace("¬\n", "").replace("\n", " ")
 
+    @staticmethod
+    def parse_dta_meta(doc_path: str) -> Tuple[List[str], List[str]]:
+        # streams the tei file, keeps only title and author elements and frees everything else while parsing
+        titles = []
+        authors = []
+        inside = 0
+        for event, element in etree.iterparse(doc_path, events=('start', 'end')):
+            local_name = etree.QName(element).localname
+            if event == 'start':
+                if local_name in ('title', 'author'):
+                    inside += 1
+                continue
+            if local_name == 'title':
+                inside -= 1
+                parsed_title = ''.join(element.itertext())
+                if parsed_title not in titles:
+                    titles.append(parsed_title)
+            elif local_name == 'author':
+                inside -= 1
+                forename = element.find('.//{*}forename')
+                surname = element.find('.//{*}surname')
+                surname = ''.join(surname.itertext()) if surname is not None else ''
+                if forename is not None:
+                    parsed_author = f'{"".join(forename.itertext())} {surname}'
+                else:
+                    parsed_author = f'{surname}'
+                if parsed_author not in authors:
+                    authors.append(parsed_author)
+            if inside == 0:
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        return titles, authors
+
+    @staticmethod
+    def parse_dta_metas(doc_paths: List[str], workers: int = 4) -> List[Tuple[List[str], List[str]]]:
+        return Parallel(n_jobs=workers)(delayed(DataHandler.parse_dta_meta)(doc_path)
+                                        for doc_path in tqdm(doc_paths, total=len(doc_paths), desc="Parse TEI"))
+
     @staticmethod
     def parse_func_litrec(raw_text: str):
         content = raw_text.replace('\n@\n', ' ').replace('\n', ' ').replace('  ', ' ').replace('  ', ' ')
@@ -75,8 +121,155 @@ class DataHandler:
     def parse_func_pass(raw_text: str):
         return raw_text
 
+    raw_cache_dir = "raw_cache"
+
+    @staticmethod
+    def raw_cache_path(input_str: str) -> str:
+        return os.path.join(config["system_storage"]["corpora"], DataHandler.raw_cache_dir, f'{input_str}.json')
+
+    # data_set_path entries each loader reads, the raw corpus cache is only valid for unchanged files below them
+    raw_sources = {"german_books": ["german_books"],
+                   "tagged_german_books": ["tagged_german_books"],
+                   "german_series": ["german_books"],
+                   "litrec": ["litrec"],
+                   "summaries": ["summaries"],
+                   "dta": ["dta"],
+                   "dta_series": ["dta"],
+                   "goodreads_genres": ["maharjan_goodreads", "gutenberg_meta"],
+                   "classic_gutenberg": ["gutenberg_top_20"]}
+
+    @staticmethod
+    def raw_source_paths(input_str: str) -> Union[List[str], None]:
+        source_paths = [config["data_set_path"].get(key) for key in DataHandler.raw_sources.get(input_str, [])]
+        if len(source_paths) == 0 or any(path is None or not os.path.exists(path) for path in source_paths):
+            return None
+        return source_paths
+
+    @staticmethod
+    def source_stamp(source_paths: List[str]) -> str:
+        # size and mtime of every file, a directory mtime misses edits of the files inside it
+        sha = hashlib.sha1()
+        for source_path in source_paths:
+            if os.path.isfile(source_path):
+                file_paths = [source_path]
+            else:
+                file_paths = sorted(join(root, file_name) for root, _, file_names in os.walk(source_path)
+                                    for file_name in file_names)
+            for file_path in file_paths:
+                stat = os.stat(file_path)
+                sha.update(f'{file_path}\t{stat.st_size}\t{stat.st_mtime_ns}\n'.encode('utf-8'))
+        return sha.hexdigest()
+
+    @staticmethod
+    def file_hash_index_path() -> str:
+        return os.path.join(config["system_storage"]["models"], "file_hashes.json")
+
+    @staticmethod
+    def load_file_hash_index() -> Dict[str, str]:
+        hash_index_path = DataHandler.file_hash_index_path()
+        if not os.path.isfile(hash_index_path):
+            return {}
+        with open(hash_index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def file_hashes(file_paths: List[str], block_size: int = 2 ** 20) -> Dict[str, str]:
+        # sha1 of whole files, remembered per path, size and mtime, so an unchanged file is read only once
+        keys = {}
+        for file_path in file_paths:
+            stat = os.stat(file_path)
+            keys[file_path] = f'{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}'
+        if any(key not in DataHandler.known_file_hashes for key in keys.values()):
+            DataHandler.known_file_hashes.update(DataHandler.load_file_hash_index())
+        new_hashes = {}
+        for file_path, key in keys.items():
+            if key not in DataHandler.known_file_hashes and key not in new_hashes:
+                sha = hashlib.sha1()
+                with open(file_path, 'rb') as f:
+                    for block in iter(lambda: f.read(block_size), b''):
+                        sha.update(block)
+                new_hashes[key] = sha.hexdigest()
+        if len(new_hashes) > 0:
+            DataHandler.known_file_hashes.update(new_hashes)
+            # merged into the latest index and replaced as a whole, a concurrent run at most loses entries
+            hash_index_path = DataHandler.file_hash_index_path()
+            if not os.path.isdir(os.path.dirname(os.path.abspath(hash_index_path))):
+                os.makedirs(os.path.dirname(os.path.abspath(hash_index_path)))
+            hash_index = DataHandler.load_file_hash_index()
+            hash_index.update(new_hashes)
+            tmp_path = f'{hash_index_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(hash_index, f)
+            os.replace(tmp_path, hash_index_path)
+        return {file_path: DataHandler.known_file_hashes[key] for file_path, key in keys.items()}
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        return DataHandler.file_hashes([file_path])[file_path]
+
+    @staticmethod
+    def save_raw_corpus(corpus: "Corpus", cache_path: str, source_stamp: str):
+        # the raw corpus only holds metadata, file paths and the name of the parse function of each document
+        documents = [{"doc_id": doc_id, "text": document.text, "title": document.title,
+                      "language": document.language, "authors": document.authors, "date": document.date,
+                      "genres": document.genres, "file_path": document.file_path,
+                      "parse_fun": document.parse_fun.__name__ if document.parse_fun else None}
+                     for doc_id, document in corpus.documents.items()]
+        data = {"name": corpus.name, "language": corpus.language, "series_dict": corpus.series_dict,
+                "success_dict": corpus.success_dict if isinstance(corpus.success_dict, dict) else None,
+                "source_stamp": source_stamp,
+                "documents": documents}
+        if not os.path.isdir(os.path.dirname(cache_path)):
+            os.makedirs(os.path.dirname(cache_path))
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, cache_path)
+
+    @staticmethod
+    def load_raw_corpus(cache_path: str, source_stamp: str) -> Union["Corpus", None]:
+        if not os.path.isfile(cache_path):
+            return None
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("source_stamp") != source_stamp:
+            logging.info(f'raw corpus cache {cache_path} is outdated')
+            return None
+        documents = {doc["doc_id"]: Document(doc_id=doc["doc_id"],
+                                             text=doc["text"],
+                                             title=doc["title"],
+                                             language=Language.get_from_str(doc["language"]),
+                                             authors=doc["authors"],
+                                             date=doc["date"],
+                                             genres=doc["genres"],
+                                             parse_fun=getattr(DataHandler, doc["parse_fun"])
+                                             if doc["parse_fun"] else None,
+                                             file_path=doc["file_path"])
+                     for doc in data["documents"]}
+        corpus = Corpus(source=documents, name=data["name"], language=data["language"])
+        corpus.set_series_dict(data["series_dict"])
+        corpus.success_dict = data["success_dict"]
+        return corpus
+
     @staticmethod
-    def load_corpus(input_str: str):
+    def load_corpus(input_str: str, use_cache: bool = True):
+        # parsing the raw sources (e.g. the dta xml files) happens once, later calls read the raw corpus cache
+        if not use_cache or input_str == "test_corpus":
+            return DataHandler.load_corpus_from_source(input_str)
+        source_paths = DataHandler.raw_source_paths(input_str)
+        if source_paths is None:
+            logging.info(f'no source paths of {input_str} to validate a raw corpus cache, loading from source')
+            return DataHandler.load_corpus_from_source(input_str)
+        source_stamp = DataHandler.source_stamp(source_paths)
+        cache_path = DataHandler.raw_cache_path(input_str)
+        corpus = DataHandler.load_raw_corpus(cache_path, source_stamp)
+        if corpus is None:
+            corpus = DataHandler.load_corpus_from_source(input_str)
+            DataHandler.save_raw_corpus(corpus, cache_path, source_stamp)
+        return corpus
+
+    @staticmethod
+    def load_corpus_from_source(input_str: str):
         if input_str == "german_books":
             return DataHandler.load_german_books_as_corpus()
         elif input_str == "tagged_german_books":
@@ -144,20 +337,22 @@ class DataHandler:
         # print(book_summary_df[['GENRES']].head())
 
         documents = {}
-        for i, row in tqdm(book_summary_df.iterrows(), total=len(book_summary_df.index), desc="Parse Documents"):
+        rows = zip(book_summary_df.index, book_summary_df["TITLE"], book_summary_df["AUTHORS"],
+                   book_summary_df["DATE"], book_summary_df["TEXT"])
+        for i, title, authors, date, raw_text in tqdm(rows, total=len(book_summary_df.index), desc="Parse Documents"):
             doc_id = f'bs_{i}'
             # try:
             #     genres = '--'.join(ast.literal_eval(row["GENRES"]).values())
             # except ValueError:
             #     genres = None
             genres = None
-            text = DataHandler.raw_text_parse(row["TEXT"], DataHandler.parse_func_pass)
+            text = DataHandler.raw_text_parse(raw_text, DataHandler.parse_func_pass)
             documents[doc_id] = Document(doc_id=doc_id,
                                          text=text,
-                                         title=row["TITLE"],
+                                         title=title,
                                          language=Language.EN,
-                                         authors=row["AUTHORS"],
-                                         date=row["DATE"],
+                                         authors=authors,
+                                         date=date,
                                          genres=genres,
                                          parse_fun=None)
 
@@ -399,7 +594,7 @@ class DataHandler:
         return corpus
 
     @staticmethod
-    def load_dta_as_corpus(path: str = None) -> "Corpus":
+    def load_dta_as_corpus(path: str = None, workers: int = 4) -> "Corpus":
         if path is None:
             input_dir = config["data_set_path"]["dta"]
         else:
@@ -416,60 +611,45 @@ class DataHandler:
             d[f'{author_name}_{title[:-2]}'].append(path_name)
 
         d = {key: path_names for key, path_names in d.items() if len(path_names) > 0}
+        doc_paths = [join(input_dir, path) for paths in d.values() for path in paths]
+        metas = dict(zip(doc_paths, DataHandler.parse_dta_metas(doc_paths, workers=workers)))
+
         series_number = 0
         documents = {}
         series_dict = defaultdict(list)
         for series, paths in d.items():
             for inner_series_nr, path in enumerate(paths):
                 doc_path = join(input_dir, path)
-                with open(doc_path, 'r', encoding="utf-8") as tei:
-                    tei_content = tei.read()
-
-                    soup = BeautifulSoup(tei_content, 'xml')
-                    doc_title = []
-                    for title in soup.find_all('title'):
-                        parsed_title = title.getText()
-                        if parsed_title not in doc_title:
-                            doc_title.append(parsed_title)
-
-                    doc_title = ' '.join(list(doc_title))
-                    if len(doc_title) > 40:
-                        doc_title = ' '.join(doc_title.split()[:20])
-                    print(doc_title)
-                    authors = []
-                    for author in soup.find_all('author'):
-                        try:
-                            parsed_author = f'{author.forename.getText()} {author.surname.getText()}'
-
-                        except AttributeError:
-                            parsed_author = f'{author.surname.getText()}'
-                        if parsed_author not in authors:
-                            authors.append(parsed_author)
-
-                    doc_authors = ', '.join(authors)
-                    # doc_text = soup.select("TEI text body")[0].getText()
-                    # doc_text = doc_text.replace("ſ", "s").replace("¬\n", "").replace("\n", " ")
-
-                    # doc_text = DataHandler.raw_text_parse(tei.read(), DataHandler.parse_func_dta)
-                    doc_text = ""
-
-                    doc_date = path.split('.')[0].split('_')[-1]
-                    doc_id = f"dta_{series_number}_{inner_series_nr}"
-                    # print(doc_id, path, doc_date, doc_title, doc_authors)
-                    # print(doc_text[:100], '---', doc_text[-100:])
-                    doc = Document(doc_id=doc_id,
-                                   text=doc_text,
-                                   title=doc_title,
-                                   language=Language.DE,
-                                   authors=doc_authors,
-                                   date=doc_date,
-                                   genres=None,
-                                   sentences=None,
-                                   parse_fun=DataHandler.parse_func_dta,
-                                   file_path=doc_path)
-
-                    documents[doc_id] = doc
-                    series_dict[f"dta_{series_number}"].append(doc_id)
+                doc_title, authors = metas[doc_path]
+                doc_title = ' '.join(list(doc_title))
+                if len(doc_title) > 40:
+                    doc_title = ' '.join(doc_title.split()[:20])
+                print(doc_title)
+
+                doc_authors = ', '.join(authors)
+                # doc_text = soup.select("TEI text body")[0].getText()
+                # doc_text = doc_text.replace("ſ", "s").replace("¬\n", "").replace("\n", " ")
+
+                # doc_text = DataHandler.raw_text_parse(tei.read(), DataHandler.parse_func_dta)
+                doc_text = ""
+
+                doc_date = path.split('.')[0].split('_')[-1]
+                doc_id = f"dta_{series_number}_{inner_series_nr}"
+                # print(doc_id, path, doc_date, doc_title, doc_authors)
+                # print(doc_text[:100], '---', doc_text[-100:])
+                doc = Document(doc_id=doc_id,
+                               text=doc_text,
+                               title=doc_title,
+                               language=Language.DE,
+                               authors=doc_authors,
+                               date=doc_date,
+                               genres=None,
+                               sentences=None,
+                               parse_fun=DataHandler.parse_func_dta,
+                               file_path=doc_path)
+
+                documents[doc_id] = doc
+                series_dict[f"dta_{series_number}"].append(doc_id)
             series_number += 1
         series_dict = {series_id: doc_ids for series_id, doc_ids in series_dict.items() if len(doc_ids) > 1}
         corpus = Corpus(documents, name="deutsches_text_archiv_belletristik_series", language=Language.DE)
@@ -477,7 +657,7 @@ class DataHandler:
         return corpus
 
     @staticmethod
-    def load_real_series_dta_as_corpus(path: str = None):
+    def load_real_series_dta_as_corpus(path: str = None, workers: int = 4):
         if path is None:
             input_dir = config["data_set_path"]["dta"]
         else:
@@ -494,58 +674,42 @@ class DataHandler:
             d[f'{author_name}_{title[:-2]}'].append(path_name)
 
         d = {key: path_names for key, path_names in d.items() if len(path_names) > 1}
+        doc_paths = [join(input_dir, path) for paths in d.values() for path in paths]
+        metas = dict(zip(doc_paths, DataHandler.parse_dta_metas(doc_paths, workers=workers)))
+
         series_number = 0
         documents = {}
         series_dict = defaultdict(list)
         for series, paths in d.items():
             for inner_series_nr, path in enumerate(paths):
                 doc_path = join(input_dir, path)
-                with open(doc_path, 'r', encoding="utf-8") as tei:
-                    tei_content = tei.read()
-
-                    soup = BeautifulSoup(tei_content, 'xml')
-                    doc_title = []
-                    for title in soup.find_all('title'):
-                        parsed_title = title.getText()
-                        if parsed_title not in doc_title:
-                            doc_title.append(parsed_title)
-                    doc_title = ' '.join(list(doc_title))
-
-                    authors = []
-                    for author in soup.find_all('author'):
-
-                        try:
-                            parsed_author = f'{author.forename.getText()} {author.surname.getText()}'
-
-                        except AttributeError:
-                            parsed_author = f'{author.surname.getText()}'
-                        if parsed_author not in authors:
-                            authors.append(parsed_author)
-
-                    doc_authors = ', '.join(authors)
-                    # doc_text = soup.select("TEI text body")[0].getText()
-                    # doc_text = doc_text.replace("ſ", "s").replace("¬\n", "").replace("\n", " ")
-
-                    # doc_text = DataHandler.raw_text_parse(tei.read(), DataHandler.parse_func_dta)
-                    doc_text = ""
-
-                    doc_date = path.split('.')[0].split('_')[-1]
-                    doc_id = f"dta_{series_number}_{inner_series_nr}"
-                    # print(doc_id, path, doc_date, doc_title, doc_authors)
-                    # print(doc_text[:100], '---', doc_text[-100:])
-                    doc = Document(doc_id=doc_id,
-                                   text=doc_text,
-                                   title=doc_title,
-                                   language=Language.DE,
-                                   authors=doc_authors,
-                                   date=doc_date,
-                                   genres=None,
-                                   sentences=None,
-                                   parse_fun=DataHandler.parse_func_dta,
-                                   file_path=doc_path)
-
-                    documents[doc_id] = doc
-                    series_dict[f"dta_{series_number}"].append(doc_id)
+                doc_title, authors = metas[doc_path]
+                doc_title = ' '.join(list(doc_title))
+
+                doc_authors = ', '.join(authors)
+                # doc_text = soup.select("TEI text body")[0].getText()
+                # doc_text = doc_text.replace("ſ", "s").replace("¬\n", "").replace("\n", " ")
+
+                # doc_text = DataHandler.raw_text_parse(tei.read(), DataHandler.parse_func_dta)
+                doc_text = ""
+
+                doc_date = path.split('.')[0].split('_')[-1]
+                doc_id = f"dta_{series_number}_{inner_series_nr}"
+                # print(doc_id, path, doc_date, doc_title, doc_authors)
+                # print(doc_text[:100], '---', doc_text[-100:])
+                doc = Document(doc_id=doc_id,
+                               text=doc_text,
+                               title=doc_title,
+                               language=Language.DE,
+                               authors=doc_authors,
+                               date=doc_date,
+                               genres=None,
+                               sentences=None,
+                               parse_fun=DataHandler.parse_func_dta,
+                               file_path=doc_path)
+
+                documents[doc_id] = doc
+                series_dict[f"dta_{series_number}"].append(doc_id)
             series_number += 1
         corpus = Corpus(documents, name="deutsches_text_archiv_belletristik_series", language=Language.DE)
         corpus.set_series_dict(series_dict)
@@ -666,15 +830,16 @@ class DataHandler:
         not_found = []
 
         filenames = df[['filename', 'title']].drop_duplicates()
-        for i, row in tqdm(filenames.iterrows(), total=len(filenames.index), disable=True):
+        rows = zip(filenames.index, filenames['filename'], filenames['title'])
+        for i, filename, title in tqdm(rows, total=len(filenames.index), disable=True):
             doc_id = f'lr_{i}'
             try:
                 documents[doc_id] = load_textfile_book(prefix_path=join(corpus_dir, 'books-v11'),
-                                                       suffix_path=row['filename'],
+                                                       suffix_path=filename,
                                                        document_id=doc_id,
-                                                       title=row['title'])
+                                                       title=title)
             except FileNotFoundError:
-                not_found.append((row['title'], row['filename']))
+                not_found.append((title, filename))
         # print(len(not_found))
         return Corpus(source=documents, name="litrec", language=Language.EN)
 
@@ -897,6 +1062,298 @@ class Sentence:
         return self.length
 
 
+class TokenArrays:
+    # columnar form of an annotated document: one entry per token in parallel arrays plus sentence offsets,
+    # Token and Sentence objects are only created when a sentence is accessed
+    __slots__ = 'forms', 'text_ids', 'lemma_ids', 'pos_ids', 'ne_ids', 'punctuation', 'alpha', 'stop', \
+                'sentence_offsets', 'representations'
+
+    def __init__(self, forms: List[str], text_ids: np.ndarray, lemma_ids: np.ndarray, pos_ids: np.ndarray,
+                 ne_ids: np.ndarray, punctuation: np.ndarray, alpha: np.ndarray, stop: np.ndarray,
+                 sentence_offsets: np.ndarray):
+        self.forms = forms
+        self.text_ids = text_ids
+        self.lemma_ids = lemma_ids
+        self.pos_ids = pos_ids
+        self.ne_ids = ne_ids
+        self.punctuation = punctuation
+        self.alpha = alpha
+        self.stop = stop
+        self.sentence_offsets = sentence_offsets
+        self.representations = {}
+
+    @staticmethod
+    def from_doc_file(doc_path: str) -> "TokenArrays":
+        form_ids = {}
+        columns = ([], [], [], [], [], [], [])
+        sentence_offsets = [0]
+        sentence_length = 0
+        with open(doc_path, "r", encoding="utf-8") as file:
+            for line in file.read().split('\n'):
+                if line == '<SENT>':
+                    # same as sentences_from_doc_file: sentences without any non "del" token are dropped
+                    if sentence_length == 0:
+                        for column in columns:
+                            del column[sentence_offsets[-1]:]
+                    elif len(columns[0]) > sentence_offsets[-1]:
+                        sentence_offsets.append(len(columns[0]))
+                    sentence_length = 0
+                    continue
+                if line == '':
+                    continue
+                text, lemma, pos, ne, punctuation, alpha, stop = line.split('\t')
+                if text != "del":
+                    sentence_length += 1
+                for column, form in zip(columns[:4], (text, lemma, pos, ne)):
+                    column.append(form_ids.setdefault(form, len(form_ids)))
+                columns[4].append(punctuation == "1")
+                columns[5].append(alpha == "1")
+                columns[6].append(stop == "1")
+        if sentence_length == 0:
+            for column in columns:
+                del column[sentence_offsets[-1]:]
+        elif len(columns[0]) > sentence_offsets[-1]:
+            sentence_offsets.append(len(columns[0]))
+
+        return TokenArrays(forms=list(form_ids.keys()),
+                           text_ids=np.array(columns[0], dtype=np.int32),
+                           lemma_ids=np.array(columns[1], dtype=np.int32),
+                           pos_ids=np.array(columns[2], dtype=np.int32),
+                           ne_ids=np.array(columns[3], dtype=np.int32),
+                           punctuation=np.array(columns[4], dtype=bool),
+                           alpha=np.array(columns[5], dtype=bool),
+                           stop=np.array(columns[6], dtype=bool),
+                           sentence_offsets=np.array(sentence_offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.text_ids)
+
+    def sentence_count(self) -> int:
+        return len(self.sentence_offsets) - 1
+
+    def form_representations(self, lower: bool = False) -> np.ndarray:
+        # Token.representation for every distinct form, computed once per form instead of once per token
+        if lower not in self.representations:
+            if lower:
+                self.representations[lower] = np.array([clean_token(form.lower()) for form in self.forms],
+                                                       dtype=object)
+            else:
+                self.representations[lower] = np.array([clean_token(form) for form in self.forms], dtype=object)
+        return self.representations[lower]
+
+    def representation(self, lemma: bool = False, lower: bool = False) -> np.ndarray:
+        return self.form_representations(lower)[self.lemma_ids if lemma else self.text_ids]
+
+    def del_mask(self) -> np.ndarray:
+        return self.form_representations(lower=True)[self.text_ids] == 'del'
+
+    def form_mask(self, form_ids: np.ndarray, forms) -> np.ndarray:
+        wanted = np.array([form in forms for form in self.forms], dtype=bool)
+        return wanted[form_ids]
+
+    def filter_mask(self, pos: list = None, focus_stopwords: bool = False, focus_punctuation: bool = False,
+                    focus_ne: bool = False, revert: bool = False) -> np.ndarray:
+        # array version of the filter_condition in Document.get_flat_and_filtered_document_tokens
+        mask = np.ones(len(self), dtype=bool)
+        if focus_stopwords:
+            mask &= ~self.stop if revert else self.stop
+        if focus_punctuation:
+            mask &= ~self.alpha if revert else self.alpha
+        if pos:
+            pos_mask = self.form_mask(self.pos_ids, set(pos))
+            mask &= ~pos_mask if revert else pos_mask
+        if focus_ne:
+            ne_mask = self.form_mask(self.ne_ids, {''}) == False
+            mask &= ~ne_mask if revert else ne_mask
+        return mask
+
+    def flat_tokens(self, lemma: bool = False, lower: bool = False, mask: np.ndarray = None) -> List[str]:
+        representation = self.representation(lemma, lower)
+        if mask is not None:
+            representation = representation[mask]
+        return representation.tolist()
+
+    def masked_tokens(self, mask: np.ndarray, lemma: bool = False, lower: bool = False) -> List[str]:
+        representation = self.representation(lemma, lower).copy()
+        representation[~mask] = 'del'
+        return representation.tolist()
+
+    def token(self, position: int) -> Token:
+        forms = self.forms
+        return Token(text=forms[self.text_ids[position]], lemma=forms[self.lemma_ids[position]],
+                     pos=forms[self.pos_ids[position]], ne=forms[self.ne_ids[position]],
+                     punctuation=bool(self.punctuation[position]), alpha=bool(self.alpha[position]),
+                     stop=bool(self.stop[position]))
+
+    def sentence(self, sentence_id: int) -> Sentence:
+        start, end = self.sentence_offsets[sentence_id], self.sentence_offsets[sentence_id + 1]
+        return Sentence([self.token(position) for position in range(start, end)])
+
+    def sentences(self) -> Generator[Sentence, None, None]:
+        for sentence_id in range(self.sentence_count()):
+            yield self.sentence(sentence_id)
+
+
+class Vocabulary:
+    __slots__ = 'forms', 'form_ids', 'cleaned', 'cleaned_lower', 'tables'
+    file_name = "vocabulary.json"
+
+    def __init__(self, forms: List[str] = None):
+        self.forms: List[str] = []
+        self.form_ids: Dict[str, int] = {}
+        self.cleaned: List[int] = []
+        self.cleaned_lower: List[int] = []
+        self.tables = None
+        if forms:
+            for form in forms:
+                self.add(form)
+
+    def add(self, form: str) -> int:
+        form = str(form)
+        form_id = self.form_ids.get(form)
+        if form_id is not None:
+            return form_id
+        form_id = len(self.forms)
+        self.forms.append(form)
+        self.form_ids[form] = form_id
+        self.cleaned.append(form_id)
+        self.cleaned_lower.append(form_id)
+        self.tables = None
+        # clean_token is idempotent, so interning the derived forms terminates
+        self.cleaned[form_id] = self.add(clean_token(form))
+        self.cleaned_lower[form_id] = self.add(clean_token(form.lower()))
+        return form_id
+
+    def get_id(self, form: str) -> int:
+        return self.form_ids.get(form, -1)
+
+    def get_tables(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.tables is None:
+            self.tables = (np.array(self.cleaned, dtype=np.int32), np.array(self.cleaned_lower, dtype=np.int32))
+        return self.tables
+
+    def representation_ids(self, form_ids: np.ndarray, lower: bool = False) -> np.ndarray:
+        cleaned, cleaned_lower = self.get_tables()
+        if lower:
+            return cleaned_lower[form_ids]
+        return cleaned[form_ids]
+
+    def get_forms(self, form_ids: Union[np.ndarray, List[int]]) -> List[str]:
+        return [self.forms[form_id] for form_id in form_ids]
+
+    def __len__(self):
+        return len(self.forms)
+
+    def save(self, corpus_dir: str, source_stamp: str = None):
+        path = os.path.join(corpus_dir, Vocabulary.file_name)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"source_stamp": source_stamp, "forms": self.forms, "cleaned": self.cleaned,
+                       "cleaned_lower": self.cleaned_lower}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(corpus_dir: str, source_stamp: str = None) -> Union["Vocabulary", None]:
+        path = os.path.join(corpus_dir, Vocabulary.file_name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # a vocabulary saved for other document files misses forms of the current ones
+        if source_stamp is not None and data.get("source_stamp") != source_stamp:
+            return None
+        vocabulary = Vocabulary()
+        vocabulary.forms = data["forms"]
+        vocabulary.form_ids = {form: form_id for form_id, form in enumerate(vocabulary.forms)}
+        vocabulary.cleaned = data["cleaned"]
+        vocabulary.cleaned_lower = data["cleaned_lower"]
+        return vocabulary
+
+
+class DocumentStatistics:
+    dir_name = "statistics"
+
+    @staticmethod
+    def statistics_path(corpus_dir: str, doc_id: str) -> str:
+        return os.path.join(corpus_dir, DocumentStatistics.dir_name, f'{doc_id}.npz')
+
+    @staticmethod
+    def histogram(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        counts = defaultdict(int)
+        for value in values:
+            counts[str(value)] += 1
+        return np.array(list(counts.keys()), dtype=str), np.array(list(counts.values()), dtype=np.int32)
+
+    @staticmethod
+    def from_sentences(sentences: List["Sentence"]) -> Dict[str, np.ndarray]:
+        # same deletion criterion as Document.get_flat_tokens_from_disk
+        tokens = [token for sentence in sentences for token in sentence.tokens
+                  if token.representation(lemma=False, lower=True) != 'del']
+        text_forms, text_counts = DocumentStatistics.histogram([token.text for token in tokens])
+        lemma_forms, lemma_counts = DocumentStatistics.histogram([token.lemma for token in tokens])
+        pos_forms, pos_counts = DocumentStatistics.histogram([str(token.pos).strip() for token in tokens])
+        ne_forms, ne_counts = DocumentStatistics.histogram([str(token.ne).strip() for token in tokens if token.ne])
+        return {
+            "length": np.array(len(tokens), dtype=np.int64),
+            "vocab_size": np.array(len(set(token.representation() for token in tokens)), dtype=np.int64),
+            "sentence_lengths": np.array([len(sentence) for sentence in sentences], dtype=np.int32),
+            "sentence_stopwords": np.array([sum(1 for token in sentence.tokens if token.stop)
+                                            for sentence in sentences], dtype=np.int32),
+            "stopwords": np.array(sum(1 for token in tokens if token.stop), dtype=np.int64),
+            "punctuation": np.array(sum(1 for token in tokens if token.punctuation), dtype=np.int64),
+            "alpha": np.array(sum(1 for token in tokens if token.alpha), dtype=np.int64),
+            "text_forms": text_forms, "text_counts": text_counts,
+            "lemma_forms": lemma_forms, "lemma_counts": lemma_counts,
+            "pos_forms": pos_forms, "pos_counts": pos_counts,
+            "ne_forms": ne_forms, "ne_counts": ne_counts,
+        }
+
+    @staticmethod
+    def save(path: str, statistics: Dict[str, np.ndarray]):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.mkdir(os.path.dirname(path))
+        np.savez_compressed(path, **statistics)
+
+    @staticmethod
+    def load(path: str) -> Union[Dict[str, np.ndarray], None]:
+        if not os.path.isfile(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return {key: data[key] for key in data.files}
+
+    @staticmethod
+    def vocab(statistics: Dict[str, np.ndarray], lemma: bool = False, lower: bool = False) -> Set[str]:
+        forms = statistics["lemma_forms"] if lemma else statistics["text_forms"]
+        if lower:
+            return set(clean_token(str(form).lower()) for form in forms)
+        return set(clean_token(str(form)) for form in forms)
+
+    @staticmethod
+    def aggregate(documents_statistics: List[Dict[str, np.ndarray]]) -> Dict[str, Any]:
+        pos_counts = defaultdict(int)
+        ne_counts = defaultdict(int)
+        vocab = set()
+        for statistics in documents_statistics:
+            for form, count in zip(statistics["pos_forms"], statistics["pos_counts"]):
+                pos_counts[str(form)] += int(count)
+            for form, count in zip(statistics["ne_forms"], statistics["ne_counts"]):
+                ne_counts[str(form)] += int(count)
+            vocab.update(DocumentStatistics.vocab(statistics))
+        tokens = sum(int(statistics["length"]) for statistics in documents_statistics)
+        sentences = sum(len(statistics["sentence_lengths"]) for statistics in documents_statistics)
+        return {"documents": len(documents_statistics),
+                "tokens": tokens,
+                "sentences": sentences,
+                "vocab_size": len(vocab),
+                "stopwords": sum(int(statistics["stopwords"]) for statistics in documents_statistics),
+                "punctuation": sum(int(statistics["punctuation"]) for statistics in documents_statistics),
+                "alpha": sum(int(statistics["alpha"]) for statistics in documents_statistics),
+                "avg_document_length": tokens / len(documents_statistics) if documents_statistics else 0,
+                "avg_sentence_length": tokens / sentences if sentences else 0,
+                "pos": dict(pos_counts),
+                "ne": dict(ne_counts)}
+
+
 class Document:
     __slots__ = 'doc_id', 'text', 'title', 'language', 'authors', 'date', 'genres', 'sentences', \
                 'absolute_positions', 'file_path', 'length', 'vocab_size', 'sentences_nr', 'parse_fun', 'doc_entities'
@@ -913,7 +1370,7 @@ class Document:
         self.genres = genres
 
         # self.sentences: List[Sentence] = sentences  # None
-        self.absolute_positions = {}
+        self.absolute_positions = None
         self.file_path = file_path
 
         self.sentences = None
@@ -962,21 +1419,37 @@ class Document:
     def reset_text_based_on_sentences(self):
         self.text = ' '.join([' '.join(sentence.representation()) for sentence in self.sentences])
 
+    def get_sentence_offsets(self) -> np.ndarray:
+        # start position of every sentence in the flat token sequence, followed by the number of tokens
+        return np.cumsum([0] + [len(sentence.tokens) for sentence in self.sentences], dtype=np.int64)
+
     def build_position_indices(self):
-        c = 0
-        for i, sentence in enumerate(self.sentences):
-            for j, token in enumerate(sentence.tokens):
-                self.absolute_positions[c] = (i, j)
-                c += 1
+        self.absolute_positions = self.get_sentence_offsets()
 
     def get_token_at_doc_position(self, position: int):
-        if len(self.absolute_positions) == 0:
+        if self.absolute_positions is None:
             self.build_position_indices()
-        try:
-            sentence_id, token_id = self.absolute_positions[position]
-        except KeyError:
+        if position < 0 or position >= self.absolute_positions[-1]:
             return None
-        return self.sentences[sentence_id].tokens[token_id]
+        sentence_id = int(np.searchsorted(self.absolute_positions, position, side='right')) - 1
+        return self.sentences[sentence_id].tokens[position - self.absolute_positions[sentence_id]]
+
+    def get_window_positions(self, facet_ids, window_size: int, sentence_offsets: np.ndarray = None) -> np.ndarray:
+        # flat positions of all tokens within window_size of each (sentence_id, token_id), clipped to the sentence,
+        # in the iteration order of facet_ids and with repetitions for overlapping windows
+        if sentence_offsets is None:
+            sentence_offsets = self.get_sentence_offsets()
+        facet_ids = np.array(list(facet_ids), dtype=np.int64).reshape(-1, 2)
+        if len(facet_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        sentence_starts = sentence_offsets[facet_ids[:, 0]]
+        sentence_ends = sentence_offsets[facet_ids[:, 0] + 1]
+        positions = sentence_starts + facet_ids[:, 1]
+        lower_bounds = np.maximum(positions - window_size, sentence_starts)
+        upper_bounds = np.minimum(positions + window_size, sentence_ends - 1)
+        lengths = np.maximum(upper_bounds - lower_bounds + 1, 0)
+        window_starts = np.cumsum(lengths) - lengths
+        return np.repeat(lower_bounds - window_starts, lengths) + np.arange(lengths.sum())
 
     def get_flat_document_tokens(self, lemma: bool = False, lower: bool = False, through_error: bool = True):
         # for doc_id, document in self.documents.items():
@@ -992,15 +1465,18 @@ class Document:
     def get_flat_tokens_from_disk(self, as_list: bool = True, lemma: bool = False, lower: bool = False) -> List[str]:
         if self.file_path is None:
             raise UserWarning(f"No filepath associated with Document {self.doc_id}")
-        return [token.representation(lemma, lower)
-                for sentence in Document.sentences_from_doc_file(self.file_path, as_list=as_list)
-                for token in sentence.tokens if token.representation(lemma=False, lower=True) != 'del']
+        token_arrays = self.get_token_arrays()
+        return token_arrays.flat_tokens(lemma, lower, mask=~token_arrays.del_mask())
 
     def get_flat_and_lda_filtered_tokens(self, lemma: bool = False, lower: bool = False, from_disk: bool = True):
         if from_disk:
-            sentences = self.get_sentences_from_disk()
-        else:
-            sentences = self.sentences
+            token_arrays = self.get_token_arrays()
+            tokens = token_arrays.flat_tokens(lemma, lower, mask=~token_arrays.stop & ~token_arrays.punctuation
+                                              & (token_arrays.form_mask(token_arrays.text_ids, {"del"}) == False))
+            if len(tokens) == 0:
+                raise UserWarning("No sentences set")
+            return tokens
+        sentences = self.sentences
         tokens = [token.representation(lemma, lower)
                   for sentence in sentences
                   for token in sentence.tokens
@@ -1017,42 +1493,13 @@ class Document:
                                                focus_ne: bool = False,
                                                masking: bool = False,
                                                revert: bool = False):
-        def filter_condition(token: Token):
-            if revert:
-                return (not focus_stopwords or not token.stop) \
-                       and (not focus_punctuation or not token.alpha) \
-                       and (not pos or token.pos not in pos) \
-                       and (not focus_ne or not token.ne)
-            else:
-                return (not focus_stopwords or token.stop) \
-                       and (not focus_punctuation or token.alpha) \
-                       and (not pos or token.pos in pos) \
-                       and (not focus_ne or token.ne)
-
-        def mask(input_token: Token):
-            output_token = Token(text=input_token.text,
-                                 lemma=input_token.lemma,
-                                 pos=input_token.pos,
-                                 ne=input_token.ne,
-                                 punctuation=input_token.punctuation,
-                                 alpha=input_token.alpha,
-                                 stop=input_token.stop)
-            if not filter_condition(output_token):
-                output_token.text = "del"
-                output_token.lemma = "del"
-            return output_token
-
-        # for doc_id, document in self.documents.items():
-        #     print(document.sentences[1].tokens)
+        token_arrays = self.get_token_arrays()
+        mask = token_arrays.filter_mask(pos=pos, focus_stopwords=focus_stopwords,
+                                        focus_punctuation=focus_punctuation, focus_ne=focus_ne, revert=revert)
         if not masking:
-            tokens = [token.representation(lemma, lower)
-                      for sentence in self.get_sentences_from_disk()
-                      for token in sentence.tokens
-                      if filter_condition(token)]
+            tokens = token_arrays.flat_tokens(lemma, lower, mask=mask)
         else:
-            tokens = [mask(token).representation(lemma, lower)
-                      for sentence in self.get_sentences_from_disk()
-                      for token in sentence.tokens]
+            tokens = token_arrays.masked_tokens(mask, lemma, lower)
 
         if len(tokens) == 0:
             raise UserWarning("No sentences set")
@@ -1079,17 +1526,10 @@ class Document:
                        and (not focus_ne or token.ne)
 
         def mask(input_token: Token):
-            output_token = Token(text=input_token.text,
-                                 lemma=input_token.lemma,
-                                 pos=input_token.pos,
-                                 ne=input_token.ne,
-                                 punctuation=input_token.punctuation,
-                                 alpha=input_token.alpha,
-                                 stop=input_token.stop)
-            if not filter_condition(output_token):
-                output_token.text = "del"
-                output_token.lemma = "del"
-            return output_token
+            # a masked token is represented as "del" in every representation, no copy is needed
+            if not filter_condition(input_token):
+                return "del"
+            return input_token.representation(lemma, lower)
 
         # for doc_id, document in self.documents.items():
         #     print(document.sentences[1].tokens)
@@ -1105,7 +1545,7 @@ class Document:
                           for token in sentence.tokens
                           if filter_condition(token)]
         else:
-            tokens = [mask(token).representation(lemma, lower)
+            tokens = [mask(token)
                       for sentence in self.sentences
                       for token in sentence.tokens]
 
@@ -1120,6 +1560,11 @@ class Document:
     def get_sentences_from_disk(self, as_list: bool = True) -> List[Sentence]:
         return Document.sentences_from_doc_file(self.file_path, as_list=as_list)
 
+    def get_token_arrays(self) -> TokenArrays:
+        if self.file_path is None:
+            raise UserWarning(f"No filepath associated with Document {self.doc_id}")
+        return TokenArrays.from_doc_file(self.file_path)
+
     def get_text_from_disk(self):
         if self.parse_fun is None:
             raise UserWarning("No parsing function defined for document!")
@@ -1131,6 +1576,10 @@ class Document:
                   remove_stopwords: bool = False, remove_punctuation: bool = False, lda_mode: bool = True) -> Set[str]:
         if lda_mode:
             return set(self.get_flat_and_lda_filtered_tokens(lemma=lemma, lower=lower, from_disk=from_disk))
+        if from_disk and not remove_stopwords and not remove_punctuation:
+            statistics = self.load_statistics()
+            if statistics is not None:
+                return DocumentStatistics.vocab(statistics, lemma=lemma, lower=lower)
         if from_disk:
             if remove_stopwords or remove_punctuation:
                 return set(self.get_flat_and_filtered_tokens_from_disk(lemma=lemma, lower=lower,
@@ -1148,6 +1597,37 @@ class Document:
             else:
                 return set(self.get_flat_document_tokens(lemma=lemma, lower=lower))
 
+    def get_token_ids(self, vocabulary: Vocabulary, lemma: bool = False, lower: bool = False,
+                      from_disk: bool = True) -> np.ndarray:
+        if from_disk or self.sentences is None or len(self.sentences) == 0:
+            token_arrays = self.get_token_arrays()
+            forms = token_arrays.forms
+            text_ids = token_arrays.text_ids
+            form_ids = token_arrays.lemma_ids if lemma else text_ids
+        else:
+            # document local ids first, the vocabulary is only asked once per distinct form
+            local_ids = {}
+            tokens = [token for sentence in self.sentences for token in sentence.tokens]
+            text_ids = np.fromiter((local_ids.setdefault(token.text, len(local_ids)) for token in tokens),
+                                   dtype=np.int32, count=len(tokens))
+            if lemma:
+                form_ids = np.fromiter((local_ids.setdefault(token.lemma, len(local_ids)) for token in tokens),
+                                       dtype=np.int32, count=len(tokens))
+            else:
+                form_ids = text_ids
+            forms = list(local_ids.keys())
+        # only text and lemma forms are interned, pos and ne tags of the disk format stay out of the vocabulary
+        used_ids = np.unique(np.concatenate([text_ids, form_ids]))
+        vocab_ids = np.full(len(forms), -1, dtype=np.int32)
+        vocab_ids[used_ids] = [vocabulary.add(forms[form_id]) for form_id in used_ids]
+        # same deletion criterion as get_flat_tokens_from_disk
+        keep = vocabulary.representation_ids(vocab_ids[text_ids], lower=True) != vocabulary.get_id('del')
+        return vocabulary.representation_ids(vocab_ids[form_ids[keep]], lower=lower)
+
+    def get_vocab_ids(self, vocabulary: Vocabulary, lemma: bool = False, lower: bool = False,
+                      from_disk: bool = True) -> np.ndarray:
+        return np.unique(self.get_token_ids(vocabulary, lemma=lemma, lower=lower, from_disk=from_disk))
+
     def __str__(self):
         return f'{self.authors} ({self.date}): {self.title[:50]}'
 
@@ -1156,7 +1636,25 @@ class Document:
     def __len__(self):
         return self.length  # sum((len(sentence) for sentence in self.sentences))
 
+    def get_statistics_path(self) -> Union[str, None]:
+        if self.file_path is None:
+            return None
+        return DocumentStatistics.statistics_path(os.path.dirname(self.file_path), self.doc_id)
+
+    def load_statistics(self) -> Union[Dict[str, np.ndarray], None]:
+        statistics_path = self.get_statistics_path()
+        if statistics_path is None:
+            return None
+        return DocumentStatistics.load(statistics_path)
+
     def calculate_sizes(self, from_file: bool = False, through_error: bool = True):
+        if from_file:
+            statistics = self.load_statistics()
+            if statistics is not None:
+                self.length = int(statistics["length"])
+                self.vocab_size = int(statistics["vocab_size"])
+                self.sentences_nr = len(statistics["sentence_lengths"])
+                return
         self.sentences_nr = len(self.sentences)
         if from_file:
             tokens = self.get_flat_tokens_from_disk()
@@ -1198,8 +1696,10 @@ class Document:
                 writer.write("<SENT>\n")
         return doc_path
 
-    def check_if_doc_at_path(self, corpus_dir: str):
-        files = [f for f in listdir(corpus_dir) if isfile(join(corpus_dir, f))]
+    def check_if_doc_at_path(self, corpus_dir: str, files: List[str] = None):
+        # pass a precomputed directory listing when checking many documents
+        if files is None:
+            files = [f for f in listdir(corpus_dir) if isfile(join(corpus_dir, f))]
 
         doc_path = f'{self.meta_string_representation_wo_length()}'
         for file in files:
@@ -1214,13 +1714,12 @@ class Document:
                              for token_ln in sentence_string.split('\n')
                              if token_ln != '' and token_ln is not None and token_ln != '\n'])
 
+        if not as_list:
+            # sentences are created lazily from the token arrays
+            return TokenArrays.from_doc_file(doc_path).sentences()
         with open(doc_path, "r", encoding="utf-8") as file:
-            if as_list:
-                sentences = [parse_sentence(sentence) for sentence in file.read().split('<SENT>')]
-                sentences = [sentence for sentence in sentences if len(sentence) > 0]
-            else:
-                sentences = (parse_sentence(sentence) for sentence in file.read().split('<SENT>'))
-                sentences = (sentence for sentence in sentences if len(sentence) > 0)
+            sentences = [parse_sentence(sentence) for sentence in file.read().split('<SENT>')]
+            sentences = [sentence for sentence in sentences if len(sentence) > 0]
         return sentences
 
     @staticmethod
@@ -1230,9 +1729,8 @@ class Document:
         return text
 
     @staticmethod
-    def create_document_from_doc_file(doc_path: str, disable_sentences: bool = False):
-        fn = os.path.basename(doc_path)
-        splitted_meta = fn.replace('.txt', '').split('_-_')
+    def meta_from_file_name(file_name: str) -> Dict[str, Union[str, None]]:
+        splitted_meta = file_name.replace('.txt', '').split('_-_')
 
         if len(splitted_meta) == 6:
             doc_id, authors, title, language, genres, date = splitted_meta
@@ -1258,6 +1756,21 @@ class Document:
         if date == "None":
             date = None
 
+        return {"doc_id": doc_id, "authors": authors, "title": title, "language": language, "genres": genres,
+                "date": date, "length": length, "vocab_size": vocab_size, "sentence_nr": sentence_nr}
+
+    @staticmethod
+    def create_document_from_meta(meta: Dict[str, Union[str, None]], doc_path: str, sentences: List[Sentence] = None):
+        return Document(doc_id=meta["doc_id"], text="", title=meta["title"],
+                        language=Language.get_from_str(meta["language"]),
+                        authors=meta["authors"], date=meta["date"], genres=meta["genres"], sentences=sentences,
+                        file_path=doc_path,
+                        length=meta["length"], vocab_size=meta["vocab_size"], sentence_nr=meta["sentence_nr"])
+
+    @staticmethod
+    def create_document_from_doc_file(doc_path: str, disable_sentences: bool = False):
+        meta = Document.meta_from_file_name(os.path.basename(doc_path))
+
         if disable_sentences:
             sentences = []
         else:
@@ -1266,9 +1779,7 @@ class Document:
         # text = None
         # text = ' '.join([' '.join(sentence.representation()) for sentence in sentences])
         # print('vals', vocab_size, length, sentence_nr)
-        return Document(doc_id=doc_id, text="", title=title, language=Language.get_from_str(language),
-                        authors=authors, date=date, genres=genres, sentences=sentences, file_path=doc_path,
-                        length=length, vocab_size=vocab_size, sentence_nr=sentence_nr)
+        return Document.create_document_from_meta(meta, doc_path, sentences)
 
     def get_document_entities_representation(self, lemma=False, lower=False, as_id=False):
         if as_id:
@@ -1282,27 +1793,31 @@ class Document:
 
     def get_wordnet_matches(self, wordnet_input: Set[str], as_id: bool = False,
                             lemma: bool = False,
-                            lower: bool = False):
-        matches = []
+                            lower: bool = False,
+                            phrase_matcher=None):
+        # lookup per distinct lemma instead of per token, multi word expressions are found by the phrase matcher
+        tokens = [token for sentence in self.sentences for token in sentence.tokens]
+        if len(tokens) == 0:
+            return []
+        form_ids = {}
+        token_form_ids = np.fromiter((form_ids.setdefault(token.lemma, len(form_ids)) for token in tokens),
+                                     dtype=np.int64, count=len(tokens))
+        # single words and phrases are matched on the same cleaned lower case forms
+        cleaned_forms = [clean_token(form.lower()) for form in form_ids]
+        form_matches = np.array([form in wordnet_input for form in cleaned_forms], dtype=bool)
+        matched = form_matches[token_form_ids]
+
+        sentence_offsets = self.get_sentence_offsets()
+        if phrase_matcher is not None and len(phrase_matcher) > 0:
+            for start, end in phrase_matcher.find([cleaned_forms[form_id] for form_id in token_form_ids],
+                                                  reset_positions=sentence_offsets[:-1].tolist()):
+                matched[start:end] = True
+
+        positions = np.flatnonzero(matched)
         if as_id:
-            for i, sentence in enumerate(self.sentences):
-                for j, token in enumerate(sentence.tokens):
-                    if token.representation(lemma=True, lower=True) in wordnet_input:
-                        matches.append((i, j))
-
-        else:
-            try:
-                for sentence in self.sentences:
-                    for j, token in sentence.tokens:
-                        if token.representation(lemma=True, lower=True) in wordnet_input:
-                            matches.append(token.representation(lemma=lemma, lower=lower))
-            except TypeError:
-                for sentence in self.sentences:
-                    for token in sentence.tokens:
-                        if token.representation(lemma=True, lower=True) in wordnet_input:
-                            matches.append(token.representation(lemma=lemma, lower=lower))
-
-        return matches
+            sentence_ids = np.searchsorted(sentence_offsets, positions, side='right') - 1
+            return list(zip(sentence_ids.tolist(), (positions - sentence_offsets[sentence_ids]).tolist()))
+        return [tokens[position].representation(lemma=lemma, lower=lower) for position in positions]
 
     def into_chunks(self, chunk_size: int):
         def flush_chunk():
@@ -1355,10 +1870,82 @@ class Document:
         self.sentences = []
 
 
+class DoctagParser:
+    prefix = '*dt_'
+
+    def __init__(self, doc_ids: List[str] = None):
+        # without known doc ids the last id part is interpreted as chunk or facet
+        self.doc_ids = set(str(doc_id) for doc_id in doc_ids) if doc_ids is not None else None
+        self.records: Dict[str, Union[Tuple[str, Union[int, None], Union[str, None]], None]] = {}
+
+    def parse(self, doctag: str) -> Union[Tuple[str, Union[int, None], Union[str, None]], None]:
+        doctag = str(doctag)
+        try:
+            return self.records[doctag]
+        except KeyError:
+            pass
+
+        tag = doctag[len(DoctagParser.prefix):] if doctag.startswith(DoctagParser.prefix) else doctag
+        parts = tag.split('_')
+        if self.doc_ids is None:
+            split_at = max(len(parts) - 1, 1)
+        else:
+            split_at = None
+            for end in range(len(parts), 0, -1):
+                if '_'.join(parts[:end]) in self.doc_ids:
+                    split_at = end
+                    break
+            if split_at is None:
+                self.records[doctag] = None
+                return None
+
+        doc_id = '_'.join(parts[:split_at])
+        rest = parts[split_at:]
+        chunk = None
+        if len(rest) > 0 and rest[-1].isdigit():
+            chunk = int(rest[-1])
+            rest = rest[:-1]
+        facet = '_'.join(rest) if len(rest) > 0 else None
+
+        record = (doc_id, chunk, facet)
+        self.records[doctag] = record
+        return record
+
+    def in_corpus(self, doctag: str) -> bool:
+        return self.parse(doctag) is not None
+
+    def base_id(self, doctag: str) -> Union[str, None]:
+        record = self.parse(doctag)
+        if record is None:
+            return None
+        doc_id, _, facet = record
+        if facet:
+            return f'{doc_id}_{facet}'
+        return doc_id
+
+    def group_by_base_id(self, doctags) -> Dict[str, List[str]]:
+        groups = defaultdict(list)
+        for doctag in doctags:
+            base_id = self.base_id(doctag)
+            if base_id is not None:
+                groups[base_id].append(doctag)
+        return groups
+
+    def group_by_document(self, doctags) -> Dict[str, List[str]]:
+        groups = defaultdict(list)
+        for doctag in doctags:
+            record = self.parse(doctag)
+            if record is not None:
+                groups[record[0]].append(doctag)
+        return groups
+
+
 class Corpus:
+    manifest_name = "manifest.jsonl"
     __slots__ = 'name', 'language', 'document_entities', 'series_dict', 'root_corpus_path', 'corpus_path', \
                 'shared_attributes_dict', \
-                'reversed_attributes_dict', 'success_dict', 'documents', 'file_dict'
+                'reversed_attributes_dict', 'success_dict', 'documents', 'file_dict', 'vocabulary', \
+                'doctag_parser', 'statistics'
 
     def __init__(self, source: Union[Dict[Union[str, int], Document], List[Document], str],
                  name: str = None,
@@ -1373,12 +1960,21 @@ class Corpus:
         self.success_dict = None,
         self.file_dict = None
         self.corpus_path = None
+        self.vocabulary = None
+        self.doctag_parser = None
+        self.statistics = None
 
         # self.corpus_storage_path = None
         if isinstance(source, str):
             # documents = self.load_corpus_documents(path=source)
             logging.info(f'try to load serialized corpus file {source}')
-            if source.endswith('.json'):
+            if source.endswith('.jsonl'):
+                documents, name, language, document_entities, series_dict = self.load_corpus_stream(path=source)
+                self.name = name
+                self.language = language
+                self.document_entities = document_entities
+                self.series_dict = series_dict
+            elif source.endswith('.json'):
                 documents, name, language, document_entities, series_dict = self.load_corpus(path=source)
                 self.name = name
                 self.language = language
@@ -1422,46 +2018,223 @@ class Corpus:
                       name=f'{self.name}_top{n}')
 
     def save_corpus(self, path: str):
-        document_data = {doc_id: doc.__dict__ for doc_id, doc in self.documents.items()}
-        data = {"name": self.name, "language": self.language,
-                "documents": document_data,
-                "document_entities": self.document_entities,
-                "series_dict": self.series_dict}
-        # data = {doc.doc_id: doc.__dict__ for doc in self.get_documents()}
-
-        with open(f'{path}.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=1, default=lambda o: o.__dict__)
+        # json lines with one document per line plus a small index, so neither writing nor reading
+        # needs more than a single document in memory
+        index = {"name": self.name, "language": self.language, "series_dict": self.series_dict, "documents": []}
+        # binary mode, so tell() gives the byte offsets iter_corpus_stream seeks to
+        with open(f'{path}.jsonl', 'wb') as f:
+            for doc_id, document in tqdm(self.documents.items(), total=len(self.documents), desc="save corpus",
+                                         disable=False):
+                if document.sentences is None or len(document.sentences) == 0:
+                    sentences = document.get_sentences_from_disk()
+                else:
+                    sentences = document.sentences
+                line = json.dumps({"doc_id": doc_id, "text": document.text,
+                                   "sentences": [[token.get_save_file_representation() for token in sentence.tokens]
+                                                 for sentence in sentences]}, ensure_ascii=False)
+                index["documents"].append({"doc_id": doc_id, "authors": document.authors, "title": document.title,
+                                           "language": document.language, "genres": document.genres,
+                                           "date": document.date,
+                                           "length": sum((len(sentence) for sentence in sentences)),
+                                           "vocab_size": len(set([token for sentence in sentences
+                                                                  for token in sentence.tokens])),
+                                           "sentence_nr": len(sentences),
+                                           "offset": f.tell()})
+                f.write(f'{line}\n'.encode('utf-8'))
+        with open(f'{path}_index.json', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
         logging.info(f'saved {path}')
 
+    @staticmethod
+    def stream_path(path: str) -> str:
+        if path.endswith('.jsonl'):
+            return path[:-len('.jsonl')]
+        if path.endswith('.json'):
+            return path[:-len('.json')]
+        return path
+
+    @staticmethod
+    def read_corpus_index(path: str) -> Dict[str, Any]:
+        with open(f'{Corpus.stream_path(path)}_index.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def iter_corpus_stream(path: str, doc_ids: List[str] = None, metadata_only: bool = False) \
+            -> Generator[Document, None, None]:
+        path = Corpus.stream_path(path)
+        entries = Corpus.read_corpus_index(path)["documents"]
+        if doc_ids is not None:
+            doc_ids = set(doc_ids)
+            entries = [entry for entry in entries if entry["doc_id"] in doc_ids]
+        if metadata_only:
+            for entry in entries:
+                yield Document.create_document_from_meta(entry, doc_path=None)
+            return
+
+        with open(f'{path}.jsonl', 'rb') as f:
+            for entry in entries:
+                # entries are in file order, the seek only skips documents that are not requested
+                f.seek(entry["offset"])
+                data = json.loads(f.readline().decode('utf-8'))
+                sentences = [Sentence([Token.parse_text_file_token_representation(token) for token in sentence])
+                             for sentence in data["sentences"]]
+                document = Document.create_document_from_meta(entry, doc_path=None, sentences=sentences)
+                document.text = data["text"]
+                yield document
+
+    @staticmethod
+    def load_corpus_stream(path: str, doc_ids: List[str] = None, metadata_only: bool = False):
+        logging.info(f"load {path}")
+        index = Corpus.read_corpus_index(path)
+        documents = {}
+        document_entities = None if metadata_only else {}
+        for document in Corpus.iter_corpus_stream(path, doc_ids=doc_ids, metadata_only=metadata_only):
+            if not metadata_only:
+                document.set_entities()
+                document_entities[document.doc_id] = document.doc_entities
+            documents[document.doc_id] = document
+
+        if index["series_dict"] is None:
+            series_dict = defaultdict(list)
+        else:
+            series_dict = defaultdict(list, index["series_dict"])
+        logging.info(f"{path} loaded")
+
+        return documents, index["name"], index["language"], document_entities, series_dict
+
+    @staticmethod
+    def stream_to_dir_format(path: str, corpus_dir: str):
+        # writes one document after another, the metadata corpus holds no sentences
+        if not os.path.isdir(corpus_dir):
+            os.mkdir(corpus_dir)
+        for document in tqdm(Corpus.iter_corpus_stream(path), desc="save corpus", disable=False):
+            document.store_to_corpus_file(corpus_dir)
+            document.sentences = None
+        documents, name, language, _, series_dict = Corpus.load_corpus_stream(path, metadata_only=True)
+        corpus = Corpus(source=documents, name=name, language=language)
+        corpus.set_series_dict(series_dict)
+        corpus.save_corpus_meta(corpus_dir)
+
+    @staticmethod
+    def migrate_json_corpus(json_path: str, remove_old: bool = False) -> str:
+        # the legacy monolith has to be parsed once as a whole, afterwards only the stream format is read
+        path = Corpus.stream_path(json_path)
+        documents, name, language, _, series_dict = Corpus.load_corpus(f'{path}.json')
+        corpus = Corpus(source=documents, name=name, language=language)
+        corpus.set_series_dict(series_dict)
+        corpus.save_corpus(path)
+        if remove_old:
+            os.remove(f'{path}.json')
+        return f'{path}.jsonl'
+
     def save_corpus_meta(self, corpus_dir):
         if self.root_corpus_path is None:
             self.root_corpus_path = corpus_dir
         data = {"name": self.name, "root_corpus_path": self.root_corpus_path,
                 "language": self.language, "series_dict": self.series_dict,
                 "success_dict": self.success_dict}
+        if self.statistics is not None:
+            data["statistics"] = self.statistics
         with open(os.path.join(corpus_dir, "meta_info.json"), 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=1, default=lambda o: o.__dict__)
+        Corpus.write_manifest(corpus_dir, self.series_dict)
+
+    @staticmethod
+    def write_manifest(corpus_dir: str, series_dict: Dict[str, List[str]] = None) -> List[Dict[str, Any]]:
+        # one json line per document file, so loading needs neither a listing nor filename parsing
+        doc_series = {}
+        if series_dict:
+            doc_series = {doc_id: series_id for series_id, doc_ids in series_dict.items() for doc_id in doc_ids}
+        entries = []
+        for file_name in sorted(file_name for file_name in os.listdir(corpus_dir) if file_name.endswith('.txt')):
+            entry = Document.meta_from_file_name(file_name)
+            entry["file_name"] = file_name
+            entry["series_id"] = doc_series.get(entry["doc_id"])
+            entries.append(entry)
+        with open(os.path.join(corpus_dir, Corpus.manifest_name), 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(f'{json.dumps(entry, ensure_ascii=False)}\n')
+        return entries
+
+    @staticmethod
+    def read_manifest(corpus_dir: str, series_dict: Dict[str, List[str]] = None, validate: bool = False) \
+            -> List[Dict[str, Any]]:
+        manifest_path = os.path.join(corpus_dir, Corpus.manifest_name)
+        if not os.path.isfile(manifest_path):
+            return Corpus.write_manifest(corpus_dir, series_dict)
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip() != '']
+        if validate:
+            file_names = set(file_name for file_name in os.listdir(corpus_dir) if file_name.endswith('.txt'))
+            if file_names != set(entry["file_name"] for entry in entries):
+                logging.info(f'manifest of {corpus_dir} is outdated, rebuild it')
+                return Corpus.write_manifest(corpus_dir, series_dict)
+        return entries
 
     def save_corpus_adv(self, corpus_dir: str):
         if not os.path.isdir(corpus_dir):
             os.mkdir(corpus_dir)
+        doc_paths = []
         for doc_id, document in tqdm(self.documents.items(), total=len(self.documents), desc="save corpus",
                                      disable=False):
-            document.store_to_corpus_file(corpus_dir)
+            doc_paths.append(document.store_to_corpus_file(corpus_dir))
 
         self.save_corpus_meta(corpus_dir)
+        self.build_vocabulary(from_disk=False).save(corpus_dir, Corpus.document_files_stamp(doc_paths))
 
     @staticmethod
-    def load_corpus_from_dir_format(corpus_dir: str):
+    def document_files_stamp(doc_paths: List[str]) -> str:
+        return DataHandler.source_stamp(sorted(os.path.abspath(doc_path) for doc_path in doc_paths))
+
+    def build_vocabulary(self, from_disk: bool = True) -> Vocabulary:
+        vocabulary = Vocabulary()
+        for document in tqdm(self.documents.values(), total=len(self.documents), desc="Build vocabulary",
+                             disable=True):
+            if from_disk or document.sentences is None or len(document.sentences) == 0:
+                sentences = document.get_sentences_from_disk()
+            else:
+                sentences = document.sentences
+            for sentence in sentences:
+                for token in sentence.tokens:
+                    vocabulary.add(token.text)
+                    vocabulary.add(token.lemma)
+        self.vocabulary = vocabulary
+        return vocabulary
+
+    def get_vocabulary(self) -> Vocabulary:
+        if self.vocabulary is None:
+            doc_paths = [document.file_path for document in self.documents.values()]
+            if self.corpus_path and os.path.isdir(self.corpus_path) \
+                    and all(doc_path and os.path.isfile(doc_path) for doc_path in doc_paths):
+                source_stamp = Corpus.document_files_stamp(doc_paths)
+                self.vocabulary = Vocabulary.load(self.corpus_path, source_stamp)
+                if self.vocabulary is None:
+                    self.build_vocabulary(from_disk=True).save(self.corpus_path, source_stamp)
+            else:
+                self.build_vocabulary(from_disk=True)
+        return self.vocabulary
+
+    def get_document_frequencies(self, lemma: bool = False, lower: bool = False, from_disk: bool = True) \
+            -> np.ndarray:
+        vocabulary = self.get_vocabulary()
+        doc_vocab_ids = [document.get_vocab_ids(vocabulary, lemma=lemma, lower=lower, from_disk=from_disk)
+                         for document in tqdm(self.documents.values(), total=len(self.documents),
+                                              desc="Calculate DF", disable=True)]
+        if len(doc_vocab_ids) == 0:
+            return np.zeros(len(vocabulary), dtype=np.int32)
+        return np.bincount(np.concatenate(doc_vocab_ids), minlength=len(vocabulary)).astype(np.int32)
+
+    @staticmethod
+    def load_corpus_from_dir_format(corpus_dir: str, validate: bool = False):
         # print(corpus_dir)
         meta_path = os.path.join(corpus_dir, "meta_info.json")
         with open(meta_path, 'r', encoding='utf-8') as file:
             meta_data = json.loads(file.read())
 
-        document_paths = [file_path for file_path in os.listdir(corpus_dir) if file_path.endswith('.txt')]
+        manifest = Corpus.read_manifest(corpus_dir, series_dict=meta_data["series_dict"], validate=validate)
 
-        documents = [Document.create_document_from_doc_file(os.path.join(corpus_dir, doc_path), disable_sentences=True)
-                     for doc_path in tqdm(document_paths, desc="load_file", disable=False)]
+        documents = [Document.create_document_from_meta(entry, os.path.join(corpus_dir, entry["file_name"]))
+                     for entry in tqdm(manifest, desc="load_file", disable=False)]
 
         corpus = Corpus(source=documents, name=meta_data["name"], language=meta_data["language"])
 
@@ -1470,6 +2243,8 @@ class Corpus:
         corpus.set_series_dict(meta_data["series_dict"])
         if "success_dict" in meta_data.keys():
             corpus.success_dict = meta_data["success_dict"]
+        if "statistics" in meta_data.keys():
+            corpus.statistics = meta_data["statistics"]
 
         corpus.corpus_path = corpus_dir
 
@@ -1494,13 +2269,21 @@ class Corpus:
                                                             data_set,
                                                             filer_mode,
                                                             fake_real)
-                corpus = Corpus(corpus_path)
-                corpus.save_corpus_adv(corpus_dir)
+                if os.path.exists(f'{Corpus.stream_path(corpus_path)}.jsonl'):
+                    Corpus.stream_to_dir_format(corpus_path, corpus_dir)
+                    corpus = Corpus.load_corpus_from_dir_format(corpus_dir)
+                else:
+                    corpus = Corpus(corpus_path)
+                    corpus.save_corpus_adv(corpus_dir)
             corpus.corpus_path = corpus_dir
         else:
             if os.path.exists(path):
                 corpus = Corpus.load_corpus_from_dir_format(path)
                 corpus.corpus_path = path
+            elif os.path.exists(f'{path}.jsonl'):
+                Corpus.stream_to_dir_format(path, path)
+                corpus = Corpus.load_corpus_from_dir_format(path)
+                corpus.corpus_path = path
             elif os.path.exists(f'{path}.json'):
                 corpus = Corpus(f'{path}.json')
                 corpus.save_corpus_adv(path)
@@ -1618,8 +2401,22 @@ class Corpus:
 
     def get_corpus_vocab(self, from_disk=True, lemma: bool = False, lower: bool = False,
                          lda_mode: bool = False):
-        vocab = set()
+        if not lda_mode and from_disk:
+            documents_statistics = self.get_documents_statistics()
+            if documents_statistics is not None:
+                vocab = set()
+                for statistics in documents_statistics.values():
+                    vocab.update(DocumentStatistics.vocab(statistics, lemma=lemma, lower=lower))
+                vocab.discard('del')
+                return vocab
+        if not lda_mode:
+            vocabulary = self.get_vocabulary()
+            frequencies = self.get_document_frequencies(lemma=lemma, lower=lower, from_disk=from_disk)
+            vocab = set(vocabulary.get_forms(np.flatnonzero(frequencies)))
+            vocab.discard('del')
+            return vocab
 
+        vocab = set()
         for document in tqdm(self.documents.values(),
                              total=len(self.documents),
                              desc="Load vocab",
@@ -1630,6 +2427,15 @@ class Corpus:
             vocab.remove('del')
         return vocab
 
+    def get_documents_statistics(self) -> Union[Dict[str, Dict[str, np.ndarray]], None]:
+        documents_statistics = {}
+        for doc_id, document in self.documents.items():
+            statistics = document.load_statistics()
+            if statistics is None:
+                return None
+            documents_statistics[doc_id] = statistics
+        return documents_statistics
+
     def get_index_dict(self):
         return {i: word for i, word in enumerate(self.get_corpus_vocab())}
 
@@ -2667,92 +3473,167 @@ class Corpus:
         # print(sub_corpus.documents)
         return sub_corpus
 
+    def get_doctag_parser(self) -> DoctagParser:
+        # rebuilt whenever the doc ids differ, also if the documents were replaced by as many others
+        if self.doctag_parser is None \
+                or self.doctag_parser.doc_ids != set(str(doc_id) for doc_id in self.documents.keys()):
+            self.doctag_parser = DoctagParser(list(self.documents.keys()))
+        return self.doctag_parser
+
     def vector_doc_id_base_in_corpus(self, vector_doc_id: str):
-        for corpus_doc_id in self.documents.keys():
-            if vector_doc_id == corpus_doc_id or vector_doc_id.startswith(f'{corpus_doc_id}_'):
-                return True
-        return False
+        return self.get_doctag_parser().in_corpus(vector_doc_id)
 
-    def to_flair_data(self, text_corpus: bool = True):
+    @staticmethod
+    def flair_sentence_lines(doc_id: str, file_path: str, text_corpus: bool = True) -> List[str]:
+        sentences = Document.sentences_from_doc_file(file_path)
+        if text_corpus:
+            return [f'{" ".join(sentence.representation())}\n' for sentence in sentences]
+        return [''.join([f'{token.get_save_file_representation(doc_id)}\n' for token in sentence.tokens]) + "\n"
+                for sentence in sentences]
+
+    def to_flair_data(self, text_corpus: bool = True, workers: int = 1, resume: bool = False,
+                      batch_size: int = 64, buffer_size: int = 4 * 1024 * 1024):
         corpus_dir = f'{self.root_corpus_path}_flair_text'
-        random.seed(42)
+        state_path = os.path.join(corpus_dir, "export_state.json")
+        train_dir_path = os.path.join(corpus_dir, "train")
+        split_size = 10000
 
         if not os.path.isdir(corpus_dir):
             os.mkdir(corpus_dir)
 
-        if not text_corpus:
-            for key in ["train", "dev", "test"]:
-                doc_path = os.path.join(corpus_dir, f'{key}.txt')
-                with open(doc_path, 'w', encoding="utf-8") as writer:
-                    writer.write(f'')
-
-            for doc_id, document in tqdm(self.documents.items()):
-                sentences = document.get_sentences_from_disk()
-                random.shuffle(sentences)
-
-                for sentence in sentences:
-
-                    nr = random.randint(0, 100)
-                    if nr < 50:
-                        key = "train"
-                    elif 50 <= nr < 80:
-                        key = "dev"
-                    else:
-                        key = "test"
-                    doc_path = os.path.join(corpus_dir, f'{key}.txt')
-                    try:
-                        with open(doc_path, 'a', encoding="utf-8") as writer:
-                            for token in sentence.tokens:
-                                writer.write(f'{token.get_save_file_representation(doc_id)}\n')
-                            writer.write("\n")
-                    except PermissionError:
-                        with open(doc_path, 'a', encoding="utf-8") as writer:
-                            for token in sentence.tokens:
-                                writer.write(f'{token.get_save_file_representation(doc_id)}\n')
-                            writer.write("\n")
+        random.seed(42)
+        train_sentence_counter = 0
+        split_nr = 0
+        docs_done = 0
+        if resume and os.path.isfile(state_path):
+            with open(state_path, 'r', encoding="utf-8") as file:
+                state = json.load(file)
+            if state["text_corpus"] != text_corpus:
+                raise UserWarning(f"Export state in {corpus_dir} belongs to another export mode!")
+            version, internal_state, gauss_next = state["random_state"]
+            random.setstate((version, tuple(internal_state), gauss_next))
+            train_sentence_counter = state["train_sentence_counter"]
+            split_nr = state["split_nr"]
+            docs_done = state["docs_done"]
+            # drop everything written after the last checkpoint
+            for doc_path, size in state["file_sizes"].items():
+                if not os.path.isfile(doc_path):
+                    # a removed split file starts empty again, its checkpointed sentences can not be restored
+                    if size > 0:
+                        logging.warning(f'{doc_path} of the export checkpoint is missing, its {size} bytes are lost')
+                    if not os.path.isdir(os.path.dirname(doc_path)):
+                        os.makedirs(os.path.dirname(doc_path))
+                    open(doc_path, 'w', encoding="utf-8").close()
+                    continue
+                os.truncate(doc_path, size)
+            if os.path.isdir(train_dir_path):
+                for file_name in os.listdir(train_dir_path):
+                    doc_path = os.path.join(train_dir_path, file_name)
+                    if doc_path not in state["file_sizes"]:
+                        os.remove(doc_path)
         else:
-            split_size = 10000
-            for key in ["dev", "test"]:
-                doc_path = os.path.join(corpus_dir, f'{key}.txt')
-                with open(doc_path, 'w', encoding="utf-8") as writer:
+            if text_corpus:
+                empty_keys, removed_keys = ["dev", "test"], ["valid"]
+            else:
+                empty_keys, removed_keys = ["train", "dev", "test"], []
+            for key in empty_keys:
+                with open(os.path.join(corpus_dir, f'{key}.txt'), 'w', encoding="utf-8") as writer:
                     writer.write(f'')
-
-            train_sentence_counter = 0
-            split_nr = 0
-            for doc_id, document in tqdm(self.documents.items()):
-                sentences = document.get_sentences_from_disk()
-                random.shuffle(sentences)
-
-                for sentence in sentences:
-
-                    nr = random.randint(0, 100)
-                    if nr < 70:
-                        key = "train"
-                    elif 70 <= nr < 90:
-                        key = "valid"
-                    else:
-                        key = "test"
-
-                    if key == "train":
-                        if train_sentence_counter > split_size:
-                            split_nr += 1
-                            train_sentence_counter = 0
-                        train_dir_path = os.path.join(corpus_dir, key)
-                        if not os.path.exists(train_dir_path):
-                            os.mkdir(train_dir_path)
-                        doc_path = os.path.join(train_dir_path, f'split_{split_nr}.txt')
-                        train_sentence_counter += 1
-                    else:
-                        doc_path = os.path.join(corpus_dir, f'{key}.txt')
-                    try:
-                        with open(doc_path, 'a', encoding="utf-8") as writer:
-                            writer.write(f'{" ".join(sentence.representation())}\n')
-                    except PermissionError:
-                        with open(doc_path, 'a', encoding="utf-8") as writer:
-                            writer.write(f'{" ".join(sentence.representation())}\n')
-
-
-
+            for key in removed_keys:
+                if os.path.isfile(os.path.join(corpus_dir, f'{key}.txt')):
+                    os.remove(os.path.join(corpus_dir, f'{key}.txt'))
+            if text_corpus and os.path.isdir(train_dir_path):
+                for file_name in os.listdir(train_dir_path):
+                    os.remove(os.path.join(train_dir_path, file_name))
+
+        writers = {}
+
+        def get_writer(doc_path: str):
+            if doc_path not in writers:
+                writers[doc_path] = open(doc_path, 'a', encoding="utf-8", buffering=buffer_size)
+            return writers[doc_path]
+
+        def save_state():
+            for writer in writers.values():
+                writer.flush()
+            file_sizes = {}
+            for doc_path in [os.path.join(corpus_dir, f'{key}.txt') for key in ["train", "dev", "valid", "test"]]:
+                if os.path.isfile(doc_path):
+                    file_sizes[doc_path] = os.path.getsize(doc_path)
+            if os.path.isdir(train_dir_path):
+                for file_name in os.listdir(train_dir_path):
+                    file_sizes[os.path.join(train_dir_path, file_name)] = \
+                        os.path.getsize(os.path.join(train_dir_path, file_name))
+            with open(state_path, 'w', encoding="utf-8") as file:
+                json.dump({"text_corpus": text_corpus, "docs_done": docs_done, "random_state": random.getstate(),
+                           "train_sentence_counter": train_sentence_counter, "split_nr": split_nr,
+                           "file_sizes": file_sizes}, file)
+
+        doc_items = [(doc_id, document.file_path) for doc_id, document in self.documents.items()][docs_done:]
+        sentence_counter = 0
+        start = time.time()
+        doc_bar = tqdm(total=len(doc_items), desc="Export flair data")
+        try:
+            for batch_start in range(0, len(doc_items), batch_size):
+                batch = doc_items[batch_start:batch_start + batch_size]
+                if workers > 1:
+                    batch_lines = Parallel(n_jobs=workers)(delayed(Corpus.flair_sentence_lines)(doc_id, file_path,
+                                                                                                text_corpus)
+                                                           for doc_id, file_path in batch)
+                else:
+                    batch_lines = [Corpus.flair_sentence_lines(doc_id, file_path, text_corpus)
+                                   for doc_id, file_path in batch]
+
+                # same random call sequence as a sentence by sentence export
+                for sentence_lines in batch_lines:
+                    random.shuffle(sentence_lines)
+                    for sentence_line in sentence_lines:
+                        nr = random.randint(0, 100)
+                        if not text_corpus:
+                            if nr < 50:
+                                key = "train"
+                            elif 50 <= nr < 80:
+                                key = "dev"
+                            else:
+                                key = "test"
+                            doc_path = os.path.join(corpus_dir, f'{key}.txt')
+                        else:
+                            if nr < 70:
+                                key = "train"
+                            elif 70 <= nr < 90:
+                                key = "valid"
+                            else:
+                                key = "test"
+
+                            if key == "train":
+                                if train_sentence_counter > split_size:
+                                    finished_writer = writers.pop(os.path.join(train_dir_path,
+                                                                               f'split_{split_nr}.txt'), None)
+                                    if finished_writer is not None:
+                                        finished_writer.close()
+                                    split_nr += 1
+                                    train_sentence_counter = 0
+                                if not os.path.exists(train_dir_path):
+                                    os.mkdir(train_dir_path)
+                                doc_path = os.path.join(train_dir_path, f'split_{split_nr}.txt')
+                                train_sentence_counter += 1
+                            else:
+                                doc_path = os.path.join(corpus_dir, f'{key}.txt')
+                        get_writer(doc_path).write(sentence_line)
+                    sentence_counter += len(sentence_lines)
+                    docs_done += 1
+                doc_bar.update(len(batch))
+                save_state()
+        finally:
+            doc_bar.close()
+            for writer in writers.values():
+                writer.close()
+
+        duration = max(time.time() - start, 1e-9)
+        logging.info(f'exported {sentence_counter} sentences to {corpus_dir} in {duration:.1f}s '
+                     f'({sentence_counter / duration:.1f} sentences/s)')
+        print(f'{sentence_counter / duration:.1f} sentences/s')
+        return sentence_counter / duration
 
 
 class Preprocesser:
@@ -2881,6 +3762,7 @@ class Preprocesser:
                                      language=corpus.language)
 
         file_dict = {}
+        documents_statistics = []
         for doc_id, document_sentences in tqdm(corpus.documents.items(),
                                                desc="annotate",
                                                total=len(corpus.documents)):
@@ -2897,12 +3779,16 @@ class Preprocesser:
             preprocessed_corpus[doc_id].calculate_sizes()
             doc_path = preprocessed_corpus[doc_id].store_to_corpus_file(corpus_dir)
             file_dict[doc_id] = doc_path
+            statistics = DocumentStatistics.from_sentences(preprocessed_corpus[doc_id].sentences)
+            DocumentStatistics.save(DocumentStatistics.statistics_path(corpus_dir, doc_id), statistics)
+            documents_statistics.append(statistics)
             preprocessed_corpus[doc_id].sentences = None
 
         if not without_spacy:
             preprocessed_corpus.set_document_entities()
         preprocessed_corpus.set_series_dict(corpus.series_dict)
         preprocessed_corpus.file_dict = file_dict
+        preprocessed_corpus.statistics = DocumentStatistics.aggregate(documents_statistics)
         preprocessed_corpus.save_corpus_meta(corpus_dir)
 
         return preprocessed_corpus
@@ -3287,9 +4173,16 @@ class Preprocesser:
 
     @staticmethod
     def filter_too_small_docs_from_corpus(corpus: Corpus, smaller_as: int = 20):
+        def sentences_nr(document: Document):
+            if document.sentences_nr == 0:
+                statistics = document.load_statistics()
+                if statistics is not None:
+                    return len(statistics["sentence_lengths"])
+            return document.sentences_nr
+
         documents = {doc_id: document
                      for doc_id, document in corpus.documents.items()
-                     if document.sentences_nr >= smaller_as}
+                     if sentences_nr(document) >= smaller_as}
         new_corpus = Corpus(documents, name=corpus.name, language=corpus.language)
         # new_corpus.set_document_entities()
 
@@ -3385,32 +4278,28 @@ class CommonWords:
     def global_too_specific_words_doc_frequency(corpus: Corpus, percentage_share: float = None,
                                                 absolute_share: int = None) \
             -> Set[str]:
-        tqdm_disable = True
-        freq_dict = defaultdict(lambda: 0.0)
-
         if absolute_share:
             percentage_share = absolute_share
         print("Percantge share", percentage_share)
-        for doc_id, document in tqdm(corpus.documents.items(), total=len(corpus.documents), desc="Calculate DF",
-                                     disable=tqdm_disable):
-            document: Document
-            for token in set(document.get_flat_tokens_from_disk()):
-                # vocab.add(token)
-                if absolute_share:
-                    freq_dict[token] += 1
-                else:
-                    freq_dict[token] += 1 / len(corpus.documents)
-                    if freq_dict[token] > 1:
-                        freq_dict[token] = 1
-
-                    # if not lower_bound:
-        #     lower_bound = lower_bound_absolute / len(doc_texts)
-        # print(len(freq_dict.keys()), len(vocab))
-        # print(min(freq_dict.values()), max(freq_dict.values()))
-        to_remove = set([token for token, doc_freq in tqdm(freq_dict.items(), total=len(freq_dict),
-                                                           desc="Filter DF",
-                                                           disable=tqdm_disable)
-                         if doc_freq <= percentage_share])
+        documents_statistics = corpus.get_documents_statistics()
+        if documents_statistics is not None:
+            doc_frequencies = defaultdict(int)
+            for statistics in documents_statistics.values():
+                for token in DocumentStatistics.vocab(statistics):
+                    doc_frequencies[token] += 1
+            if absolute_share:
+                return set(token for token, doc_freq in doc_frequencies.items() if doc_freq <= percentage_share)
+            return set(token for token, doc_freq in doc_frequencies.items()
+                       if min(doc_freq / len(corpus.documents), 1.0) <= percentage_share)
+
+        vocabulary = corpus.get_vocabulary()
+        doc_frequencies = corpus.get_document_frequencies()
+        present = np.flatnonzero(doc_frequencies)
+        if absolute_share:
+            doc_freq = doc_frequencies[present]
+        else:
+            doc_freq = np.minimum(doc_frequencies[present] / len(corpus.documents), 1.0)
+        to_remove = set(vocabulary.get_forms(present[doc_freq <= percentage_share]))
         # print(len(to_remove))
         # print(to_remove)
         # too_specific_words = {doc_id: set(doc_tokens).intersection(to_remove)
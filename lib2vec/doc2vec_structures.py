@@ -1,4 +1,7 @@
-from typing import Dict
+import os
+import time
+from typing import Dict, List, Tuple, Union
+
 from gensim.models.doc2vec import Doctag
 from gensim.models.keyedvectors import Doc2VecKeyedVectors, KeyedVectors, WordEmbeddingsKeyedVectors
 import numpy as np
@@ -29,6 +32,9 @@ class DocumentKeyedVectors:
         wv = {}
         docvecs = {}
         self.concat_vecs = None
+        self.doctag_index = None
+        self.word_matrix = None
+        self.compressed_docvecs = None
         for key in kv.vocab:
             if key.startswith(prefix):
                 docvecs[key.replace(prefix, "")] = kv[key]
@@ -42,6 +48,254 @@ class DocumentKeyedVectors:
         self.docvecs = KeyedDocumentVectors(docvecs)
 
 
+class Int8Quantizer:
+    # per dimension scalar quantisation to 256 levels
+    def __init__(self):
+        self.offset = None
+        self.scale = None
+
+    def fit(self, vectors: np.ndarray) -> "Int8Quantizer":
+        self.offset = vectors.min(axis=0).astype(np.float32)
+        self.scale = ((vectors.max(axis=0) - self.offset) / 255).astype(np.float32)
+        self.scale[self.scale == 0] = 1
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((vectors - self.offset) / self.scale), 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.offset
+
+    def inner_products(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # asymmetric: the query stays in float, q.x = (q * scale).codes + q.offset
+        return codes @ (query * self.scale).astype(np.float32) + float(query @ self.offset)
+
+    def squared_norms(self, codes: np.ndarray) -> np.ndarray:
+        return np.square(self.decode(codes)).sum(axis=1)
+
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+    def set_params(self, params):
+        self.offset = params["offset"]
+        self.scale = params["scale"]
+
+
+class ProductQuantizer:
+    # vectors are split into sub vectors, each is replaced by the id of its nearest centroid (k-means per subspace)
+    def __init__(self, sub_dim: int = 10, n_centroids: int = 256, iterations: int = 20, seed: int = 42):
+        self.sub_dim = sub_dim
+        self.n_centroids = n_centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.dim = None
+        self.centroids = None
+
+    def split(self, vectors: np.ndarray) -> np.ndarray:
+        # (n, subspaces, sub_dim), dimensions are zero padded to a multiple of sub_dim
+        padding = (-vectors.shape[1]) % self.sub_dim
+        if padding:
+            vectors = np.hstack([vectors, np.zeros((len(vectors), padding), dtype=vectors.dtype)])
+        return vectors.reshape(len(vectors), -1, self.sub_dim).astype(np.float32)
+
+    @staticmethod
+    def nearest_centroids(sub_vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        distances = np.square(centroids).sum(axis=1)[None, :] - 2 * sub_vectors @ centroids.T
+        return distances.argmin(axis=1)
+
+    def fit(self, vectors: np.ndarray) -> "ProductQuantizer":
+        self.dim = vectors.shape[1]
+        sub_vectors = self.split(vectors)
+        n_centroids = min(self.n_centroids, len(vectors))
+        random_state = np.random.RandomState(self.seed)
+        self.centroids = np.zeros((sub_vectors.shape[1], n_centroids, self.sub_dim), dtype=np.float32)
+        for subspace in range(sub_vectors.shape[1]):
+            points = sub_vectors[:, subspace]
+            centroids = points[random_state.choice(len(points), n_centroids, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = ProductQuantizer.nearest_centroids(points, centroids)
+                counts = np.bincount(assignment, minlength=n_centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, points)
+                # empty clusters keep their old centroid
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            self.centroids[subspace] = centroids
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_vectors = self.split(vectors)
+        # column major, so the codes of one subspace are contiguous for the table lookups
+        return np.asfortranarray(np.stack([ProductQuantizer.nearest_centroids(sub_vectors[:, subspace],
+                                                                              self.centroids[subspace])
+                                           for subspace in range(len(self.centroids))], axis=1).astype(np.uint8))
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        sub_vectors = self.centroids[np.arange(len(self.centroids))[None, :], codes]
+        return sub_vectors.reshape(len(codes), -1)[:, :self.dim]
+
+    def lookup_table(self, query: np.ndarray) -> np.ndarray:
+        # inner product of every query sub vector with every centroid of its subspace
+        return np.einsum('sd,scd->sc', self.split(query[None, :])[0], self.centroids)
+
+    def inner_products(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        table = self.lookup_table(query)
+        inner_products = np.zeros(len(codes), dtype=np.float32)
+        for subspace in range(len(table)):
+            inner_products += np.take(table[subspace], codes[:, subspace])
+        return inner_products
+
+    def squared_norms(self, codes: np.ndarray) -> np.ndarray:
+        centroid_norms = np.square(self.centroids).sum(axis=2)
+        return centroid_norms[np.arange(len(centroid_norms))[None, :], codes].sum(axis=1)
+
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids, "dim": np.array(self.dim), "sub_dim": np.array(self.sub_dim)}
+
+    def set_params(self, params):
+        self.centroids = params["centroids"]
+        self.dim = int(params["dim"])
+        self.sub_dim = int(params["sub_dim"])
+
+
+class CompressedDocumentVectors:
+    compressions = ["int8", "pq"]
+
+    def __init__(self, doctags: List[str], codes: np.ndarray, quantizer: Union[Int8Quantizer, ProductQuantizer],
+                 exact_vectors: np.ndarray = None, rerank: int = 100):
+        self.doctags = doctags
+        self.rerank = rerank
+        self.codes = codes
+        self.quantizer = quantizer
+        norms = np.sqrt(quantizer.squared_norms(codes))
+        norms[norms == 0] = 1
+        self.norms = norms.astype(np.float32)
+        # only needed for re-ranking, may be a memory map or None
+        self.exact_vectors = exact_vectors
+
+    @staticmethod
+    def get_quantizer(compression: str) -> Union[Int8Quantizer, ProductQuantizer]:
+        if compression == "int8":
+            return Int8Quantizer()
+        elif compression == "pq":
+            return ProductQuantizer()
+        raise UserWarning(f"Not supported compression '{compression}'!")
+
+    @staticmethod
+    def docvecs_matrix(docvecs, doctags: List[str]) -> np.ndarray:
+        # rows in the order of doctags, without a copy when the offsets already are in that order
+        offsets = np.array([docvecs.doctags[doctag].offset for doctag in doctags], dtype=np.int64)
+        if np.array_equal(offsets, np.arange(len(docvecs.vectors_docs))):
+            return docvecs.vectors_docs
+        return docvecs.vectors_docs[offsets]
+
+    @staticmethod
+    def from_docvecs(docvecs, compression: str, keep_exact: bool = True) -> "CompressedDocumentVectors":
+        doctags = list(docvecs.doctags.keys())
+        vectors = CompressedDocumentVectors.docvecs_matrix(docvecs, doctags)
+        quantizer = CompressedDocumentVectors.get_quantizer(compression).fit(np.asarray(vectors, dtype=np.float32))
+        return CompressedDocumentVectors(doctags, quantizer.encode(vectors), quantizer,
+                                         exact_vectors=vectors if keep_exact else None)
+
+    def save(self, path: str, source_path: str = None):
+        source_stat = os.stat(source_path) if source_path and os.path.isfile(source_path) else None
+        params = {f'param_{key}': value for key, value in self.quantizer.get_params().items()}
+        with open(f'{path}.{os.getpid()}.tmp', 'wb') as f:
+            np.savez(f, doctags=np.array(self.doctags), codes=self.codes,
+                     compression=np.array("pq" if isinstance(self.quantizer, ProductQuantizer) else "int8"),
+                     source=np.array([source_stat.st_size, source_stat.st_mtime] if source_stat else [-1, -1]),
+                     **params)
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+    @staticmethod
+    def load(path: str, source_path: str = None, exact_vectors: np.ndarray = None) \
+            -> Union["CompressedDocumentVectors", None]:
+        # None if there is no stored compression or its source vector file changed since
+        if not os.path.isfile(path):
+            return None
+        data = np.load(path)
+        if source_path and os.path.isfile(source_path):
+            source_stat = os.stat(source_path)
+            if list(data["source"]) != [source_stat.st_size, source_stat.st_mtime]:
+                return None
+        quantizer = CompressedDocumentVectors.get_quantizer(str(data["compression"]))
+        quantizer.set_params({key[len('param_'):]: data[key] for key in data.files if key.startswith('param_')})
+        return CompressedDocumentVectors(data["doctags"].tolist(), data["codes"], quantizer,
+                                         exact_vectors=exact_vectors)
+
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.norms.nbytes + sum(value.nbytes
+                                                           for value in self.quantizer.get_params().values())
+
+    @staticmethod
+    def query_vector(positive: List[np.ndarray], negative: List[np.ndarray] = None) -> np.ndarray:
+        # same query as gensim most_similar: mean of unit length positives and negated negatives
+        if negative is None:
+            negative = []
+        weighted = [vector / max(np.linalg.norm(vector), 1e-12) for vector in positive] + \
+                   [-vector / max(np.linalg.norm(vector), 1e-12) for vector in negative]
+        if len(weighted) == 0:
+            raise ValueError("cannot compute similarity with no input")
+        query = np.mean(np.array(weighted, dtype=np.float32), axis=0)
+        return query / max(np.linalg.norm(query), 1e-12)
+
+    def most_similar(self, positive: List[np.ndarray], negative: List[np.ndarray] = None, topn: int = 10,
+                     rerank: int = None) -> List[Tuple[str, float]]:
+        # approximate cosine similarities from the codes, the best rerank candidates are rescored exactly
+        query = CompressedDocumentVectors.query_vector(positive, negative)
+        sims = self.quantizer.inner_products(query, self.codes) / self.norms
+        topn = min(topn, len(sims))
+        candidates = min(max(topn, rerank or 0), len(sims))
+        if candidates < len(sims):
+            rows = np.argpartition(-sims, candidates - 1)[:candidates]
+        else:
+            rows = np.arange(len(sims))
+        rows = rows[np.argsort(-sims[rows], kind='stable')]
+        if rerank and self.exact_vectors is not None:
+            head = rows[:rerank]
+            exact_vectors = np.asarray(self.exact_vectors[np.sort(head)], dtype=np.float32)
+            norms = np.linalg.norm(exact_vectors, axis=1)
+            norms[norms == 0] = 1
+            sims = sims.copy()
+            sims[np.sort(head)] = exact_vectors @ query / norms
+            rows = np.concatenate([head[np.argsort(-sims[head], kind='stable')], rows[rerank:]])
+        rows = rows[:topn]
+        return [(self.doctags[row], float(sims[row])) for row in rows]
+
+    def evaluate(self, topn: int = 10, n_queries: int = 100, rerank: int = None, seed: int = 42) \
+            -> Dict[str, float]:
+        # recall@topn against exact search with the stored documents as queries, memory and query latency
+        if self.exact_vectors is None:
+            raise UserWarning("Exact vectors are required for the evaluation!")
+        exact_vectors = np.asarray(self.exact_vectors, dtype=np.float32)
+        norms = np.linalg.norm(exact_vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        normed_vectors = exact_vectors / norms
+        query_rows = np.random.RandomState(seed).choice(len(exact_vectors), min(n_queries, len(exact_vectors)),
+                                                        replace=False)
+        doctag_rows = {doctag: row for row, doctag in enumerate(self.doctags)}
+        recalls = []
+        exact_time = 0
+        compressed_time = 0
+        for query_row in query_rows:
+            start = time.time()
+            exact_sims = normed_vectors @ normed_vectors[query_row]
+            exact_top = set(np.argsort(-exact_sims, kind='stable')[:topn].tolist())
+            exact_time += time.time() - start
+
+            start = time.time()
+            compressed_top = self.most_similar([exact_vectors[query_row]], topn=topn, rerank=rerank)
+            compressed_time += time.time() - start
+            recalls.append(len(exact_top.intersection(doctag_rows[doctag] for doctag, _ in compressed_top))
+                           / len(exact_top))
+        return {"recall": float(np.mean(recalls)),
+                "exact_bytes": int(exact_vectors.nbytes),
+                "compressed_bytes": int(self.nbytes()),
+                "memory_reduction": exact_vectors.nbytes / self.nbytes(),
+                "exact_query_ms": 1000 * exact_time / len(query_rows),
+                "compressed_query_ms": 1000 * compressed_time / len(query_rows)}
+
+
 # class OriginDocumentKeyedVectors:
 #     def __init__(self, kv: KeyedVectors,
 #                  prefix='*dt_'):
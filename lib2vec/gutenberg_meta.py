@@ -32,20 +32,13 @@ def correct_gutenberg_meta(input_path: str, output_path: str):
 
 def load_gutenberg_meta(path: str):
     df = pd.read_csv(path)
-    d = {}
     # gutenberg_id,title,author,gutenberg_author_id,language,gutenberg_bookshelf,rights,has_text
-    for i, row in df.iterrows():
-        author = row['author']
-        if not pd.isna(author):
-            splitted = author.split(', ')
-            splitted.reverse()
-            author = ' '.join(splitted)
-        else:
-            author = None
-
-        d[str(row['gutenberg_id'])] = (row['title'], author, row['gutenberg_bookshelf'])
-
-    return d
+    # "Surname, Forename" -> "Forename Surname" on the whole column instead of row by row
+    authors = df['author'].str.split(', ').str[::-1].str.join(' ')
+    authors = authors.astype(object).where(df['author'].notna(), None)
+
+    return dict(zip(df['gutenberg_id'].astype(str),
+                    zip(df['title'], authors, df['gutenberg_bookshelf'])))
 
 
 if __name__ == '__main__':
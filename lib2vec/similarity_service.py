@@ -0,0 +1,257 @@
+import json
+import logging
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple, Union
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from lib2vec.vectorization_utils import Vectorization
+
+
+class VectorStore:
+    # document and word vectors of one model as resident l2 normalised float32 matrices
+    def __init__(self, name: str, model):
+        self.name = name
+        self.model = model
+        self.doctags = list(model.docvecs.doctags.keys())
+        self.doctag_rows = {doctag: row for row, doctag in enumerate(self.doctags)}
+        offsets = [model.docvecs.doctags[doctag].offset for doctag in self.doctags]
+        self.doc_matrix = VectorStore.normalized(np.asarray(model.docvecs.vectors_docs, dtype=np.float32)[offsets])
+
+        # facet name -> rows of its doctags, "" for document vectors without facet suffix
+        facet_rows = {}
+        for row, doctag in enumerate(self.doctags):
+            facet_rows.setdefault(VectorStore.facet_of(doctag), []).append(row)
+        self.facet_rows = {facet: np.array(rows, dtype=np.int64) for facet, rows in facet_rows.items()}
+
+        if len(getattr(model.wv, 'vocab', {})) > 0:
+            self.words, self.word_matrix = Vectorization.get_word_matrix(model)
+        else:
+            self.words, self.word_matrix = [], np.zeros((0, self.doc_matrix.shape[1]), dtype=np.float32)
+        self.word_rows = {word: row for row, word in enumerate(self.words)}
+
+    @staticmethod
+    def load(name: str, vec_path: str, combination: str = None) -> "VectorStore":
+        start = time.time()
+        vectors, _ = Vectorization.my_load_doc2vec_format(vec_path, combination=combination)
+        store = VectorStore(name, vectors)
+        logging.info(f'loaded {name} with {len(store.doctags)} doctags and {len(store.words)} words '
+                     f'in {time.time() - start:.1f}s')
+        return store
+
+    @staticmethod
+    def normalized(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    @staticmethod
+    def facet_of(doctag: str) -> str:
+        if str(doctag)[-1].isalpha():
+            return str(doctag).split('_')[-1]
+        return ""
+
+    def doctag_row(self, doc_id: str, facet: str = None) -> Union[int, None]:
+        # same fallback as Vectorization.facet_sim: the plain document vector if there is no facet vector
+        if facet:
+            row = self.doctag_rows.get(f'{doc_id}_{facet}')
+            if row is not None:
+                return row
+        return self.doctag_rows.get(doc_id)
+
+    def info(self) -> Dict[str, Union[int, List[str]]]:
+        return {"doctags": len(self.doctags), "words": len(self.words), "dimension": int(self.doc_matrix.shape[1]),
+                "facets": sorted(self.facet_rows.keys())}
+
+    def doc_ids(self, facet: str = None) -> List[str]:
+        rows = self.facet_rows.get(facet or "", [])
+        if facet:
+            return [self.doctags[row][:-len(facet) - 1] for row in rows]
+        return [self.doctags[row] for row in rows]
+
+    @staticmethod
+    def top_rows(sims: np.ndarray, topn: int) -> np.ndarray:
+        k = min(topn, sims.shape[1])
+        if k == 0:
+            return np.zeros((len(sims), 0), dtype=np.int64)
+        if k < sims.shape[1]:
+            top_columns = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top_columns = np.tile(np.arange(sims.shape[1]), (len(sims), 1))
+        order = np.argsort(-np.take_along_axis(sims, top_columns, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(top_columns, order, axis=1)
+
+    def document_neighbors(self, doc_ids: List[str], facet: str = None, topn: int = 10) \
+            -> Dict[str, Union[List[Tuple[str, float]], None]]:
+        # neighbours among the doctags of the same facet, the query doctag itself is excluded
+        query_rows = [self.doctag_row(doc_id, facet) for doc_id in doc_ids]
+        results = {doc_id: None for doc_id, row in zip(doc_ids, query_rows) if row is None}
+        known = [(doc_id, row) for doc_id, row in zip(doc_ids, query_rows) if row is not None]
+        if len(known) == 0:
+            return results
+        facet_queries = {}
+        for doc_id, row in known:
+            facet_queries.setdefault(VectorStore.facet_of(self.doctags[row]), []).append((doc_id, row))
+        for query_facet, queries in facet_queries.items():
+            query_rows = np.array([row for _, row in queries], dtype=np.int64)
+            candidate_rows = self.facet_rows[query_facet]
+            sims = self.doc_matrix[query_rows] @ self.doc_matrix[candidate_rows].T
+            sims[candidate_rows[None, :] == query_rows[:, None]] = -np.inf
+            top_columns = VectorStore.top_rows(sims, topn)
+            for i, (doc_id, _) in enumerate(queries):
+                results[doc_id] = [(self.doctags[candidate_rows[column]], float(sims[i, column]))
+                                   for column in top_columns[i] if np.isfinite(sims[i, column])]
+        return results
+
+    def facet_similarities(self, pairs: List[Tuple[str, str]], facet: str = None) -> List[Union[float, None]]:
+        rows = [(self.doctag_row(doc_id_a, facet), self.doctag_row(doc_id_b, facet)) for doc_id_a, doc_id_b in pairs]
+        known = [i for i, (row_a, row_b) in enumerate(rows) if row_a is not None and row_b is not None]
+        similarities = [None] * len(pairs)
+        if len(known) > 0:
+            rows_a = np.array([rows[i][0] for i in known], dtype=np.int64)
+            rows_b = np.array([rows[i][1] for i in known], dtype=np.int64)
+            sims = np.einsum('ij,ij->i', self.doc_matrix[rows_a], self.doc_matrix[rows_b])
+            for i, sim in zip(known, sims.tolist()):
+                similarities[i] = sim
+        return similarities
+
+    def word_neighbors(self, queries: List[str], facet: str = None, topn: int = 10) \
+            -> Dict[str, Union[List[Tuple[str, float]], None]]:
+        # queries are words or document ids, document ids are resolved with the facet
+        query_vectors = []
+        results = {}
+        known = []
+        for query in queries:
+            row = self.word_rows.get(query)
+            if row is not None:
+                query_vectors.append(self.word_matrix[row])
+            else:
+                row = self.doctag_row(query, facet)
+                if row is None:
+                    results[query] = None
+                    continue
+                query_vectors.append(self.doc_matrix[row])
+            known.append(query)
+        if len(known) == 0 or len(self.words) == 0:
+            results.update({query: [] for query in known})
+            return results
+        sims = np.array(query_vectors, dtype=np.float32) @ self.word_matrix.T
+        top_columns = VectorStore.top_rows(sims, topn)
+        for i, query in enumerate(known):
+            results[query] = [(self.words[column], float(sims[i, column])) for column in top_columns[i]]
+        return results
+
+
+class SimilarityRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format_string, *args):
+        logging.debug(format_string % args)
+
+    def send_json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_store(self, store_name: str) -> VectorStore:
+        stores = self.server.stores
+        if store_name is None and len(stores) == 1:
+            return next(iter(stores.values()))
+        if store_name not in stores:
+            raise KeyError(f"Unknown vector store '{store_name}'")
+        return stores[store_name]
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/stores':
+                self.send_json({name: store.info() for name, store in self.server.stores.items()})
+            elif url.path == '/doc_ids':
+                self.send_json(self.get_store(query.get('store')).doc_ids(query.get('facet')))
+            else:
+                self.send_json({"error": f"Unknown path {url.path}"}, status=404)
+        except KeyError as error:
+            self.send_json({"error": str(error.args[0])}, status=404)
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(request, dict):
+                raise TypeError("The request body has to be a JSON object")
+            store = self.get_store(request.get('store'))
+            topn = int(request.get('topn', 10))
+            facet = request.get('facet')
+            if self.path == '/documents':
+                self.send_json(store.document_neighbors(request['doc_ids'], facet=facet, topn=topn))
+            elif self.path == '/facets':
+                self.send_json(store.facet_similarities(request['pairs'], facet=facet))
+            elif self.path == '/words':
+                self.send_json(store.word_neighbors(request['queries'], facet=facet, topn=topn))
+            else:
+                self.send_json({"error": f"Unknown path {self.path}"}, status=404)
+        except KeyError as error:
+            self.send_json({"error": f"Missing or unknown {error.args[0]}"}, status=404)
+        except (ValueError, TypeError) as error:
+            self.send_json({"error": str(error)}, status=400)
+
+
+class SimilarityServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, stores: Dict[str, VectorStore], host: str = "127.0.0.1", port: int = 8765):
+        super().__init__((host, port), SimilarityRequestHandler)
+        self.stores = stores
+
+    @staticmethod
+    def from_vector_paths(vector_paths: Dict[str, str], host: str = "127.0.0.1", port: int = 8765) \
+            -> "SimilarityServer":
+        return SimilarityServer({name: VectorStore.load(name, vec_path) for name, vec_path in vector_paths.items()},
+                                host=host, port=port)
+
+
+class SimilarityClient:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, timeout: float = 60):
+        self.base_url = f'http://{host}:{port}'
+        self.timeout = timeout
+
+    def get(self, path: str):
+        with urllib.request.urlopen(f'{self.base_url}{path}', timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def post(self, path: str, payload: Dict):
+        request = urllib.request.Request(f'{self.base_url}{path}', data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def stores(self) -> Dict[str, Dict]:
+        return self.get('/stores')
+
+    def doc_ids(self, store: str = None, facet: str = None) -> List[str]:
+        parameters = '&'.join(f'{key}={value}' for key, value in (("store", store), ("facet", facet)) if value)
+        return self.get(f'/doc_ids?{parameters}')
+
+    def document_neighbors(self, doc_ids: List[str], facet: str = None, topn: int = 10, store: str = None):
+        return self.post('/documents', {"store": store, "doc_ids": doc_ids, "facet": facet, "topn": topn})
+
+    def facet_similarities(self, pairs: List[Tuple[str, str]], facet: str = None, store: str = None):
+        return self.post('/facets', {"store": store, "pairs": pairs, "facet": facet})
+
+    def word_neighbors(self, queries: List[str], facet: str = None, topn: int = 10, store: str = None):
+        return self.post('/words', {"store": store, "queries": queries, "facet": facet, "topn": topn})
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    data_set = "classic_gutenberg"
+    served_vectors = {vector_name: Vectorization.build_vec_file_name("all", "no_limit", data_set, "no_filter",
+                                                                     vector_name, "real", allow_combination=True)
+                      for vector_name in ["book2vec", "book2vec_concat"]}
+    server = SimilarityServer.from_vector_paths(served_vectors)
+    logging.info(f'serving {list(served_vectors.keys())} on http://{server.server_address[0]}:{server.server_port}')
+    server.serve_forever()
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+from tqdm import tqdm
+from transformers import AutoTokenizer, AutoModel, AdamW
+
+from lib2vec.corpus_structure import Corpus, Document, ConfigLoader, DataHandler
+
+config = ConfigLoader.get_config()
+
+
+def token_cache_dir(model_name: str) -> str:
+    cache_dir = os.path.join(config["system_storage"].get("token_ids",
+                                                          os.path.join(config["system_storage"]["models"],
+                                                                       "token_ids")),
+                             model_name.replace('/', '_'))
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+
+class TransformerDocumentEncoder:
+    # whole books as overlapping fixed length windows, batched across documents and mean pooled per document
+    def __init__(self, model_name: str = "allenai/longformer-base-4096", window_len: int = 512, overlap: int = 64,
+                 batch_size: int = 8, quantize: bool = False, threads: int = None):
+        if overlap >= window_len - 2:
+            raise UserWarning(f"Overlap {overlap} has to be smaller than the window content of {window_len - 2}!")
+        self.model_name = model_name
+        self.window_len = window_len
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.quantize = quantize
+        if threads:
+            torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.model.eval()
+        self.statistics = {}
+
+    @staticmethod
+    def document_text(document: Document) -> str:
+        if document.file_path is not None:
+            return ' '.join(document.get_flat_tokens_from_disk())
+        return ' '.join(document.get_flat_document_tokens())
+
+    @staticmethod
+    def document_hash(document: Document) -> str:
+        if document.file_path is None:
+            return hashlib.sha1(TransformerDocumentEncoder.document_text(document).encode('utf-8')).hexdigest()
+        return DataHandler.file_hash(document.file_path)
+
+    def token_ids(self, document: Document) -> np.ndarray:
+        # every document is tokenised once per tokenizer, later runs read the ids from disk
+        cache_path = os.path.join(token_cache_dir(self.model_name),
+                                  f'{TransformerDocumentEncoder.document_hash(document)}.npy')
+        if os.path.isfile(cache_path):
+            return np.load(cache_path)
+        token_ids = np.array(self.tokenizer(TransformerDocumentEncoder.document_text(document),
+                                            add_special_tokens=False, verbose=False)["input_ids"], dtype=np.int32)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, token_ids)
+        os.replace(tmp_path, cache_path)
+        return token_ids
+
+    def windows(self, token_ids: np.ndarray) -> List[np.ndarray]:
+        # views of window_len - 2 content tokens, neighbouring windows share overlap tokens,
+        # the special tokens are only added in the padded batch
+        content_len = self.window_len - 2
+        step = content_len - self.overlap
+        starts = range(0, max(len(token_ids) - self.overlap, 1), step)
+        return [token_ids[start:start + content_len] for start in starts]
+
+    def corpus_windows(self, corpus: Corpus) -> Tuple[List[str], List[Tuple[int, np.ndarray]]]:
+        # the int32 token ids of each document are held once, windows only refer to them
+        doc_ids = list(corpus.documents.keys())
+        windows = [(doc_index, window)
+                   for doc_index, document in enumerate(tqdm(corpus.documents.values(), total=len(doc_ids),
+                                                             desc="Tokenize documents"))
+                   for window in self.windows(self.token_ids(document))]
+        return doc_ids, windows
+
+    def length_batches(self, windows: List[Tuple[int, np.ndarray]]) -> List[List[Tuple[int, np.ndarray]]]:
+        # windows of similar length share a batch, so only the last window of a document adds padding
+        ordered = sorted(windows, key=lambda window: len(window[1]))
+        return [ordered[i:i + self.batch_size] for i in range(0, len(ordered), self.batch_size)]
+
+    def padded_batch(self, batch: List[Tuple[int, np.ndarray]]) -> Tuple[torch.Tensor, torch.Tensor]:
+        # int64 ids of one batch with the special tokens around each window
+        max_len = max(len(window) for _, window in batch) + 2
+        input_ids = np.full((len(batch), max_len), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(batch), max_len), dtype=np.int64)
+        for row, (_, window) in enumerate(batch):
+            input_ids[row, 0] = self.tokenizer.cls_token_id
+            input_ids[row, 1:len(window) + 1] = window
+            input_ids[row, len(window) + 1] = self.tokenizer.sep_token_id
+            attention_mask[row, :len(window) + 2] = 1
+        return torch.from_numpy(input_ids), torch.from_numpy(attention_mask)
+
+    def tune(self, corpus: Corpus, epochs: int = 2, learning_rate: float = 5e-5):
+        # the former longformer_tuned objective, applied to window batches instead of the truncated corpus
+        _, windows = self.corpus_windows(corpus)
+        batches = self.length_batches(windows)
+        self.model.train()
+        optim = AdamW(self.model.parameters(), lr=learning_rate)
+        epoch_bar = tqdm(range(epochs), desc=f'Epoch {0} with loss UNKKOWN')
+        for epoch in epoch_bar:
+            epoch_loss = 0
+            for batch in batches:
+                optim.zero_grad()
+                input_ids, attention_mask = self.padded_batch(batch)
+                loss = self.model(input_ids=input_ids, attention_mask=attention_mask)[0].sum()
+                loss.backward()
+                optim.step()
+                epoch_loss += float(loss)
+            epoch_bar.set_description(desc=f'Epoch {epoch} with loss {epoch_loss:.2f}')
+        self.model.eval()
+
+    def inference_model(self):
+        if self.quantize:
+            # dynamic int8 weights of the linear layers, activations stay float
+            return torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        return self.model
+
+    def encode(self, corpus: Corpus) -> Dict[str, np.ndarray]:
+        start = time.time()
+        doc_ids, windows = self.corpus_windows(corpus)
+        tokenize_time = time.time() - start
+        model = self.inference_model()
+
+        # attention mask aware sums of the token embeddings of all windows of a document
+        doc_sums = None
+        doc_counts = np.zeros(len(doc_ids), dtype=np.float64)
+        tokens = 0
+        with torch.no_grad():
+            for batch in tqdm(self.length_batches(windows), desc="Encode windows"):
+                input_ids, attention_mask = self.padded_batch(batch)
+                hidden = model(input_ids=input_ids, attention_mask=attention_mask)[0]
+                mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+                window_sums = (hidden * mask).sum(dim=1).numpy()
+                if doc_sums is None:
+                    doc_sums = np.zeros((len(doc_ids), window_sums.shape[1]), dtype=np.float64)
+                doc_indices = np.array([doc_index for doc_index, _ in batch])
+                np.add.at(doc_sums, doc_indices, window_sums)
+                np.add.at(doc_counts, doc_indices, attention_mask.sum(dim=1).numpy())
+                tokens += int(attention_mask.sum())
+
+        if doc_sums is None:
+            raise UserWarning("No documents to encode!")
+        duration = time.time() - start
+        self.statistics = {"documents": len(doc_ids),
+                           "windows": len(windows),
+                           "tokens": tokens,
+                           "tokenize_seconds": tokenize_time,
+                           "seconds": duration,
+                           "tokens_per_second": tokens / max(duration - tokenize_time, 1e-9),
+                           "quantized": self.quantize,
+                           "threads": torch.get_num_threads()}
+        logging.info(f'encoded {len(doc_ids)} documents in {len(windows)} windows, '
+                     f'{self.statistics["tokens_per_second"]:.0f} tokens/s')
+        return {doc_id: (doc_sums[doc_index] / max(doc_counts[doc_index], 1)).astype(np.float32)
+                for doc_index, doc_id in enumerate(doc_ids)}
@@ -1,7 +1,10 @@
+import hashlib
+import json
 import logging
 import os
 import time
-from typing import Union, List
+from collections import Counter, defaultdict
+from typing import Union, List, Dict, Set
 
 import nltk
 from gensim.models import KeyedVectors, Word2Vec
@@ -10,30 +13,37 @@ import numpy as np
 import pandas as pd
 from gensim.scripts.glove2word2vec import glove2word2vec
 from gensim.test.utils import get_tmpfile, datapath
+from joblib import Parallel, delayed
 from sklearn.feature_extraction.text import CountVectorizer
 
 from tqdm import tqdm
-import torch
-from transformers import TFAutoModel, AutoTokenizer, AdamW, AutoModel
 
 from lib2vec.corpus_iterators import CorpusSentenceIterator, \
     CorpusDocumentIterator, CorpusTaggedDocumentIterator, CorpusTaggedFacetIterator, \
     write_doc_based_aspect_frequency_analyzis, FlairDocumentIterator, FlairFacetIterator, CorpusTaggedSentenceIterator, \
-    CorpusPlainDocumentIterator, FlairSentenceDocumentIterator
+    CorpusPlainDocumentIterator, FlairSentenceDocumentIterator, ChunkRegistry
 from baselines.flair_connector import FlairConnector
 from baselines.psif import PSIFVectors
 from extensions.text_summarisation import Summarizer
 from extensions.topic_modelling import TopicModeller
-from lib2vec.corpus_structure import Corpus, ConfigLoader, Language
+from lib2vec.corpus_structure import Corpus, ConfigLoader, Language, DoctagParser, DataHandler
+from lib2vec.transformer_inference import TransformerDocumentEncoder
 from lib2vec.vectorization_utils import Vectorization
 
 config = ConfigLoader.get_config()
+# trained Doc2Vec models of the inference worker processes, loaded once per process
+_inference_models = {}
 
 
-def robust_vec_loading(pretrained_emb_path: str = None, binary: bool = False):
-    logging.info(f'Load pretrained embeddings from {pretrained_emb_path}')
-    if pretrained_emb_path is None:
-        return None
+def embedding_cache_dir() -> str:
+    cache_dir = config["system_storage"].get("embeddings",
+                                             os.path.join(config["system_storage"]["models"], "embeddings"))
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+
+def load_text_vectors(pretrained_emb_path: str, binary: bool = False):
     try:
         model = KeyedVectors.load_word2vec_format(pretrained_emb_path, binary=binary)
     except ValueError:
@@ -41,6 +51,46 @@ def robust_vec_loading(pretrained_emb_path: str = None, binary: bool = False):
         tmp_file = get_tmpfile("test_word2vec.txt")
         _ = glove2word2vec(glove_file, tmp_file)
         model = KeyedVectors.load_word2vec_format(tmp_file)
+    return model
+
+
+def prune_vectors(model, vocabulary: Set[str]):
+    words = [word for word in model.index2word if word in vocabulary]
+    pruned_model = KeyedVectors(model.vector_size)
+    pruned_model.add(words, model.vectors[[model.vocab[word].index for word in words]])
+    return pruned_model
+
+
+def robust_vec_loading(pretrained_emb_path: str = None, binary: bool = False, vocabulary: Set[str] = None,
+                       use_cache: bool = True):
+    logging.info(f'Load pretrained embeddings from {pretrained_emb_path}')
+    if pretrained_emb_path is None:
+        return None
+    if not use_cache:
+        model = load_text_vectors(pretrained_emb_path, binary=binary)
+        if vocabulary is not None:
+            model = prune_vectors(model, vocabulary)
+        logging.info('load completed')
+        return model
+
+    # the text format is parsed only once, afterwards the native format is memory mapped read only,
+    # so parallel runs share the vector pages through the os page cache
+    cache_name = DataHandler.file_hash(pretrained_emb_path)
+    if vocabulary is not None:
+        vocabulary_hash = hashlib.sha1('\n'.join(sorted(vocabulary)).encode('utf-8')).hexdigest()
+        cache_name = f'{cache_name}_{vocabulary_hash[:16]}'
+    cache_path = os.path.join(embedding_cache_dir(), f'{cache_name}.kv')
+    if not os.path.isfile(cache_path):
+        model = load_text_vectors(pretrained_emb_path, binary=binary)
+        if vocabulary is not None:
+            model = prune_vectors(model, vocabulary)
+        # written under a temporary name first, so a parallel run never maps a half written cache
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        model.save(tmp_path, separately=['vectors'])
+        os.replace(f'{tmp_path}.vectors.npy', f'{cache_path}.vectors.npy')
+        os.replace(tmp_path, cache_path)
+        logging.info(f'cached {pretrained_emb_path} as {cache_path}')
+    model = KeyedVectors.load(cache_path, mmap='r')
     logging.info('load completed')
     return model
 
@@ -58,6 +108,9 @@ class Vectorizer:
     pretrained_emb_path_german = config["embeddings"]["pretrained_german"]
     # "E:/embeddings/glove.6B.300d.txt" # "E:/embeddings/google300.txt"
     pretrained_emb_german = None
+    word_weightings = [None, "sif", "tfidf"]
+    word_weighting = None
+    sif_a = 1e-3
 
     @staticmethod
     def algorithm(input_str: str, corpus: Corpus, save_path: str = "models/",
@@ -88,6 +141,18 @@ class Vectorizer:
                 facets_of_chunks = True
                 input_str = input_str.replace("_facet", "")
 
+        chunk_aggregation = "mean"
+        for strategy in ChunkRegistry.aggregation_strategies:
+            if f"_chunk_{strategy}" in input_str:
+                chunk_aggregation = strategy
+                input_str = input_str.replace(f"_chunk_{strategy}", "_chunk")
+
+        Vectorizer.word_weighting = None
+        for word_weighting in Vectorizer.word_weightings[1:]:
+            if input_str.startswith("avg_wv2doc") and f"_{word_weighting}" in input_str:
+                Vectorizer.word_weighting = word_weighting
+                input_str = input_str.replace(f"_{word_weighting}", "")
+
         window = 0
         if "_window_10" in input_str:
             window = 10
@@ -130,258 +195,323 @@ class Vectorizer:
         elif input_str == "bow":
             return Vectorizer.bow(corpus, save_path, return_vecs=return_vecs)
         elif input_str == "doc2vec":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=dim)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=dim)
         elif input_str == "doc2vec_dbow":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=dim,
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=dim,
                                       dbow=True)
         elif input_str == "doc2vec_sentence_based":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=dim,
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=dim,
                                       sentence_based=True)
         elif input_str == "doc2vec_sentence_based_100":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=dim,
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=dim,
                                       sentence_based=True, sentence_nr=100)
         elif input_str == "doc2vec_sentence_based_1000":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=dim,
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=dim,
                                       sentence_based=True, sentence_nr=1000)
         elif input_str == "doc2vec_dim50":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=50)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=50)
         elif input_str == "doc2vec_dim100":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=100)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=100)
         elif input_str == "doc2vec_dim300":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=300)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=300)
         elif input_str == "doc2vec_dim500":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=500)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=500)
         elif input_str == "doc2vec_dim700":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=700)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=700)
         elif input_str == "doc2vec_dim900":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, dimension=900)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, dimension=900)
 
         elif input_str == "doc2vec_win1":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=1)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=1)
         elif input_str == "doc2vec_win2":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=2)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=2)
         elif input_str == "doc2vec_win3":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=3)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=3)
         elif input_str == "doc2vec_win4":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=4)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=4)
         elif input_str == "doc2vec_win5":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=5)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=5)
         elif input_str == "doc2vec_win6":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=6)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=6)
         elif input_str == "doc2vec_win7":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=7)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=7)
         elif input_str == "doc2vec_win10":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=10)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=10)
         elif input_str == "doc2vec_win15":
-            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len, window=15)
+            return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                      chunk_aggregation=chunk_aggregation, window=15)
 
         elif input_str == "doc2vec_untrained":
             return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs, without_training=True,
-                                      chunk_len=chunk_len, dimension=dim)
+                                      chunk_len=chunk_len, chunk_aggregation=chunk_aggregation, dimension=dim)
         elif input_str == "doc2vec_pretrained":
             return Vectorizer.doc2vec(corpus, save_path, return_vecs=return_vecs,
-                                      chunk_len=chunk_len, dimension=dim, pretrained=True)
-        # elif input_str == "longformer" or "longformer_untuned" or "untuned_longformer":
-        #     return Vectorizer.longformer_untuned(corpus, save_path, return_vecs=return_vecs)
-        # elif input_str == "longformer_tuned" or "tuned_longformer":
-        #     return Vectorizer.longformer_tuned(corpus, save_path, return_vecs=return_vecs)
+                                      chunk_len=chunk_len, chunk_aggregation=chunk_aggregation, dimension=dim,
+                                      pretrained=True)
+        elif input_str == "longformer_untuned" or input_str == "untuned_longformer":
+            return Vectorizer.longformer_untuned(corpus, save_path, return_vecs=return_vecs)
+        elif input_str == "longformer_tuned" or input_str == "tuned_longformer":
+            return Vectorizer.longformer_tuned(corpus, save_path, return_vecs=return_vecs)
         elif input_str == "book2vec_simple" or input_str == "book2vec":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_simple_dbow" or input_str == "book2vec_dbow":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               dbow=True)
         elif input_str == "book2vec_simple_win3" or input_str == "book2vec_win3":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               doc_window=3)
         elif input_str == "book2vec_simple_win5" or input_str == "book2vec_win5":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               doc_window=5)
         elif input_str == "book2vec_simple_net" or input_str == "book2vec_net":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               use_dictionary_lookup="Both")
         elif input_str == "book2vec_simple_net_only" or input_str == "book2vec_net_only":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               use_dictionary_lookup="Only")
         elif input_str == "book2vec_dbow_simple_net" or input_str == "book2vec_dbow_net":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               dbow=True,
                                               use_dictionary_lookup="Both")
         elif input_str == "book2vec_dbow_simple_net_only" or input_str == "book2vec_dbow_net_only":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               dbow=True,
                                               use_dictionary_lookup="Only")
         elif input_str == "book2vec_simple_pretained" or input_str == "book2vec_pretrained":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               pretrained=True)
         elif input_str == "book2vec_simple_dim50" or input_str == "book2vec_dim50":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=50)
         elif input_str == "book2vec_simple_dim100" or input_str == "book2vec_dim100":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=100)
         elif input_str == "book2vec_simple_dim300" or input_str == "book2vec_dim300":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=300)
         elif input_str == "book2vec_simple_dim500" or input_str == "book2vec_dim500":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=500)
         elif input_str == "book2vec_simple_dim700" or input_str == "book2vec_dim700":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=700)
         elif input_str == "book2vec_simple_dim900" or input_str == "book2vec_dim900":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               disable_aspects=['plot', 'cont'], chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=900)
 
         elif input_str == "book2vec_wo_raw":
             return Vectorizer.book2vec_simple(corpus, save_path,
                                               disable_aspects=['raw', 'plot', 'cont'], return_vecs=return_vecs,
-                                              chunk_len=chunk_len,
+                                              chunk_len=chunk_len, chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_dbow_wo_raw":
             return Vectorizer.book2vec_simple(corpus, save_path,
                                               disable_aspects=['raw', 'plot', 'cont'], return_vecs=return_vecs,
-                                              chunk_len=chunk_len,
+                                              chunk_len=chunk_len, chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                               dbow=True)
         elif input_str == "book2vec_wo_loc":
             return Vectorizer.book2vec_simple(corpus, save_path,
                                               disable_aspects=['loc', 'plot', 'cont'] , return_vecs=return_vecs, chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_wo_time":
             return Vectorizer.book2vec_simple(corpus, save_path,
                                               disable_aspects=['time', 'plot', 'cont'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_wo_sty":
             return Vectorizer.book2vec_simple(corpus, save_path,
                                               disable_aspects=['sty', 'plot', 'cont'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_wo_atm":
             return Vectorizer.book2vec_simple(corpus, save_path,
                                               disable_aspects=['atm', 'plot', 'cont'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_wo_plot":
             return Vectorizer.book2vec_simple(corpus, save_path,
                                               disable_aspects=['cont'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_simple_untrained" or input_str == "book2vec_untrained":
             return Vectorizer.book2vec_simple(corpus, save_path, return_vecs=return_vecs,
                                               without_training=True, chunk_len=chunk_len,
+                                              chunk_aggregation=chunk_aggregation,
                                               facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_advn":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            basic_mode=True)
         elif input_str == "book2vec_adv_dbow":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            dbow=True)
         elif input_str == "book2vec_advn_dbow":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            dbow=True, basic_mode=True)
         elif input_str == "book2vec_adv_dbow_wo_raw":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            dbow=True, disable_aspects=["raw"])
         elif input_str == "book2vec_adv_dbow_net_wo_raw":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            dbow=True, disable_aspects=["raw"], use_dictionary_lookup="Both")
 
         elif input_str == "book2vec_adv_net":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            use_dictionary_lookup="Both")
         elif input_str == "book2vec_adv_net_only":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            use_dictionary_lookup="only")
         elif input_str == "book2vec_adv_pretrained":
             return Vectorizer.book2vec_adv(corpus, save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            pretrained=True)
         elif input_str == "book2vec_adv_wo_raw":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['raw'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_loc":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['loc'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_time":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['time'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_sty":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['sty'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_atm":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['atm'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_plot":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['plot'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_cont":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['cont'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_raw":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['raw'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_loc":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['loc'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_time":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['time'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_sty":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['sty'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_atm":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['atm'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_plot":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['plot'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_adv_wo_cont":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['cont'], return_vecs=return_vecs, chunk_len=chunk_len,
+                                           chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         # elif input_str == "book2vec_adv_w_raw":
         #     return Vectorizer.book2vec_adv(corpus, save_path,
@@ -409,108 +539,137 @@ class Vectorizer:
                                            disable_aspects=['cont'],
                                            return_vecs=return_vecs,
                                            algorithm="avg_w2v",
-                                           chunk_len=chunk_len,
+                                           chunk_len=chunk_len, chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "book2vec_bert":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['cont', 'plot'],
                                            return_vecs=return_vecs,
                                            algorithm="transformer",
-                                           chunk_len=chunk_len,
+                                           chunk_len=chunk_len, chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim)
         elif input_str == "random_aspect2vec" or input_str == "random":
             return Vectorizer.random_aspect2vec(corpus, save_path, return_vecs=return_vecs,
                                                 algorithm="doc2vec", dimension=dim)
         elif input_str == "glove":
-            return Vectorizer.flair(corpus, "glove", "pool", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, "glove", "pool", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "glove_rnn":
-            return Vectorizer.flair(corpus, "glove", "rnn", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, "glove", "rnn", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "fasttext":
-            return Vectorizer.flair(corpus, "fasttext", "pool", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, "fasttext", "pool", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "fasttext_rnn":
-            return Vectorizer.flair(corpus, "fasttext", "rnn", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, "fasttext", "rnn", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "bert":
-            return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "roberta":
-            return Vectorizer.flair(corpus, None, "roberta", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, None, "roberta", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "xlm":
-            return Vectorizer.flair(corpus, None, "xlm", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, None, "xlm", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "bert_pt":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     pretuned=True)
         elif input_str == "book2vec_bert_pt":
             return Vectorizer.book2vec_adv(corpus, save_path,
                                            disable_aspects=['cont', 'plot'],
                                            return_vecs=return_vecs,
                                            algorithm="transformer",
-                                           chunk_len=chunk_len,
+                                           chunk_len=chunk_len, chunk_aggregation=chunk_aggregation,
                                            facets_of_chunks=facets_of_chunks, window_size=window, dimension=dim,
                                            pretuned=True)
         elif input_str == "roberta_pt":
             return Vectorizer.flair(corpus, None, "roberta", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     pretuned=True)
         elif input_str == "xlm_pt":
             return Vectorizer.flair(corpus, None, "xlm", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     pretuned=True)
         elif input_str == "bert_sentence_based":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True)
         elif input_str == "bert_sentence_based_100":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=100)
         elif input_str == "bert_sentence_based_1000":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=1000)
         elif input_str == "longformer":
-            return Vectorizer.flair(corpus, None, "longformer", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, None, "longformer", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "flair":
-            return Vectorizer.flair(corpus, None, "flair", save_path, return_vecs=return_vecs, chunk_len=chunk_len)
+            return Vectorizer.flair(corpus, None, "flair", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation)
         elif input_str == "flair_sentence_based":
             return Vectorizer.flair(corpus, None, "flair", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True)
         elif input_str == "flair_sentence_based_100":
             return Vectorizer.flair(corpus, None, "flair", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=100)
         elif input_str == "flair_sentence_based_1000":
             return Vectorizer.flair(corpus, None, "flair", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=1000)
         elif input_str == "stacked_flair":
             return Vectorizer.flair(corpus, None, "stacked_flair", save_path, return_vecs=return_vecs,
-                                    chunk_len=chunk_len)
+                                    chunk_len=chunk_len, chunk_aggregation=chunk_aggregation)
         elif input_str == "topic_vec" or input_str == "topic_vecs" or input_str == "topic2vec":
             Vectorizer.topic_vecs(corpus, save_path=save_path, return_vecs=return_vecs)
         elif input_str == "bert_sentence_based_pt":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, pretuned=True)
         elif input_str == "bert_sentence_based_100_pt":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=100, pretuned=True)
         elif input_str == "bert_sentence_based_1000_pt":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=1000, pretuned=True)
         elif input_str == "bert_sentence_based_2000_pt":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=2000, pretuned=True)
         elif input_str == "bert_sentence_based_3000_pt":
             return Vectorizer.flair(corpus, None, "bert", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=3000, pretuned=True)
         elif input_str == "roberta_sentence_based_pt":
             return Vectorizer.flair(corpus, None, "roberta", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, pretuned=True)
         elif input_str == "roberta_sentence_based_100_pt":
             return Vectorizer.flair(corpus, None, "roberta", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=100, pretuned=True)
         elif input_str == "roberta_sentence_based_1000_pt":
             return Vectorizer.flair(corpus, None, "roberta", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=1000, pretuned=True)
         elif input_str == "xlm_sentence_based_pt":
             return Vectorizer.flair(corpus, None, "xlm", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, pretuned=True)
         elif input_str == "xlm_sentence_based_100_pt":
             return Vectorizer.flair(corpus, None, "xlm", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=100, pretuned=True)
         elif input_str == "xlm_sentence_based_1000_pt":
             return Vectorizer.flair(corpus, None, "xlm", save_path, return_vecs=return_vecs, chunk_len=chunk_len,
+                                    chunk_aggregation=chunk_aggregation,
                                     sentence_based=True, sentence_nr=1000, pretuned=True)
         elif input_str == "psif":
             return Vectorizer.psif(corpus, save_path, return_vecs=return_vecs)
@@ -526,7 +685,8 @@ class Vectorizer:
                       restrict_to: int = None,
                       dimension: int = None,
                       language: Language = Language.EN,
-                      pretrained: bool = False):
+                      pretrained: bool = False,
+                      weighting: str = None):
         if dimension is None:
             dimension = cls.dim
         print(f'use pretrained = {pretrained} for {language}')
@@ -552,70 +712,148 @@ class Vectorizer:
             if not without_training:
                 model.train(preprocessed_sentences, total_examples=model.corpus_count, epochs=cls.epochs)
 
-        docs_dict = {}
+        docs_dict = cls.average_word_vectors(model, preprocessed_documents, doc_ids, restrict_to=restrict_to,
+                                             weighting=weighting)
+
+        vectors = model.wv.vectors
+        words_dict = {word: vectors[vocab.index] for word, vocab in model.wv.vocab.items()}
+        return model, words_dict, docs_dict
+
+    @staticmethod
+    def token_rows(model, tokens: List[str], row_cache: Dict[str, int]) -> np.ndarray:
+        # row of each token in the embedding matrix, -1 for out of vocabulary tokens
+        rows = np.empty(len(tokens), dtype=np.int64)
+        for i, token in enumerate(tokens):
+            row = row_cache.get(token)
+            if row is None:
+                vocab = model.wv.vocab.get(token)
+                if vocab is None:
+                    vocab = model.wv.vocab.get(token.lower())
+                row = -1 if vocab is None else vocab.index
+                row_cache[token] = row
+            rows[i] = row
+        return rows
+
+    @classmethod
+    def average_word_vectors(cls, model, preprocessed_documents, doc_ids, restrict_to: int = None,
+                             weighting: str = None) -> Dict[str, np.ndarray]:
+        if weighting is None:
+            weighting = cls.word_weighting
+        if weighting not in cls.word_weightings:
+            raise UserWarning(f"Unknown word weighting {weighting}!")
+
+        # first pass reduces every document to the counts of its distinct embedding rows
+        row_cache = {}
+        doc_rows = {}
         for doc_id, doc in zip(doc_ids, preprocessed_documents):
-            vector = []
             if isinstance(doc, TaggedDocument):
                 doc = doc.words
-                # print(doc_id, doc)
             if len(doc) == 0:
                 continue
             if restrict_to:
                 print("before restrict", len(doc))
                 doc = doc[:restrict_to]
                 print("after restsrict", len(doc))
-            for token in doc:
-                # print(token, model.wv.vocab[token])
-                try:
-                    vec = model.wv[token]
-                    vector.append(vec)
-                except KeyError:
-                    try:
-                        vec = model.wv[token.lower()]
-                        vector.append(vec)
-                    except KeyError:
-                        logging.error(f'KeyError Error for {doc_id} and {token}')
-            # print(doc_id, doc, vector)
-            try:
-                vector = sum(np.array(vector)) / len(vector)
-                docs_dict[doc_id] = vector
-            except ZeroDivisionError:
+            token_counts = Counter(doc)
+            rows = cls.token_rows(model, list(token_counts.keys()), row_cache)
+            counts = np.fromiter(token_counts.values(), dtype=np.int64, count=len(token_counts))
+            unknown = rows < 0
+            if unknown.all():
                 logging.error(f'ZeroDivision Error for {doc_id}')
                 raise UserWarning(f"ZeroDevision Error for {doc_id}")
+            if unknown.any():
+                logging.error(f'KeyError Error for {doc_id} and {int(counts[unknown].sum())} tokens')
+            # a token and its lower case form can share one row
+            rows, inverse = np.unique(rows[~unknown], return_inverse=True)
+            doc_rows[doc_id] = rows, np.bincount(inverse, weights=counts[~unknown]).astype(np.int64)
+
+        if len(doc_rows) == 0:
+            return {}
+
+        vectors = model.wv.vectors
+        vocab_size = len(vectors)
+        if weighting == "sif":
+            term_frequencies = np.zeros(vocab_size, dtype=np.float64)
+            for rows, counts in doc_rows.values():
+                term_frequencies[rows] += counts
+            row_weights = cls.sif_a / (cls.sif_a + term_frequencies / term_frequencies.sum())
+        elif weighting == "tfidf":
+            document_frequencies = np.zeros(vocab_size, dtype=np.float64)
+            for rows, _ in doc_rows.values():
+                document_frequencies[rows] += 1
+            row_weights = np.log((1 + len(doc_rows)) / (1 + document_frequencies)) + 1
+        else:
+            row_weights = None
 
-        words_dict = {word: model.wv[word] for word in model.wv.vocab}
-        return model, words_dict, docs_dict
+        docs_dict = {}
+        for doc_id, (rows, counts) in doc_rows.items():
+            if row_weights is None:
+                weights = counts
+                norm = counts.sum()
+            else:
+                weights = counts * row_weights[rows]
+                norm = counts.sum() if weighting == "sif" else weights.sum()
+            docs_dict[doc_id] = (weights @ vectors[rows].astype(np.float64) / norm).astype(vectors.dtype)
+
+        if weighting == "sif":
+            # removes the projection on the first singular vector (common discourse direction)
+            doc_matrix = np.array(list(docs_dict.values()))
+            _, _, vh = np.linalg.svd(doc_matrix, full_matrices=False)
+            common_component = vh[0]
+            doc_matrix = doc_matrix - np.outer(doc_matrix @ common_component, common_component)
+            docs_dict = {doc_id: vector for doc_id, vector in zip(docs_dict.keys(), doc_matrix)}
+
+        return docs_dict
 
     @classmethod
-    def avg_sim_prefix_doc_ids(cls, input_doc_vectors):
+    def avg_sim_prefix_doc_ids(cls, input_doc_vectors, doctag_parser: DoctagParser = None):
+        if doctag_parser is None:
+            # without known doc ids the last id part is dropped, e.g. x_0_time and x_0_loc are averaged to x_0
+            groups = defaultdict(list)
+            for doc_id in input_doc_vectors.keys():
+                groups['_'.join(str(doc_id).split('_')[:-1])].append(doc_id)
+        else:
+            groups = doctag_parser.group_by_base_id(input_doc_vectors.keys())
         docs_dict = {}
-        completed_ids = set()
-        for doc_id, doc in input_doc_vectors.items():
-            prefix_doc_id = '_'.join(doc_id.split('_')[:-1])
-            doc_vectors = [doc]
-            completed_ids.add(doc_id)
-
-            for doc_id_2, doc_2 in input_doc_vectors.items():
-                if str(doc_id_2).startswith(f'{prefix_doc_id}_') and doc_id_2 not in completed_ids:
-                    completed_ids.add(doc_id_2)
-                    doc_vectors.append(doc_2)
-                    # print(prefix_doc_id, doc_2, len(doc_vectors))
-            try:
-                vector = sum(np.array(doc_vectors)) / len(doc_vectors)
-                docs_dict[prefix_doc_id] = vector
-            except ZeroDivisionError:
-                logging.error(f'ZeroDivision Error for {doc_id}')
-                raise UserWarning(f"ZeroDevision Error for {doc_id}")
+        for prefix_doc_id, doc_ids in groups.items():
+            docs_dict[prefix_doc_id] = np.mean(np.array([input_doc_vectors[doc_id] for doc_id in doc_ids]), axis=0)
 
         return docs_dict
 
+    @classmethod
+    def aggregate_chunks(cls, documents, input_doc_vectors, strategy: str = "mean"):
+        chunk_registry = getattr(documents, 'chunk_registry', None)
+        if chunk_registry is None or len(chunk_registry) == 0:
+            return cls.avg_sim_prefix_doc_ids(input_doc_vectors)
+        return chunk_registry.aggregate(input_doc_vectors, strategy=strategy)
+
+    @staticmethod
+    def store_chunk_registry(documents, save_path: str):
+        chunk_registry = getattr(documents, 'chunk_registry', None)
+        if chunk_registry is not None and len(chunk_registry) > 0:
+            chunk_registry.save(save_path)
+
+    @staticmethod
+    def reaggregate_chunks(save_path: str, strategy: str = "mean"):
+        # builds document vectors of an already trained chunk model with another aggregation strategy
+        vecs, _ = Vectorization.my_load_doc2vec_format(fname=save_path)
+        chunk_registry = ChunkRegistry.load(save_path)
+        if len(chunk_registry) == 0:
+            raise UserWarning(f"No chunk registry stored for {save_path}!")
+        missing = [chunk_tag for chunk_tag in chunk_registry.chunks if chunk_tag not in vecs.docvecs.doctags]
+        if len(missing) > 0:
+            raise UserWarning(f"{len(missing)} chunk vectors are not stored for {save_path}!")
+        chunk_vecs = {chunk_tag: vecs.docvecs[chunk_tag] for chunk_tag in chunk_registry.chunks}
+        return chunk_registry.aggregate(chunk_vecs, strategy=strategy)
+
     @classmethod
     def doc2vec_base(cls, documents: Union[List[str], CorpusTaggedDocumentIterator, CorpusTaggedFacetIterator],
                      without_training: bool, chunk_len: int = None, dimension: int = None, sentence_based: bool = False,
                      language: Language = Language.EN,
                      pretrained: bool = False,
                      window: int = None,
-                     dbow: bool = False):
+                     dbow: bool = False,
+                     chunk_aggregation: str = "mean"):
         # model = Doc2Vec(documents, vector_size=100, window=10, min_count=2, workers=4, epochs=20)
         # model = Doc2Vec(documents, vector_size=cls.dim, window=cls.window, min_count=cls.min_count,
         #                 workers=cls.workers, epochs=cls.epochs, pretrained_emb=cls.pretrained_emb_path, seed=cls.seed)
@@ -657,18 +895,168 @@ class Vectorizer:
         words_dict, docs_dict = Vectorizer.model2dict(model)
 
         if chunk_len:
-            docs_dict.update(cls.avg_sim_prefix_doc_ids(docs_dict))
+            docs_dict.update(cls.aggregate_chunks(documents, docs_dict, strategy=chunk_aggregation))
         if sentence_based:
-            docs_dict = cls.avg_sim_prefix_doc_ids(docs_dict)
+            docs_dict = cls.aggregate_chunks(documents, docs_dict, strategy=chunk_aggregation)
 
         return model, words_dict, docs_dict
 
+    @staticmethod
+    def doc2vec_model_path(save_path: str) -> str:
+        return f'{save_path}_d2v.model'
+
+    @staticmethod
+    def save_doc2vec_model(model: Doc2Vec, save_path: str, document_settings: Dict):
+        # the trained model and the settings of its training documents, needed to infer vectors of new documents
+        model.save(Vectorizer.doc2vec_model_path(save_path))
+        with open(f'{Vectorizer.doc2vec_model_path(save_path)}.json', 'w', encoding='utf-8') as fp:
+            json.dump(document_settings, fp, indent=1)
+
+    @staticmethod
+    def load_doc2vec_model(save_path: str, mmap: str = None):
+        model_path = Vectorizer.doc2vec_model_path(save_path)
+        if not os.path.isfile(model_path):
+            raise UserWarning(f"No trained Doc2Vec model stored for {save_path}!")
+        with open(f'{model_path}.json', encoding='utf-8') as json_file:
+            document_settings = json.load(json_file)
+        return Doc2Vec.load(model_path, mmap=mmap), document_settings
+
+    @staticmethod
+    def inference_documents(corpus: Corpus, document_settings: Dict, workers: int = 1):
+        # the same tagged documents as in training, so inferred vectors are comparable to trained ones
+        if document_settings.get("chunk_len"):
+            raise UserWarning("Inference for chunked documents is not supported!")
+        if document_settings["iterator"] == "document":
+            return CorpusTaggedDocumentIterator(corpus)
+
+        disable_aspects = document_settings["disable_aspects"]
+        topic_dict = None
+        summary_dict = None
+        # topics and summaries of exactly the given documents, with the LDA model and summary store of training
+        if "cont" not in disable_aspects:
+            topic_dict = TopicModeller.infer_topic_matrix(corpus, document_settings.get("topic_model")).topic_dict()
+        if "plot" not in disable_aspects and not document_settings["basic_mode"]:
+            if document_settings.get("summary_store") is None:
+                raise UserWarning("No summary store recorded for the trained model!")
+            summary_dict = Summarizer.get_document_summaries(corpus, document_settings["summary_store"],
+                                                             workers=workers)
+        return CorpusTaggedFacetIterator(corpus, lemma=document_settings["lemma"], lower=document_settings["lower"],
+                                         disable_aspects=disable_aspects, topic_dict=topic_dict,
+                                         summary_dict=summary_dict,
+                                         facets_of_chunks=document_settings["facets_of_chunks"],
+                                         window=document_settings["window"],
+                                         use_dictionary_lookup=document_settings["use_dictionary_lookup"],
+                                         basic_mode=document_settings["basic_mode"], workers=workers)
+
+    @staticmethod
+    def infer_tagged_documents(model_path: str, tagged_documents: List[TaggedDocument], epochs: int = None) \
+            -> Dict[str, np.ndarray]:
+        # runs in the worker processes, each loads the memory mapped model once
+        if model_path not in _inference_models:
+            _inference_models[model_path] = Doc2Vec.load(model_path, mmap='r')
+        model = _inference_models[model_path]
+        return {tagged_document.tags[0]: model.infer_vector(tagged_document.words, epochs=epochs)
+                for tagged_document in tagged_documents}
+
+    @classmethod
+    def infer_vectors(cls, corpus: Corpus, save_path: str, workers: int = 4, batch_size: int = 16,
+                      epochs: int = None) -> Dict[str, np.ndarray]:
+        start = time.time()
+        _, document_settings = cls.load_doc2vec_model(save_path, mmap='r')
+        tagged_documents = list(cls.inference_documents(corpus, document_settings, workers=workers))
+        facet_time = time.time() - start
+
+        batches = [tagged_documents[i:i + batch_size] for i in range(0, len(tagged_documents), batch_size)]
+        model_path = cls.doc2vec_model_path(save_path)
+        inferred_batches = Parallel(n_jobs=workers)(delayed(cls.infer_tagged_documents)(model_path, batch, epochs)
+                                                    for batch in tqdm(batches, desc="Infer vectors"))
+        docs_dict = {tag: vector for inferred_batch in inferred_batches for tag, vector in inferred_batch.items()}
+        duration = time.time() - start
+        logging.info(f'inferred {len(docs_dict)} vectors of {len(corpus.documents)} documents in {duration:.1f}s '
+                     f'({facet_time:.1f}s facet extraction), {len(corpus.documents) / duration:.2f} documents/s')
+        return docs_dict
+
+    @classmethod
+    def append_inferred_documents(cls, corpus: Corpus, save_path: str, workers: int = 4, overwrite: bool = False,
+                                  return_vecs: bool = True):
+        # adds the vectors of new documents to a trained vector store without retraining
+        vecs, _ = Vectorization.my_load_doc2vec_format(save_path)
+        existing_doctags = set(vecs.docvecs.doctags.keys())
+        new_documents = {doc_id: document for doc_id, document in corpus.documents.items()
+                         if overwrite or doc_id not in existing_doctags}
+        if len(new_documents) == 0:
+            logging.info("all documents are already in the vector store")
+            return vecs if return_vecs else True
+        new_corpus = Corpus(source=new_documents, name=corpus.name, language=corpus.language)
+        inferred_dict = cls.infer_vectors(new_corpus, save_path, workers=workers)
+
+        _, document_settings = cls.load_doc2vec_model(save_path, mmap='r')
+        if document_settings["iterator"] == "facet":
+            # combined vectors of the new documents, computed the same way as in training
+            for combination, combine in [("con", Vectorization.combine_vectors_by_concat),
+                                         ("avg", Vectorization.combine_vectors_by_avg)]:
+                if os.path.isfile(f'{save_path}_{combination}'):
+                    combination_vecs, _ = Vectorization.my_load_doc2vec_format(f'{save_path}_{combination}')
+                    combination_dict = {doctag: combination_vecs.docvecs[doctag]
+                                         for doctag in combination_vecs.docvecs.doctags}
+                    combination_dict.update(combine({doctag: vector.copy()
+                                                     for doctag, vector in inferred_dict.items()}))
+                    Vectorization.store_vecs_and_reload(save_path=f'{save_path}_{combination}',
+                                                        docs_dict=combination_dict, words_dict=None,
+                                                        return_vecs=False)
+            inferred_dict = Vectorization.combine_vectors_by_sum(inferred_dict)
+
+        docs_dict = {doctag: vecs.docvecs[doctag] for doctag in vecs.docvecs.doctags}
+        docs_dict.update(inferred_dict)
+        words_dict = {word: vecs.wv[word] for word in vecs.wv.vocab} if len(vecs.wv) > 0 else None
+        return Vectorization.store_vecs_and_reload(save_path=save_path, docs_dict=docs_dict, words_dict=words_dict,
+                                                   return_vecs=return_vecs)
+
+    @classmethod
+    def inference_consistency(cls, corpus: Corpus, save_path: str, sample_size: int = 100, workers: int = 4,
+                              seed: int = 42) -> Dict[str, float]:
+        # inferred vectors of training documents compared to their trained vectors
+        model, _ = cls.load_doc2vec_model(save_path, mmap='r')
+        doc_ids = sorted(corpus.documents.keys())
+        doc_ids = list(np.random.RandomState(seed).choice(doc_ids, min(sample_size, len(doc_ids)), replace=False))
+        sample_corpus = Corpus(source={doc_id: corpus.documents[doc_id] for doc_id in doc_ids},
+                               name=corpus.name, language=corpus.language)
+
+        start = time.time()
+        inferred_dict = cls.infer_vectors(sample_corpus, save_path, workers=workers)
+        duration = time.time() - start
+
+        doctags = [doctag for doctag in inferred_dict if doctag in model.docvecs.doctags]
+        if len(doctags) == 0:
+            raise UserWarning("No inferred doctag is part of the trained model!")
+        trained = np.array([model.docvecs[doctag] for doctag in doctags], dtype=np.float32)
+        inferred = np.array([inferred_dict[doctag] for doctag in doctags], dtype=np.float32)
+        trained /= np.maximum(np.linalg.norm(trained, axis=1, keepdims=True), 1e-12)
+        inferred /= np.maximum(np.linalg.norm(inferred, axis=1, keepdims=True), 1e-12)
+        cosines = np.einsum('ij,ij->i', trained, inferred)
+
+        # rank of the own trained vector among all trained vectors of the model
+        all_trained = np.asarray(model.docvecs.vectors_docs, dtype=np.float32)
+        all_trained = all_trained / np.maximum(np.linalg.norm(all_trained, axis=1, keepdims=True), 1e-12)
+        own_rows = np.array([model.docvecs.doctags[doctag].offset for doctag in doctags])
+        sims = inferred @ all_trained.T
+        ranks = (sims > sims[np.arange(len(doctags)), own_rows][:, None]).sum(axis=1)
+
+        return {"doctags": len(doctags),
+                "mean_cosine": float(cosines.mean()),
+                "min_cosine": float(cosines.min()),
+                "self_retrieval_at_1": float((ranks < 1).mean()),
+                "self_retrieval_at_10": float((ranks < 10).mean()),
+                "documents_per_second": len(doc_ids) / duration,
+                "vectors_per_second": len(inferred_dict) / duration}
+
     @classmethod
     def flair_base(cls, documents: Union[List[str], FlairFacetIterator, FlairDocumentIterator],
                    word_embedding_base: str = None, document_embedding: str = None, chunk_len: int = None,
-                   sentence_based: bool = None, pretuned: bool = False):
+                   sentence_based: bool = None, pretuned: bool = False, chunk_aggregation: str = "mean"):
         """
 
+        :param chunk_aggregation: strategy of ChunkRegistry.aggregate for chunk and sentence vectors
         :param pretuned:
         :param sentence_based:
         :param chunk_len: length of chunks
@@ -687,16 +1075,16 @@ class Vectorizer:
         print("time:", end-start)
 
         if chunk_len:
-            docs_dict.update(cls.avg_sim_prefix_doc_ids(docs_dict))
+            docs_dict.update(cls.aggregate_chunks(documents, docs_dict, strategy=chunk_aggregation))
         if sentence_based:
-            docs_dict = cls.avg_sim_prefix_doc_ids(docs_dict)
+            docs_dict = cls.aggregate_chunks(documents, docs_dict, strategy=chunk_aggregation)
 
         return docs_dict
 
     @classmethod
     def avg_wv2doc(cls, corpus: Corpus, save_path: str = "models/", return_vecs: bool = True,
                    without_training: bool = False, restrict_to: int = None, dimension: int = None,
-                   pretrained: bool = False):
+                   pretrained: bool = False, weighting: str = None):
         # Preprocesser.preprocess(return_in_sentence_format=True)
         # print('sents', preprocessed_sentences)
         # print(preprocessed_documents)
@@ -719,7 +1107,8 @@ class Vectorizer:
                                                          restrict_to,
                                                          dimension,
                                                          language=corpus.language,
-                                                         pretrained=pretrained)
+                                                         pretrained=pretrained,
+                                                         weighting=weighting)
 
         return Vectorization.store_vecs_and_reload(save_path=save_path, docs_dict=docs_dict, words_dict=words_dict,
                                                    return_vecs=return_vecs)
@@ -731,7 +1120,8 @@ class Vectorizer:
                 sentence_nr: int = None,
                 pretrained: bool = False,
                 window: int = None,
-                dbow: bool = False):
+                dbow: bool = False,
+                chunk_aggregation: str = "mean"):
         # documents = [TaggedDocument(doc, [i])
         #              for i, doc in enumerate(Preprocesser.tokenize(corpus.get_texts_and_doc_ids()))]
         # documents = [TaggedDocument(Preprocesser.tokenize(document.text), [doc_id])
@@ -746,7 +1136,12 @@ class Vectorizer:
                                                         dimension=dimension, sentence_based=sentence_based,
                                                         language=corpus.language,
                                                         pretrained=pretrained,
-                                                        window=window, dbow=dbow)
+                                                        window=window, dbow=dbow,
+                                                        chunk_aggregation=chunk_aggregation)
+        if not sentence_based:
+            # only the aggregated vectors of sentence chunks are stored, they can not be aggregated again
+            cls.store_chunk_registry(documents, save_path)
+            cls.save_doc2vec_model(model, save_path, {"iterator": "document", "chunk_len": chunk_len})
 
         return Vectorization.store_vecs_and_reload(save_path=save_path, docs_dict=docs_dict, words_dict=words_dict,
                                                    return_vecs=return_vecs)
@@ -772,79 +1167,26 @@ class Vectorizer:
 
 
     @classmethod
-    def longformer_untuned(cls, corpus: Corpus, save_path: str = "models/", return_vecs: bool = True):
-        _, doc_ids = corpus.get_texts_and_doc_ids()
-
-        model_name = "allenai/longformer-base-4096"  # "bert-base-uncased"
-        model = TFAutoModel.from_pretrained(model_name)
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        documents = corpus.get_flat_documents()
-
-        tokenized_docs = tokenizer(
-            documents,
-            padding=True,
-            truncation=True,
-            return_tensors="tf"
-        )
-
-        predicted_embeddings = model(tokenized_docs)
-        # print(tf_outputs)
-        docs_dict = {}
-        for doc_id, out in zip(doc_ids, predicted_embeddings[1]):
-            docs_dict[doc_id] = out.numpy()
+    def longformer_untuned(cls, corpus: Corpus, save_path: str = "models/", return_vecs: bool = True,
+                           window_len: int = 512, overlap: int = 64, batch_size: int = 8, quantize: bool = False,
+                           threads: int = None):
+        encoder = TransformerDocumentEncoder("allenai/longformer-base-4096", window_len=window_len, overlap=overlap,
+                                             batch_size=batch_size, quantize=quantize, threads=threads)
+        docs_dict = encoder.encode(corpus)
+        logging.info(f'longformer_untuned: {encoder.statistics}')
 
         return Vectorization.store_vecs_and_reload(save_path=save_path, docs_dict=docs_dict, words_dict=None,
                                                    return_vecs=return_vecs)
 
     @classmethod
-    def longformer_tuned(cls, corpus: Corpus, save_path: str = "models/", return_vecs: bool = True):
-        _, doc_ids = corpus.get_texts_and_doc_ids()
-
-        model_name = "allenai/longformer-base-4096"  # "bert-base-uncased"
-        model = AutoModel.from_pretrained(model_name)
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        documents = corpus.get_flat_documents()
-        print(documents)
-        tokenized_docs = tokenizer(
-            documents,
-            padding=True,
-            truncation=True,
-            return_tensors="pt"
-        )
-
-        # model = LongformerModel.from_pretrained('allenai/longformer-base-4096', return_dict=True)
-        # tokenizer = LongformerTokenizer.from_pretrained('allenai/longformer-base-4096')
-        # tokenized = tokenizer(tokenized_docs, padding=True, truncation=True, return_tensors="pt")
-        device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
-        model.to(device)
-        model.train()
-
-        # train_dataset = TokenizedDataset(tokenized)
-        # train_loader = DataLoader(train_dataset, batch_size=2, shuffle=True)
-        optim = AdamW(model.parameters(), lr=5e-5)
-        tokenized_batch = tokenized_docs
-        nr_epochs = 2
-        epoch_bar = tqdm(range(nr_epochs), desc=f'Epoch {0} with loss UNKKOWN')
-        outputs = None
-        for epoch in epoch_bar:
-            # for tokenized_batch in train_loader:
-            optim.zero_grad()
-            tokenized_b = tokenized_batch.to(device)
-            # input_ids = tokenized['input_ids'].to(device)
-            # attention_mask = tokenized['attention_mask'].to(device)
-            # labels = tokenized['input_ids'].to(device)
-            # outputs = model(input_ids, labels=input_ids, attention_mask=attention_mask)
-            # loss = outputs.pooler_output
-            outputs = model(**tokenized_b)
-            loss = outputs[0]
-            epoch_bar.set_description(desc=f'Epoch {epoch} with loss {loss.sum():.2f}')
-            epoch_bar.update()
-            loss.sum().backward()
-            optim.step()
-
-        docs_dict = {}
-        for doc_id, out in zip(doc_ids, outputs[1]):
-            docs_dict[doc_id] = out.detach().numpy()
+    def longformer_tuned(cls, corpus: Corpus, save_path: str = "models/", return_vecs: bool = True,
+                         window_len: int = 512, overlap: int = 64, batch_size: int = 8, quantize: bool = False,
+                         threads: int = None, epochs: int = 2):
+        encoder = TransformerDocumentEncoder("allenai/longformer-base-4096", window_len=window_len, overlap=overlap,
+                                             batch_size=batch_size, quantize=quantize, threads=threads)
+        encoder.tune(corpus, epochs=epochs)
+        docs_dict = encoder.encode(corpus)
+        logging.info(f'longformer_tuned: {encoder.statistics}')
 
         return Vectorization.store_vecs_and_reload(save_path=save_path, docs_dict=docs_dict, words_dict=None,
                                                    return_vecs=return_vecs)
@@ -852,9 +1194,11 @@ class Vectorizer:
     @classmethod
     def flair(cls, corpus: Corpus, word_embedding_base: Union[str, None], document_embedding: str,
               save_path: str = "models/", return_vecs: bool = True, chunk_len: int = None,
-              sentence_based: bool = None, sentence_nr: int = None, pretuned: bool = False):
+              sentence_based: bool = None, sentence_nr: int = None, pretuned: bool = False,
+              chunk_aggregation: str = "mean"):
         """
 
+        :param chunk_aggregation: strategy of ChunkRegistry.aggregate for chunk and sentence vectors
         :param pretuned:
         :param sentence_nr:
         :param sentence_based:
@@ -887,7 +1231,11 @@ class Vectorizer:
             documents = FlairDocumentIterator(corpus, chunk_len=chunk_len)
         docs_dict = cls.flair_base(documents, word_embedding_base=word_embedding_base,
                                    document_embedding=document_embedding, chunk_len=chunk_len,
-                                   sentence_based=sentence_based, pretuned=pretuned)
+                                   sentence_based=sentence_based, pretuned=pretuned,
+                                   chunk_aggregation=chunk_aggregation)
+        if not sentence_based:
+            # only the aggregated vectors of sentence chunks are stored, they can not be aggregated again
+            cls.store_chunk_registry(documents, save_path)
 
         return Vectorization.store_vecs_and_reload(save_path=save_path, docs_dict=docs_dict, words_dict=None,
                                                    return_vecs=return_vecs)
@@ -903,7 +1251,8 @@ class Vectorizer:
                         pretrained: bool = False,
                         use_dictionary_lookup: str = None,
                         doc_window: int = None,
-                        dbow: bool = False
+                        dbow: bool = False,
+                        chunk_aggregation: str = "mean"
                         ):
 
         lemma = False
@@ -928,7 +1277,8 @@ class Vectorizer:
         documents = CorpusTaggedFacetIterator(corpus, lemma=lemma, lower=lower, disable_aspects=disable_aspects,
                                               topic_dict=topic_dict, summary_dict=summary_dict, chunk_len=chunk_len,
                                               facets_of_chunks=facets_of_chunks, window=window_size,
-                                              use_dictionary_lookup=use_dictionary_lookup, basic_mode=True)
+                                              use_dictionary_lookup=use_dictionary_lookup, basic_mode=True,
+                                              workers=cls.workers)
         # print('Start training')
         logging.info("Start training")
 
@@ -936,8 +1286,15 @@ class Vectorizer:
         #     print(document)
         model, words_dict, docs_dict = cls.doc2vec_base(documents, without_training, chunk_len=chunk_len,
                                                         dimension=dimension, language=corpus.language,
-                                                        pretrained=pretrained, window=doc_window, dbow=dbow)
-
+                                                        pretrained=pretrained, window=doc_window, dbow=dbow,
+                                                        chunk_aggregation=chunk_aggregation)
+
+        cls.store_chunk_registry(documents, save_path)
+        cls.save_doc2vec_model(model, save_path, {"iterator": "facet", "lemma": lemma, "lower": lower,
+                                                  "disable_aspects": disable_aspects, "chunk_len": chunk_len,
+                                                  "facets_of_chunks": facets_of_chunks, "window": window_size,
+                                                  "use_dictionary_lookup": use_dictionary_lookup,
+                                                  "basic_mode": True})
         aspect_path = os.path.basename(save_path)
         write_doc_based_aspect_frequency_analyzis(documents.doc_aspects, save_name=aspect_path)
         write_doc_based_aspect_frequency_analyzis(documents.detailed_aspects, save_name=f'{aspect_path}_detailed')
@@ -974,15 +1331,7 @@ class Vectorizer:
 
     @classmethod
     def topic_vecs(cls, corpus: Corpus, save_path: str = "models/", return_vecs: bool = True):
-        _, _, topic_model, lda_corpus, doc_ids = TopicModeller.train_lda_mem_eff(corpus)
-        docs_dict = {}
-        words_dict = None
-        # print(len(lda_corpus))
-        # print(doc_ids)
-        for i, doc_id in enumerate(doc_ids):
-            doc = lda_corpus[i]
-            docs_dict[doc_id] = np.array([score for (topic, score) in topic_model[doc][0]])
-
+        docs_dict = TopicModeller.topic_matrix(corpus).topic_vectors()
         return Vectorization.store_vecs_and_reload(save_path=save_path, docs_dict=docs_dict, words_dict=None,
                                                    return_vecs=return_vecs)
 
@@ -998,7 +1347,8 @@ class Vectorizer:
                      pretuned: bool = False,
                      use_dictionary_lookup: str = None,
                      dbow: bool = False,
-                     basic_mode=True):
+                     basic_mode=True,
+                     chunk_aggregation: str = "mean"):
         lemma = False
         lower = False
 
@@ -1021,15 +1371,28 @@ class Vectorizer:
             documents = CorpusTaggedFacetIterator(corpus, lemma=lemma, lower=lower, disable_aspects=disable_aspects,
                                                   topic_dict=topic_dict, summary_dict=summary_dict, chunk_len=chunk_len,
                                                   window=window_size,
-                                                  use_dictionary_lookup=use_dictionary_lookup, basic_mode=basic_mode)
+                                                  use_dictionary_lookup=use_dictionary_lookup, basic_mode=basic_mode,
+                                                  workers=cls.workers)
             model, words_dict, docs_dict = cls.doc2vec_base(documents, without_training, chunk_len=chunk_len,
                                                             dimension=dimension, language=corpus.language,
-                                                            pretrained=pretrained, dbow=dbow)
+                                                            pretrained=pretrained, dbow=dbow,
+                                                            chunk_aggregation=chunk_aggregation)
+            cls.save_doc2vec_model(model, save_path, {"iterator": "facet", "lemma": lemma, "lower": lower,
+                                                      "disable_aspects": disable_aspects, "chunk_len": chunk_len,
+                                                      "facets_of_chunks": True, "window": window_size,
+                                                      "use_dictionary_lookup": use_dictionary_lookup,
+                                                      "basic_mode": basic_mode,
+                                                      "topic_model": TopicModeller.lda_model_path(corpus)
+                                                      if topic_dict is not None else None,
+                                                      "summary_store": os.path.join(corpus.root_corpus_path,
+                                                                                    Summarizer.store_dir)
+                                                      if summary_dict is not None else None})
         elif algorithm.lower() == "avg_w2v" or algorithm.lower() == "w2v" or algorithm.lower() == "word2vec":
             preprocessed_sentences = CorpusSentenceIterator(corpus)
             documents = CorpusTaggedFacetIterator(corpus, lemma=lemma, lower=lower, disable_aspects=disable_aspects,
                                                   topic_dict=topic_dict, summary_dict=summary_dict, window=window_size,
-                                                  use_dictionary_lookup=use_dictionary_lookup, basic_mode=basic_mode)
+                                                  use_dictionary_lookup=use_dictionary_lookup, basic_mode=basic_mode,
+                                                  workers=cls.workers)
             aspect_doc_ids = [d.tags[0] for d in documents]
             model, words_dict, docs_dict = cls.word2vec_base(preprocessed_sentences, documents,
                                                              aspect_doc_ids, without_training,
@@ -1041,13 +1404,16 @@ class Vectorizer:
             documents = FlairFacetIterator(corpus, lemma=lemma, lower=lower, disable_aspects=disable_aspects,
                                            topic_dict=topic_dict, summary_dict=summary_dict, chunk_len=chunk_len,
                                            facets_of_chunks=facets_of_chunks, window=window_size,
-                                           use_dictionary_lookup=use_dictionary_lookup, basic_mode=basic_mode)
+                                           use_dictionary_lookup=use_dictionary_lookup, basic_mode=basic_mode,
+                                           workers=cls.workers)
             words_dict = None
             docs_dict = cls.flair_base(documents, word_embedding_base=None,
-                                       document_embedding="bert", chunk_len=chunk_len, pretuned=pretuned)
+                                       document_embedding="bert", chunk_len=chunk_len, pretuned=pretuned,
+                                       chunk_aggregation=chunk_aggregation)
         else:
             raise UserWarning(f"Not supported vectorization algorithm '{algorithm}'!")
 
+        cls.store_chunk_registry(documents, save_path)
         aspect_path = os.path.basename(save_path)
         write_doc_based_aspect_frequency_analyzis(documents.doc_aspects, save_name=aspect_path)
         write_doc_based_aspect_frequency_analyzis(documents.detailed_aspects, save_name=f'{aspect_path}_detailed')
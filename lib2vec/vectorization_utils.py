@@ -1,8 +1,9 @@
 import os
 from collections import defaultdict
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Set, Tuple
 
 import numpy as np
+import pandas as pd
 from gensim import utils
 from gensim.models import KeyedVectors
 from gensim.models.doc2vec import Doc2Vec
@@ -11,7 +12,7 @@ from sklearn.decomposition import PCA
 
 from extensions.auto_encoding import SimpleAutoEncoder
 from lib2vec.corpus_structure import Corpus, ConfigLoader, DataHandler
-from lib2vec.doc2vec_structures import DocumentKeyedVectors
+from lib2vec.doc2vec_structures import DocumentKeyedVectors, CompressedDocumentVectors
 
 config = ConfigLoader.get_config()
 
@@ -193,36 +194,47 @@ class Vectorization:
                                                          write_first_line)
 
     @staticmethod
-    def my_load_doc2vec_format(fname: str, binary: bool = False, combination: str = None):
+    def my_load_doc2vec_format(fname: str, binary: bool = False, combination: str = None, compression: str = None):
         summation_method = None
         if "_o_" in fname:
             focus_facette = fname.split("_o_")[1].replace('.model', '')
             fname = fname.replace(f'_o_{focus_facette}', '')
             summation_method = focus_facette
+        # file the vectors are read from, a compression is stored next to it and invalidated when it changes
+        vec_path = fname
 
         try:
             vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=fname, binary=binary))
             if combination == "sum":
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}', binary=binary))
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
             elif combination == "concat":
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}_con', binary=binary))
+                vec_path = f'{fname}_con'
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
             elif combination == "pca":
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}_pca', binary=binary))
+                vec_path = f'{fname}_pca'
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
             elif combination == "tsne":
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}_tsne', binary=binary))
+                vec_path = f'{fname}_tsne'
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
             elif combination == "umap":
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}_umap', binary=binary))
+                vec_path = f'{fname}_umap'
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
             elif combination == "avg":
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}_avg', binary=binary))
+                vec_path = f'{fname}_avg'
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
             elif combination == "auto_encoder":
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}_auto', binary=binary))
+                vec_path = f'{fname}_auto'
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
             else:
                 pass
         except FileNotFoundError:
             if "_sum" in fname:
                 combination = "sum"
                 fname = fname.replace("_sum", "")
-                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=f'{fname}', binary=binary))
+                vec_path = fname
+                vecs = DocumentKeyedVectors(KeyedVectors.load_word2vec_format(fname=vec_path, binary=binary))
+                if compression:
+                    Vectorization.compress_docvecs(vecs, vec_path, compression)
                 return vecs, summation_method
             elif "_concat" in fname:
                 combination = "con"
@@ -251,11 +263,43 @@ class Vectorization:
                          for doctag in vecs.docvecs.doctags if not str(doctag)[-1].isdigit()}
             # print(doc_dict)
             concat_vecs = Vectorization.combine_vectors(save_path=fname, document_dictionary=docs_dict, dim_size=None)
-            vecs = Vectorization.store_vecs_and_reload(save_path=f'{fname}_{combination}', docs_dict=concat_vecs,
+            vec_path = f'{fname}_{combination}'
+            vecs = Vectorization.store_vecs_and_reload(save_path=vec_path, docs_dict=concat_vecs,
                                                        words_dict=None,
                                                        return_vecs=True)
+        if compression:
+            Vectorization.compress_docvecs(vecs, vec_path, compression)
         return vecs, summation_method
 
+    @staticmethod
+    def compress_docvecs(vecs: DocumentKeyedVectors, fname: str, compression: str) -> CompressedDocumentVectors:
+        # int8 or product quantised document vectors, trained once per vector file and stored next to it
+        if not os.path.isfile(fname):
+            # without a vector file there is nothing to validate a stored compression against
+            compressed_docvecs = CompressedDocumentVectors.from_docvecs(vecs.docvecs, compression)
+            vecs.compressed_docvecs = compressed_docvecs
+            return compressed_docvecs
+        compressed_path = f'{fname}_{compression}.npz'
+        source_path = fname
+        compressed_docvecs = CompressedDocumentVectors.load(compressed_path, source_path)
+        if compressed_docvecs is None or set(compressed_docvecs.doctags) != set(vecs.docvecs.doctags.keys()):
+            compressed_docvecs = CompressedDocumentVectors.from_docvecs(vecs.docvecs, compression)
+            compressed_docvecs.save(compressed_path, source_path)
+        else:
+            compressed_docvecs.exact_vectors = CompressedDocumentVectors.docvecs_matrix(vecs.docvecs,
+                                                                                        compressed_docvecs.doctags)
+        vecs.compressed_docvecs = compressed_docvecs
+        return compressed_docvecs
+
+    @staticmethod
+    def docvecs_most_similar(model: Union[Doc2Vec, DocumentKeyedVectors], positive: List[np.ndarray],
+                             negative: List[np.ndarray], topn: int):
+        # asymmetric search on the compressed vectors if the model was loaded with a compression
+        compressed_docvecs = getattr(model, 'compressed_docvecs', None)
+        if compressed_docvecs is not None:
+            return compressed_docvecs.most_similar(positive, negative, topn=topn, rerank=compressed_docvecs.rerank)
+        return model.docvecs.most_similar(positive=positive, negative=negative, topn=topn)
+
     # @staticmethod
     # def show_results(model: Union[Doc2Vec, DocumentKeyedVectors], corpus: Corpus):
     #
@@ -327,7 +371,7 @@ class Vectorization:
             feature = feature_to_use
         else:
             feature = extract_feature(positive_tags)
-        results = model.docvecs.most_similar(positive=positive_list, negative=negative_list, topn=high_topn)
+        results = Vectorization.docvecs_most_similar(model, positive_list, negative_list, topn=high_topn)
 
         if feature == 'NF':
             results = [result for result in results if result[0][-1].isdigit()]
@@ -383,8 +427,8 @@ class Vectorization:
         # print(model.docvecs.doctags)
         # print(positive_list)
 
-        basic_results = model.docvecs.most_similar(positive=positive_list, negative=negative_list,
-                                                   topn=len(model.docvecs.doctags))
+        basic_results = Vectorization.docvecs_most_similar(model, positive_list, negative_list,
+                                                           topn=len(model.docvecs.doctags))
 
         alpha_ends = set([str(doc_id)[-1].isalpha() for doc_id, sim in basic_results])
         if not any(alpha_ends):
@@ -487,6 +531,16 @@ class Vectorization:
     #         index, sim = result
     #         print(index, corpus.id2desc(index), sim)
 
+    @staticmethod
+    def get_doctag_index(model: Union[Doc2Vec, DocumentKeyedVectors], corpus: Corpus) -> Dict[str, List[str]]:
+        # built once per loaded model and doctag parser, maps corpus doc ids to all their (facet / chunk) doctags
+        doctag_parser = corpus.get_doctag_parser()
+        cached_index = getattr(model, 'doctag_index', None)
+        if cached_index is None or cached_index[0] is not doctag_parser:
+            cached_index = (doctag_parser, doctag_parser.group_by_document(model.docvecs.doctags))
+            model.doctag_index = cached_index
+        return cached_index[1]
+
     @staticmethod
     def get_facet_sims(model: Union[Doc2Vec, DocumentKeyedVectors],
                        corpus: Corpus,
@@ -502,14 +556,9 @@ class Vectorization:
                     facet_dict['sum'] = doc_id
             return facet_dict
 
-        a_facet_ids = []
-        b_facet_ids = []
-        for doctag in model.docvecs.doctags:
-            if str(doctag).startswith(id_a):
-                a_facet_ids.append(doctag)
-
-            if str(doctag).startswith(id_b):
-                b_facet_ids.append(doctag)
+        doctag_index = Vectorization.get_doctag_index(model, corpus)
+        a_facet_ids = doctag_index.get(id_a, [])
+        b_facet_ids = doctag_index.get(id_b, [])
 
         a_facets = build_facet_dict(a_facet_ids)
         b_facets = build_facet_dict(b_facet_ids)
@@ -555,6 +604,45 @@ class Vectorization:
 
         return model_vectors.docvecs.similarity(doctag_a, doctag_b)
 
+    @staticmethod
+    def get_doc_matrix(model: Union[Doc2Vec, DocumentKeyedVectors]) -> Tuple[Dict[str, int], np.ndarray]:
+        # built once per loaded model, l2 normalised float32 rows of model.docvecs.vectors_docs
+        doc_matrix = getattr(model, 'doc_matrix', None)
+        if doc_matrix is None:
+            vectors = np.asarray(model.docvecs.vectors_docs, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            doc_matrix = ({doctag: doctag_info.offset for doctag, doctag_info in model.docvecs.doctags.items()},
+                          vectors / norms)
+            model.doc_matrix = doc_matrix
+        return doc_matrix
+
+    @staticmethod
+    def facet_sim_batch(model_vectors: Union[Doc2Vec, DocumentKeyedVectors], doc_ids_a: List[str],
+                        doc_ids_b: List[str], facet_names: List[str]) -> np.ndarray:
+        # facet_sim for many pairs at once, with the same fallback to the document vectors per pair
+        doctag_rows, doc_matrix = Vectorization.get_doc_matrix(model_vectors)
+        # rows are looked up once per distinct document and facet, the pairs only index into that table
+        doc_index, doc_ids = pd.factorize(np.concatenate((np.asarray(doc_ids_a, dtype=object),
+                                                          np.asarray(doc_ids_b, dtype=object))))
+        facet_index, facets = pd.factorize(np.asarray(facet_names, dtype=object))
+        facet_table = np.full((len(doc_ids), len(facets)), -1, dtype=np.int64)
+        for i, doc_id in enumerate(doc_ids):
+            for j, facet_name in enumerate(facets):
+                facet_table[i, j] = doctag_rows.get(f'{doc_id}_{facet_name}' if facet_name != "" else doc_id, -1)
+        doc_table = np.array([doctag_rows.get(doc_id, -1) for doc_id in doc_ids], dtype=np.int64)
+
+        index_a, index_b = doc_index[:len(doc_ids_a)], doc_index[len(doc_ids_a):]
+        facet_rows_a, doc_rows_a = facet_table[index_a, facet_index], doc_table[index_a]
+        facet_rows_b, doc_rows_b = facet_table[index_b, facet_index], doc_table[index_b]
+        fallback = (facet_rows_a < 0) | (facet_rows_b < 0)
+        rows_a = np.where(fallback, doc_rows_a, facet_rows_a)
+        rows_b = np.where(fallback, doc_rows_b, facet_rows_b)
+        if (rows_a < 0).any() or (rows_b < 0).any():
+            missing = doc_ids[np.unique(np.concatenate((index_a[rows_a < 0], index_b[rows_b < 0])))]
+            raise UserWarning(f"No document vectors for {list(missing)}!")
+        return np.einsum('ij,ij->i', doc_matrix[rows_a], doc_matrix[rows_b])
+
     @staticmethod
     def get_list(input_list: List[str], input_model: Union[Doc2Vec, DocumentKeyedVectors],
                  feature_to_use: Union[str, None]):
@@ -608,8 +696,8 @@ class Vectorization:
             results = Vectorization.get_ordered_results_of_same_type(model, positives, positive_list, negative_list,
                                                                      feature_to_use, series)
         else:
-            results = model.docvecs.most_similar(positive=positive_list, negative=negative_list,
-                                                 topn=len(model.docvecs.doctags))
+            results = Vectorization.docvecs_most_similar(model, positive_list, negative_list,
+                                                         topn=len(model.docvecs.doctags))
         results = [result for result in results if corpus.vector_doc_id_base_in_corpus(result[0])]
 
         results = results[:topn]
@@ -638,6 +726,54 @@ class Vectorization:
                 print(word, sim)
         return results
 
+    @staticmethod
+    def get_word_matrix(model: Union[Doc2Vec, DocumentKeyedVectors]) -> Tuple[List[str], np.ndarray]:
+        # built once per loaded model, l2 normalised float32 rows in the order of model.wv.index2word
+        word_matrix = getattr(model, 'word_matrix', None)
+        if word_matrix is None:
+            vectors = np.asarray(model.wv.vectors, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            word_matrix = (list(model.wv.index2word), vectors / norms)
+            model.word_matrix = word_matrix
+        return word_matrix
+
+    @staticmethod
+    def most_similar_words_batch(model: Union[Doc2Vec, DocumentKeyedVectors],
+                                 positives: List[str],
+                                 topn: int = 10,
+                                 feature_to_use: str = None,
+                                 candidate_words: Set[str] = None,
+                                 block_size: int = 1024) -> Dict[str, List[Tuple[str, float]]]:
+        # same ranking as most_similar_words for one positive each, but one matrix product per block of queries
+        if len(positives) == 0:
+            return {}
+        words, word_matrix = Vectorization.get_word_matrix(model)
+        if candidate_words is not None:
+            candidate_rows = np.array([i for i, word in enumerate(words) if word in candidate_words], dtype=np.int64)
+        else:
+            candidate_rows = np.arange(len(words))
+        candidate_matrix = word_matrix[candidate_rows]
+
+        query_matrix = np.array([Vectorization.get_list(doc_id, model, feature_to_use=feature_to_use)[0]
+                                 for doc_id in positives], dtype=np.float32)
+        norms = np.linalg.norm(query_matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        query_matrix = query_matrix / norms
+
+        k = min(topn, len(candidate_rows))
+        results = {}
+        for start in range(0, len(positives), block_size):
+            sims = query_matrix[start:start + block_size] @ candidate_matrix.T
+            if k < sims.shape[1]:
+                top_columns = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            else:
+                top_columns = np.tile(np.arange(sims.shape[1]), (len(sims), 1))
+            for row, doc_id in enumerate(positives[start:start + block_size]):
+                columns = top_columns[row][np.argsort(-sims[row, top_columns[row]])]
+                results[doc_id] = [(words[candidate_rows[column]], float(sims[row, column])) for column in columns]
+        return results
+
     @staticmethod
     def store_vecs_and_reload(save_path: str,
                               docs_dict: Dict,
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# the tests import the packages and scripts of the repository without an installation
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, os.path.join(repo_dir, 'heideltime_scripts'))
+
+
+@pytest.fixture(autouse=True)
+def file_hash_index(tmp_path, monkeypatch):
+    # file hashes of test files are remembered in the temporary directory of each test, not in the model storage
+    from lib2vec.corpus_structure import DataHandler
+    monkeypatch.setattr(DataHandler, "known_file_hashes", {})
+    monkeypatch.setattr(DataHandler, "file_hash_index_path",
+                        staticmethod(lambda: str(tmp_path / "file_hashes.json")))
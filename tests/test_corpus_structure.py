@@ -0,0 +1,88 @@
+import json
+import os
+
+from extensions.wordnet_utils import PhraseMatcher
+from lib2vec.corpus_structure import Corpus, Document, Language, Sentence, Token, Vocabulary, clean_token
+
+
+def token(text: str, lemma: str) -> Token:
+    return Token(text=text, lemma=lemma, pos="NOUN", ne="LOC", punctuation=False, alpha=True, stop=False)
+
+
+def document(doc_id: str, words) -> Document:
+    sentences = [Sentence([token(text, lemma) for text, lemma in words]), Sentence([token("del", "del")])]
+    return Document(doc_id=doc_id, text="", title=doc_id, language=Language.EN, authors="someone", date="1900",
+                    genres="novel", sentences=sentences)
+
+
+def stored_corpus(corpus_dir: str) -> Corpus:
+    documents = [document("v_0", [("Ships", "ship"), ("sail", "sail")]),
+                 document("v_1", [("Kings", "king"), ("ships", "ship")])]
+    Corpus(source=documents, name="vocab", language=Language.EN).save_corpus_adv(corpus_dir)
+    return Corpus.load_corpus_from_dir_format(corpus_dir)
+
+
+def test_token_ids_use_stored_vocabulary(tmp_path):
+    corpus_dir = str(tmp_path / "corpus")
+    corpus = stored_corpus(corpus_dir)
+    vocabulary = corpus.get_vocabulary()
+    size = len(vocabulary)
+
+    for doc_id, document_obj in corpus.documents.items():
+        for lemma in [False, True]:
+            for lower in [False, True]:
+                ids = document_obj.get_token_ids(vocabulary, lemma=lemma, lower=lower, from_disk=True)
+                assert vocabulary.get_forms(ids) == document_obj.get_flat_tokens_from_disk(lemma=lemma,
+                                                                                           lower=lower)
+    # pos and ne tags of the disk format are not interned
+    assert len(vocabulary) == size
+    assert vocabulary.get_id("NOUN") == -1 and vocabulary.get_id("LOC") == -1
+
+
+def test_stale_vocabulary_is_rebuilt(tmp_path):
+    corpus_dir = str(tmp_path / "corpus")
+    corpus = stored_corpus(corpus_dir)
+    assert corpus.get_vocabulary().get_id("kings") >= 0
+
+    document_obj = corpus.documents["v_1"]
+    with open(document_obj.file_path, 'a', encoding='utf-8') as doc_file:
+        doc_file.write(f'{token("Queens", "queen").get_save_file_representation()}\n<SENT>\n')
+    reloaded = Corpus.load_corpus_from_dir_format(corpus_dir)
+    vocabulary = reloaded.get_vocabulary()
+    assert vocabulary.get_id("Queens") >= 0
+    with open(os.path.join(corpus_dir, Vocabulary.file_name), 'r', encoding='utf-8') as vocabulary_file:
+        assert "Queens" in json.load(vocabulary_file)["forms"]
+
+
+def test_corpus_stream_round_trip(tmp_path):
+    documents = [document("s_0", [("Ships", "ship"), ("Überfahrt", "überfahrt")]),
+                 document("s_1", [("Kings", "king"), ("sail", "sail")]),
+                 document("s_2", [("Öl", "öl"), ("sea", "sea")])]
+    corpus = Corpus(source=documents, name="stream", language=Language.EN)
+    path = str(tmp_path / "stream")
+    corpus.save_corpus(path)
+
+    def token_lines(document_obj: Document):
+        return [[token.get_save_file_representation() for token in sentence.tokens]
+                for sentence in document_obj.sentences]
+
+    streamed = list(Corpus.iter_corpus_stream(f'{path}.jsonl'))
+    assert [document_obj.doc_id for document_obj in streamed] == ["s_0", "s_1", "s_2"]
+    for document_obj, original in zip(streamed, documents):
+        assert document_obj.title == original.title
+        assert token_lines(document_obj) == token_lines(original)
+
+    # the byte offsets of the index hold after documents with multi byte characters
+    selected = list(Corpus.iter_corpus_stream(path, doc_ids=["s_1", "s_2"]))
+    assert [document_obj.doc_id for document_obj in selected] == ["s_1", "s_2"]
+    assert token_lines(selected[1]) == token_lines(documents[2])
+    metadata = list(Corpus.iter_corpus_stream(path, metadata_only=True))
+    assert [document_obj.doc_id for document_obj in metadata] == ["s_0", "s_1", "s_2"]
+
+
+def test_wordnet_phrases_match_cleaned_forms():
+    document_obj = document("w_0", [("At", "at"), ("New", "new"), ("York's", "york's"),
+                                    ("Harbour-Side", "harbour-side")])
+    phrases = PhraseMatcher([tuple(clean_token(word.lower()) for word in "new york's".split())])
+    matches = document_obj.get_wordnet_matches({"harbourside"}, as_id=True, phrase_matcher=phrases)
+    assert matches == [(0, 1), (0, 2), (0, 3)]
@@ -0,0 +1,98 @@
+import json
+import os
+import re
+
+import heideltime_2_annotate_texts as annotate
+
+# texts seen by the stub taggers of this process, workers=1 keeps joblib in process
+parsed_texts = []
+
+
+class StubTagger:
+    # mimics the TimeML document of HeidelTime with a TIMEX3 element around every four digit year
+    def __init__(self, lan: str):
+        self.lan = lan
+
+    def parse(self, text: str) -> str:
+        parsed_texts.append(text)
+        tagged = re.sub(r'\b(\d{4})\b', r'<TIMEX3 tid="t1" type="DATE" value="\1">\1</TIMEX3>', text)
+        return f'<?xml version="1.0"?>\n<!DOCTYPE TimeML SYSTEM "TimeML.dtd">\n<TimeML>\n{tagged}\n</TimeML>\n'
+
+
+def stub_tagger(lan: str):
+    return StubTagger(lan)
+
+
+def failing_tagger(lan: str):
+    raise AssertionError("already processed documents must not be tagged again")
+
+
+def write_text(input_dir, file_name: str, lines):
+    with open(os.path.join(input_dir, file_name), 'w', encoding="utf-8") as text_file:
+        text_file.writelines(lines)
+
+
+def setup_function():
+    parsed_texts.clear()
+    annotate._taggers.clear()
+
+
+def test_character_chunks_respect_max_chars():
+    lines = ['a' * 30 + '\n', 'b' * 30 + '\n', 'c' * 80 + '\n', 'd' * 10 + '\n']
+    chunks = list(annotate.character_chunks(lines, max_chars=64))
+    assert chunks == [lines[0] + lines[1], lines[2], lines[3]]
+    assert ''.join(chunks) == ''.join(lines)
+
+
+def test_annotate_dir_chunks_across_boundary(tmp_path):
+    input_dir = str(tmp_path)
+    lines = [f'In the year {1800 + i} it rained.\n' for i in range(20)]
+    write_text(input_dir, 'book_a_0.txt', lines)
+
+    time_dict = annotate.annotate_dir(input_dir, "english", workers=1, max_chars=100, tagger_factory=stub_tagger)
+
+    assert len(parsed_texts) > 1
+    assert all(len(text) <= 100 for text in parsed_texts)
+    assert ''.join(parsed_texts) == ''.join(lines)
+    # years at both sides of every chunk boundary are found
+    assert sorted(time_dict["book_a"]) == [str(1800 + i) for i in range(20)]
+
+
+def test_compact_time_dict_keeps_doc_ids_and_old_entries(tmp_path):
+    input_dir = str(tmp_path)
+    os.makedirs(os.path.join(input_dir, "out", "time_store"))
+    with open(os.path.join(input_dir, "out", "time_dict.json"), 'w', encoding="utf-8") as json_file:
+        json.dump({"old_book": ["1700"]}, json_file)
+    write_text(input_dir, 'book_a_0.txt', ['Born 1850.\n'])
+    write_text(input_dir, 'book_with_underscores_12.txt', ['Died 1901.\n'])
+
+    time_dict = annotate.annotate_dir(input_dir, "english", workers=1, tagger_factory=stub_tagger)
+
+    assert time_dict == {"old_book": ["1700"], "book_a": ["1850"], "book_with_underscores": ["1901"]}
+    with open(os.path.join(input_dir, "out", "time_dict.json"), encoding="utf-8") as json_file:
+        assert json.load(json_file) == time_dict
+    assert sorted(os.listdir(os.path.join(input_dir, "out", "time_store"))) == ["book_a.json",
+                                                                              "book_with_underscores.json"]
+
+
+def test_annotate_dir_resumes_from_store(tmp_path):
+    input_dir = str(tmp_path)
+    write_text(input_dir, 'book_a_0.txt', ['Born 1850.\n'])
+    write_text(input_dir, 'book_b_0.txt', ['Died 1901.\n'])
+    annotate.annotate_dir(input_dir, "english", workers=1, tagger_factory=stub_tagger)
+
+    # a complete rerun tags nothing
+    annotate._taggers.clear()
+    time_dict = annotate.annotate_dir(input_dir, "english", workers=1, tagger_factory=failing_tagger)
+    assert time_dict == {"book_a": ["1850"], "book_b": ["1901"]}
+
+    # an interrupted run leaves only a temporary file, so that document and new ones are tagged again
+    os.remove(os.path.join(input_dir, "out", "time_store", "book_b.json"))
+    os.remove(os.path.join(input_dir, "out", "time_dict.json"))
+    with open(os.path.join(input_dir, "out", "time_store", "book_b.json.123.tmp"), 'w') as tmp_file:
+        tmp_file.write('["19')
+    write_text(input_dir, 'book_c_0.txt', ['Built 1920.\n'])
+    parsed_texts.clear()
+    time_dict = annotate.annotate_dir(input_dir, "english", workers=1, tagger_factory=stub_tagger)
+    assert sorted(parsed_texts) == ['Built 1920.\n', 'Died 1901.\n']
+    assert time_dict == {"book_a": ["1850"], "book_b": ["1901"], "book_c": ["1920"]}
@@ -0,0 +1,118 @@
+import json
+import os
+
+import pytest
+
+from extensions.text_summarisation import Summarizer
+from extensions.topic_modelling import TopicModeller
+from lib2vec.corpus_structure import Corpus, DataHandler, Document, Language, Sentence, Token
+
+themes = [["ship", "sea", "captain", "storm", "harbour", "sail", "wave", "island"],
+          ["castle", "king", "knight", "sword", "queen", "throne", "battle", "dragon"]]
+
+# documents seen by the stub summarisation of this process, workers=1 keeps joblib in process
+summarized_doc_ids = []
+
+
+def stub_summary(document: Document, top_n: int = 5, as_sent_ids: bool = True, min_sentence_length: int = 10):
+    summarized_doc_ids.append(document.doc_id)
+    return None, [0]
+
+
+def theme_document(doc_id: str, theme: int, offset: int) -> Document:
+    words = themes[theme]
+    sentences = [Sentence([Token(text=word, lemma=word, pos="NOUN", ne="O", punctuation=False, alpha=True,
+                                 stop=False)
+                           for word in (words[(i + offset) % len(words):] + words[:(i + offset) % len(words)])])
+                 for i in range(12)]
+    return Document(doc_id=doc_id, text="", title=doc_id, language=Language.EN, authors="someone", date="1900",
+                    genres="novel", sentences=sentences)
+
+
+def stored_corpus(corpus_dir: str, documents) -> Corpus:
+    Corpus(source=documents, name=os.path.basename(corpus_dir), language=Language.EN).save_corpus_adv(corpus_dir)
+    return Corpus.load_corpus_from_dir_format(corpus_dir)
+
+
+def new_documents_corpus(tmp_path) -> Corpus:
+    # built like in append_inferred_documents, neither corpus_path nor root_corpus_path is set
+    loaded = stored_corpus(str(tmp_path / "new"), [theme_document("gn_0", 0, 3), theme_document("gn_1", 1, 5)])
+    return Corpus(source=loaded.documents, name=loaded.name, language=loaded.language)
+
+
+def setup_function():
+    summarized_doc_ids.clear()
+
+
+def test_topics_of_new_documents_use_stored_model(tmp_path, monkeypatch):
+    monkeypatch.setitem(TopicModeller.lda_parameters, "passes", 5)
+    root = stored_corpus(str(tmp_path / "root"), [theme_document(f"gr_{i}", i % 2, i) for i in range(6)])
+    topic_matrix = TopicModeller.topic_matrix(root)
+    lda_path = TopicModeller.lda_model_path(root)
+    assert os.path.isfile(lda_path)
+
+    new_corpus = new_documents_corpus(tmp_path)
+    inferred = TopicModeller.infer_topic_matrix(new_corpus, lda_path)
+
+    assert inferred.doc_ids == ["gn_0", "gn_1"]
+    assert inferred.words == topic_matrix.words
+    topic_dict = inferred.topic_dict()
+    assert set(topic_dict.keys()) == {"gn_0", "gn_1"}
+    assert all(len(words) > 0 for words in topic_dict.values())
+    # nothing is trained for the new documents
+    assert sorted(os.listdir(os.path.dirname(os.path.dirname(lda_path)))) == sorted(
+        [os.path.basename(TopicModeller.topic_matrix_path(root)), TopicModeller.model_hash(root)])
+
+
+def test_missing_topic_model_is_reported(tmp_path):
+    new_corpus = new_documents_corpus(tmp_path)
+    for lda_path in [None, str(tmp_path / "missing" / "lda.model")]:
+        with pytest.raises(UserWarning):
+            TopicModeller.infer_topic_matrix(new_corpus, lda_path)
+
+
+def test_summaries_of_documents_outside_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(Summarizer, "generate_summary_of_corpus_doc", stub_summary)
+    store_dir = str(tmp_path / "root" / Summarizer.store_dir)
+    new_corpus = new_documents_corpus(tmp_path)
+
+    summary_dict = Summarizer.get_document_summaries(new_corpus, store_dir, workers=1)
+    assert summary_dict == {"gn_0": [0], "gn_1": [0]}
+    assert sorted(summarized_doc_ids) == ["gn_0", "gn_1"]
+    assert len(os.listdir(store_dir)) == 2
+
+    # stored summaries are read again instead of recomputed
+    summarized_doc_ids.clear()
+    assert Summarizer.get_document_summaries(new_corpus, store_dir, workers=1) == summary_dict
+    assert summarized_doc_ids == []
+
+
+def test_root_summaries_reuse_legacy_entries_and_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(Summarizer, "generate_summary_of_corpus_doc", stub_summary)
+    root_dir = str(tmp_path / "root")
+    root = stored_corpus(root_dir, [theme_document(f"gr_{i}", i % 2, i) for i in range(3)])
+    assert root.root_corpus_path == root_dir
+    with open(os.path.join(root_dir, "sent_ids.json"), 'w') as json_file:
+        json.dump({"gr_0": [1, 2], "gr_1": [3]}, json_file)
+    # the store directory of an interrupted first run
+    os.makedirs(os.path.join(root_dir, Summarizer.store_dir))
+
+    summary_dict = Summarizer.get_summary(root, workers=1)
+    assert summary_dict == {"gr_0": [1, 2], "gr_1": [3], "gr_2": [0]}
+    assert summarized_doc_ids == ["gr_2"]
+
+    # a repeated call neither loads the root corpus nor hashes its documents
+    def fail(*args, **kwargs):
+        raise AssertionError("the stored summaries have to be used")
+    with monkeypatch.context() as patched:
+        patched.setattr(Corpus, "fast_load", fail)
+        patched.setattr(DataHandler, "file_hashes", fail)
+        assert Summarizer.get_summary(root, workers=1) == summary_dict
+
+    # a changed document file invalidates the index, only that document is summarised again
+    summarized_doc_ids.clear()
+    changed_document = root.documents["gr_2"]
+    with open(changed_document.file_path, 'a', encoding='utf-8') as doc_file:
+        doc_file.write("\n")
+    assert Summarizer.get_summary(root, workers=1) == summary_dict
+    assert summarized_doc_ids == ["gr_2"]